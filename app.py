@@ -1,12 +1,19 @@
 import streamlit as st
 import uuid
 import os
+import time
+from contextlib import nullcontext
 from utils_proj03 import *
 from dotenv import load_dotenv
 load_dotenv()
 
 st.set_page_config(page_title="Triagem e Análise de Currículos", page_icon="📄", layout="wide")
 
+# Os spans medidos neste rerun (parse, LLM, banco, PDF/DOCX) contam para o painel de desempenho da sessão
+if "metrics_session" not in st.session_state:
+  st.session_state.metrics_session = str(uuid.uuid4())
+set_metrics_session(st.session_state.metrics_session)
+
 #id_model = "llama-3.3-70b-versatile"
 #id_model = "llama-3.3-70b-versatile"
 #id_model = "llama-3.3-70b-versatile"
@@ -17,7 +24,30 @@ id_model = "openai/gpt-oss-120b"
 #id_model="llama-3.1-8b-instant"
 temperature = 0.7
 json_file = 'curriculos.json'
-path_job_csv = "vagas.csv"
+
+# Modo determinístico: temperatura 0 torna seguro reutilizar respostas do cache
+deterministic_mode = st.sidebar.checkbox(
+  "🎯 Modo determinístico (cache de respostas)",
+  value=False,
+  help="Usa temperatura 0 e reaproveita respostas já obtidas para o mesmo currículo, vaga e opções"
+)
+if deterministic_mode:
+  temperature = 0.0
+
+# Modo combinado: triagem e análise detalhada saem da mesma chamada ao LLM
+combined_mode = st.sidebar.toggle(
+  "⚡ Triagem + análise em uma chamada",
+  value=COMBINED_TRIAGE_DEFAULT,
+  help="Gera o registro do candidato e a análise detalhada em uma única requisição. Desligado, a análise detalhada é uma segunda chamada (botão abaixo)"
+)
+
+# Cascata: o modelo rápido faz a triagem e o modelo principal só revisa os casos de fronteira
+cascade_mode = st.sidebar.toggle(
+  "🪜 Cascata de modelos na triagem",
+  value=CASCADE_ENABLED,
+  disabled=combined_mode,
+  help=f"Triagem com {CASCADE_FAST_MODEL}; o modelo principal só é chamado se a nota ficar entre {CASCADE_BAND_LOW:g} e {CASCADE_BAND_HIGH:g} ou se o JSON vier inválido. Não se aplica ao modo combinado"
+)
 
 llm = load_llm(id_model, temperature)
 
@@ -68,89 +98,10 @@ Interesse em IA aplicada à automação operacional e agentes autônomos.
 
 """
 
-schema = """
-{
-  "name": "Nome completo do candidato",
-  "position": "Posição do candidato",
-  "summary": "Resumo objetivo sobre o perfil profissional do candidato",
-  "hard_skills": ["competência 1", "competência 2", "..."],
-  "soft_skills": ["competência 1", "competência 2", "..."],
-  "academic_info": [{
-    "title": "Título do curso",
-    "institution": "Instituição",
-    "year": "Ano"
-  },{...}],
-  "training_courses": [{
-    "title": "Título do curso",
-    "institution": "Instituição"
-  }, "..."],
-  "experiences": [{"position": "Posição", "company": "Empresa", "start_date": "Data de início", "end_date": "Data de fim", "description": "Descrição da experiência"}, {...}],
-  "certifications": ["certificação 1", "certificação 2", "..."],
-  "interview_questions": ["Pelo menos 3 perguntas úteis para entrevista com base no currículo, para esclarecer algum ponto ou explorar melhor"],
-  "strengths": ["Pontos fortes e aspectos que indicam alinhamento com o perfil ou vaga desejada"],
-  "areas_for_development": ["Pontos que indicam possíveis lacunas, fragilidades ou necessidades de desenvolvimento"],
-  "important_considerations": ["Observações específicas que merecem verificação ou cuidado adicional"],
-  "final_recommendations": "Resumo avaliativo final com sugestões de próximos passos (ex: seguir com entrevista, indicar para outra vaga)",
-  "score": 0.0
-}
-"""
-
-fields = [
-    "name",
-    "position",
-    "summary",
-    "hard_skills",
-    "soft_skills",
-    "academic_info",
-    "training_courses",
-    "experiences",
-    "certifications",
-    "interview_questions",
-    "strengths",
-    "areas_for_development",
-    "important_considerations",
-    "final_recommendations",
-    "score"
-]
-
-prompt_score = """
-Com base na vaga específica, calcule a pontuação final (de 0.0 a 10.0).
-O retorno para esse campo deve conter apenas a pontuação final (x.x) sem mais nenhum texto ou anotação.
-Seja justo e rigoroso ao atribuir as notas. A nota 10.0 só deve ser atribuída para candidaturas que superem todas as expectativas da vaga.
-
-Critérios de avaliação:
-1. Experiência (Peso: 35% do total): Análise de posições anteriores, tempo de atuação e similaridade com as responsabilidades da vaga.
-2. Habilidades Técnicas (Peso: 20% do total): Verifique o alinhamento das habilidades técnicas com os requisitos mencionados na vaga.
-3. Soft Skills (Peso: 5% do total): Verifique o alinhamento das soft skills com os requisitos mencionados na vaga.
-4. Educação (Peso: 15% do total): Avalie a relevância da graduação/certificações para o cargo, incluindo instituições e anos de estudo.
-5. Pontos Fortes (Peso: 15% do total): Avalie a relevância dos pontos fortes (ou alinhamentos) para a vaga.
-6. Pontos Fracos (Desconto de até 10%): Avalie a gravidade dos pontos fracos (ou desalinhamentos) para a vaga.
-7. Cursos (Peso: 5% do total): Avalie a relevância dos cursos para a vaga.
-"""
-
-prompt_template = ChatPromptTemplate.from_template("""
-Você é um especialista em Recursos Humanos com vasta experiência em análise de currículos.
-Sua tarefa é analisar o conteúdo a seguir e extrair os dados conforme o formato abaixo, para cada um dos campos.
-Responda apenas com o JSON estruturado e utilize somente essas chaves. Cuide para que os nomes das chaves sejam exatamente esses.
-Não adicione explicações ou anotações fora do JSON.
-Schema desejado:
-{schema}
-
----
-Para o cálculo do campo score:
-{prompt_score}
-
----
-
-Currículo a ser analisado:
-'{cv}'
-
----
-
-Vaga que o candidato está se candidatando:
-'{job}'
-
-""")
+schema = CV_SCHEMA
+fields = CV_FIELDS
+prompt_score = PROMPT_SCORE
+prompt_template = create_triage_prompt_template()
 
 if "uploader_key" not in st.session_state:
   st.session_state.uploader_key = str(uuid.uuid4())
@@ -167,6 +118,9 @@ if "rewritten_cv" not in st.session_state:
 if "original_cv_content" not in st.session_state:
   st.session_state.original_cv_content = None
 
+if "current_candidate_id" not in st.session_state:
+  st.session_state.current_candidate_id = None  # Candidato do último upload (uso de tokens da análise e reformulação)
+
 if "rewritten_cvs" not in st.session_state:
   st.session_state.rewritten_cvs = {}  # Dicionário para armazenar CVs reformulados por nome
 
@@ -187,9 +141,65 @@ if "cv_templates" not in st.session_state:
     "2": None   # cv_base2.txt
   }
 
-# Salva descrição da vaga em um .csv
-save_job_to_csv(job, path_job_csv)
-job_details = load_job(path_job_csv)
+# Registra a vaga padrão uma única vez (id = hash do conteúdo) no catálogo de vagas
+job_registry = get_job_registry(json_file)
+default_job_id = job_registry.register(job)
+
+# ============================================
+# CATÁLOGO DE VAGAS
+# ============================================
+st.sidebar.subheader("📌 Vaga")
+with st.sidebar.expander("➕ Cadastrar nova vaga"):
+  with st.form("form_new_job", clear_on_submit=True):
+    new_job_title = st.text_input("Título")
+    new_job_description = st.text_input("Descrição")
+    new_job_details = st.text_area("Detalhes completos")
+    if st.form_submit_button("Salvar vaga"):
+      if new_job_title and new_job_details:
+        new_job_id = job_registry.register({
+          "title": new_job_title,
+          "description": new_job_description or new_job_title,
+          "details": new_job_details
+        })
+        # A nova vaga vira a selecionada nesta sessão e o padrão das próximas (e da CLI)
+        st.session_state.selected_job_id = new_job_id
+        job_registry.set_active(new_job_id)
+      else:
+        st.warning("Informe ao menos o título e os detalhes da vaga.")
+
+job_catalog = dict(job_registry.list_jobs())
+job_ids = list(job_catalog.keys())
+# A vaga escolhida é da sessão; a vaga ativa do registro só define o valor inicial
+if st.session_state.get("selected_job_id") not in job_ids:
+  active_job_id = job_registry.active_job_id() or default_job_id
+  st.session_state.selected_job_id = active_job_id if active_job_id in job_ids else job_ids[0]
+job_id = st.sidebar.selectbox(
+  "Vaga ativa",
+  job_ids,
+  key="selected_job_id",
+  format_func=lambda x: job_catalog[x],
+  on_change=lambda: job_registry.set_active(st.session_state.selected_job_id)
+)
+job = job_registry.get(job_id)
+job_details = job_registry.job_details(job_id)
+# Tokens de cada chamada ao LLM deste rerun são contabilizados para a vaga ativa
+set_usage_scope(json_file, job_id)
+
+# Resumo de requisitos da vaga: compilado uma única vez e usado nos prompts no lugar do texto completo
+if JOB_DIGEST_ENABLED:
+  with st.sidebar.expander("📋 Requisitos da vaga"):
+    job_digest = job_registry.get_digest(job_id)
+    if job_digest:
+      st.json(job_digest)
+    else:
+      st.caption("Ainda não compilados: serão extraídos na primeira análise de currículo.")
+    if st.button("🔄 Recompilar requisitos" if job_digest else "⚙️ Compilar requisitos", use_container_width=True):
+      with st.spinner("Compilando os requisitos da vaga..."):
+        if ensure_job_digest(llm, json_file, job_id, force=True) is None:
+          st.warning("Não foi possível compilar os requisitos; os prompts usam a descrição completa.")
+        else:
+          st.rerun()
+prompt_job_details = job_prompt_text(json_file, job_id, job_details)
 
 # ============================================
 # CARREGAR TEMPLATES DE CV
@@ -272,6 +282,7 @@ st.session_state.rewrite_options["primary_color"] = st.sidebar.color_picker(
   value=st.session_state.rewrite_options.get("primary_color", "#2563eb"),
   help="Escolha a cor predominante para o cabeçalho e seções do PDF"
 )
+primary_color = st.session_state.rewrite_options["primary_color"]
 
 st.session_state.rewrite_options["idioma"] = st.sidebar.selectbox(
   "🌐 Idioma do CV",
@@ -288,6 +299,15 @@ st.session_state.rewrite_options["idioma"] = st.sidebar.selectbox(
   help="Selecione o idioma em que o currículo será reformulado"
 )
 
+if deterministic_mode:
+  llm_cache = get_llm_cache()
+  if llm_cache is not None:
+    cache_stats = llm_cache.stats()
+    st.sidebar.caption(
+      f"💾 Cache LLM: {cache_stats['entries']} respostas | "
+      f"{cache_stats['hits']} acertos / {cache_stats['misses']} falhas"
+    )
+
 col1, col2 = st.columns(2)
 with col1:
   st.header("Triagem e Análise de Currículos")
@@ -300,15 +320,47 @@ if uploaded_file is not None:
   with open(path, "wb") as f:
     f.write(uploaded_file.read())
   
-  # Extrai o conteúdo do currículo para uso posterior
+  # Extrai o conteúdo do currículo uma única vez (cache por hash do arquivo) e reaproveita na triagem
   st.session_state.original_cv_content = parse_doc(path)
   
-  # Análise inicial (triagem)
-  with st.spinner("Analisando o currículo (triagem inicial)..."):
-    output, res = process_cv(schema, job_details, prompt_template, prompt_score, llm, path)
-    structured_data = parse_res_llm(res, fields)
-    save_json_cv(structured_data, path_json=json_file, key_name="name")
+  if JOB_DIGEST_ENABLED and job_registry.get_digest(job_id) is None:
+    with st.spinner("Compilando os requisitos da vaga (uma única vez)..."):
+      ensure_job_digest(llm, json_file, job_id)
+    prompt_job_details = job_prompt_text(json_file, job_id, job_details)
+
+  # Análise inicial (triagem), ou triagem + análise detalhada no modo combinado
+  spinner_text = "Analisando o currículo (triagem e análise detalhada)..." if combined_mode else "Analisando o currículo (triagem inicial)..."
+  with st.spinner(spinner_text), candidate_usage(path) as cv_usage:
+    started = time.perf_counter()
+    if combined_mode:
+      output, structured_data, analysis = process_cv_with_analysis(llm, prompt_job_details, path, content=st.session_state.original_cv_content)
+      if analysis:
+        st.session_state.cv_analysis = analysis
+        st.session_state.rewritten_cv = None
+    elif cascade_mode:
+      fast_llm = load_llm(CASCADE_FAST_MODEL, temperature)
+      output, res = process_cv_cascade(schema, prompt_job_details, prompt_template, prompt_score, fast_llm, llm, path, content=st.session_state.original_cv_content)
+      structured_data = parse_res_llm(res, fields)
+    else:
+      output, res = process_cv(schema, prompt_job_details, prompt_template, prompt_score, llm, path, content=st.session_state.original_cv_content)
+      structured_data = parse_res_llm(res, fields)
+    elapsed = time.perf_counter() - started
+    if structured_data is None:
+      st.error("❌ A resposta do modelo não trouxe um JSON válido (nome e nota). Tente novamente.")
+      st.stop()
+    candidate_id = save_json_cv(structured_data, path_json=json_file, key_name="name")
+    if candidate_id is None:
+      candidate_id = get_candidate_store(json_file).id_for(structured_data.get("name") or "")
+    st.session_state.current_candidate_id = candidate_id
+    # A triagem foi feita antes do registro existir: associa o consumo ao candidato
+    if cv_usage is not None:
+      cv_usage.attach(candidate_id)
+    # A avaliação da triagem já é a célula (candidato, vaga ativa) da matriz
+    record_triage_match(json_file, job_id, structured_data, key_name="name")
     st.success("Currículo analisado com sucesso!")
+    st.caption(f"⏱️ {'Triagem + análise' if combined_mode else 'Triagem'}: {elapsed:.1f}s{usage_caption(output)}")
+    if "cascade" in output.response_metadata:
+      st.caption(describe_cascade(get_cascade_stats().summary()))
     st.session_state.uploader_key = str(uuid.uuid4())
 
   st.write(show_cv_result(structured_data))
@@ -329,15 +381,18 @@ if uploaded_file is not None:
   col_analyze1, col_analyze2 = st.columns([1, 4])
   with col_analyze1:
     if st.button("🚀 Executar Análise Detalhada", type="primary", use_container_width=True):
-      with st.spinner("Agente Analisador trabalhando..."):
+      current_id = st.session_state.current_candidate_id
+      with st.spinner("Agente Analisador trabalhando..."), (candidate_usage(current_id) if current_id is not None else nullcontext()):
+        started = time.perf_counter()
         analysis = analyze_cv_and_job(
           llm, 
           st.session_state.original_cv_content, 
-          job_details
+          prompt_job_details
         )
         if analysis:
           st.session_state.cv_analysis = analysis
           st.success("Análise concluída!")
+          st.caption(f"⏱️ Análise detalhada: {time.perf_counter() - started:.1f}s")
           # Limpa o currículo reformulado quando nova análise é feita
           st.session_state.rewritten_cv = None
   
@@ -440,15 +495,21 @@ if has_analysis and has_cv_content:
             st.error(f"❌ Template {selected_template} não encontrado. Verifique se o arquivo cv_base{selected_template}.txt existe.")
             rewritten = None
           else:
-            rewritten = rewrite_cv(
-              llm,
-              st.session_state.original_cv_content,
-              st.session_state.cv_analysis,
-              job_details,
-              cv_template=cv_template,
-              rewrite_options=st.session_state.rewrite_options,
-              idioma=st.session_state.rewrite_options.get("idioma", "Português Brasileiro")
-            )
+            # Exibe o currículo enquanto é gerado; o texto final validado vai para o estado da sessão
+            stream_box = st.empty()
+            # O id vem do estado da sessão: o upload (e suas variáveis) não roda de novo neste rerun
+            current_id = st.session_state.current_candidate_id
+            with stream_box.container(), (candidate_usage(current_id) if current_id is not None else nullcontext()):
+              rewritten = format_res(st.write_stream(stream_rewrite_cv(
+                llm,
+                st.session_state.original_cv_content,
+                st.session_state.cv_analysis,
+                prompt_job_details,
+                cv_template=cv_template,
+                rewrite_options=st.session_state.rewrite_options,
+                idioma=st.session_state.rewrite_options.get("idioma", "Português Brasileiro")
+              )))
+            stream_box.empty()
           
           # Valida o resultado
           if rewritten and isinstance(rewritten, str) and len(rewritten.strip()) > 50:
@@ -521,44 +582,106 @@ if has_analysis and has_cv_content:
       )
     
     with col_download_pdf_main:
-      # Gera PDF
-      pdf_bytes = generate_pdf_from_cv(
-        st.session_state.rewritten_cv,
-        primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+      # Gera PDF sob demanda, só quando o download é solicitado
+      st.download_button(
+        label="📕 PDF (.pdf)",
+        data=lazy_export_cv(st.session_state.rewritten_cv, "pdf", primary_color),
+        file_name="curriculo_reformulado.pdf",
+        mime=CV_EXPORT_MIME_TYPES["pdf"],
+        key="download_rewritten_cv_pdf",
+        use_container_width=True
       )
-      if pdf_bytes:
-        st.download_button(
-          label="📕 PDF (.pdf)",
-          data=pdf_bytes,
-          file_name="curriculo_reformulado.pdf",
-          mime="application/pdf",
-          key="download_rewritten_cv_pdf",
-          use_container_width=True
-        )
     
     with col_download_docx_main:
-      # Gera DOCX
-      docx_bytes = generate_docx_from_cv(
-        st.session_state.rewritten_cv,
-        primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+      # Gera DOCX sob demanda, só quando o download é solicitado
+      st.download_button(
+        label="📘 Word (.docx)",
+        data=lazy_export_cv(st.session_state.rewritten_cv, "docx", primary_color),
+        file_name="curriculo_reformulado.docx",
+        mime=CV_EXPORT_MIME_TYPES["docx"],
+        key="download_rewritten_cv_docx",
+        use_container_width=True
       )
-      if docx_bytes:
-        st.download_button(
-          label="📘 Word (.docx)",
-          data=docx_bytes,
-          file_name="curriculo_reformulado.docx",
-          mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-          key="download_rewritten_cv_docx",
-          use_container_width=True
-        )
 elif st.session_state.cv_analysis and not st.session_state.original_cv_content:
   st.info("💡 Faça upload de um currículo e execute a análise para poder reformular.")
 elif not st.session_state.cv_analysis and st.session_state.original_cv_content:
   st.info("💡 Execute primeiro a **Análise Detalhada** para poder reformular o currículo.")
 
-if os.path.exists(json_file):
+if has_candidates(json_file):
   st.subheader("Lista de currículos analisados", divider="gray")
-  df = display_json_table(json_file)
+
+  # Filtro por competências (índice invertido de hard_skills/soft_skills/certifications)
+  skill_query = st.text_input(
+    "🔎 Filtrar por competências",
+    placeholder="ex.: laravel AND scraping AND n8n  |  (python OR java) AND NOT php",
+    help="Palavras separadas por espaço ou vírgula são combinadas com AND; use aspas para "
+         "competências com mais de uma palavra, ex.: \"machine learning\" docker",
+    key="skill_query"
+  )
+  filtered_ids = None
+  if skill_query.strip():
+    try:
+      filtered_ids = search_candidates(json_file, skill_query)
+    except QuerySyntaxError as e:
+      st.error(f"❌ Consulta inválida: {e}")
+
+  # Paginação: só a página atual é lida do banco
+  total_candidates = get_candidate_store(json_file).count() if filtered_ids is None else len(filtered_ids)
+  col_order, col_page_size, col_page = st.columns([2, 1, 1])
+  with col_order:
+    list_order = st.selectbox(
+      "Ordenar por",
+      ["created", "score", "name"],
+      format_func=lambda x: {"created": "Ordem de cadastro", "score": "Score", "name": "Nome"}[x],
+      key="list_order"
+    )
+  with col_page_size:
+    page_size = st.selectbox("Por página", [10, 25, 50, 100], index=1, key="list_page_size")
+  total_pages = max(1, -(-total_candidates // page_size))
+  if st.session_state.get("list_page", 1) > total_pages:
+    # O filtro ou o tamanho da página reduziram o total de páginas
+    st.session_state.list_page = total_pages
+  with col_page:
+    page_number = st.number_input(f"Página (de {total_pages})", min_value=1, max_value=total_pages, value=1, key="list_page")
+
+  df = display_json_table(json_file, page=page_number - 1, page_size=page_size, order_by=list_order, candidate_ids=filtered_ids)
+  if filtered_ids is None:
+    st.caption(f"{total_candidates} currículos registrados")
+  else:
+    st.caption(f"{total_candidates} currículos encontrados para \"{skill_query.strip()}\"")
+  # Scores da vaga ativa (matriz candidato x vaga)
+  active_job_scores = get_candidate_store(json_file).match_scores(job_id)
+
+  # Reformula todos os currículos da página em paralelo (chamadas assíncronas ao LLM)
+  if st.button("🔄 Reformular todos desta página", key="btn_rewrite_all"):
+    selected_template = st.session_state.rewrite_options["template"]
+    cv_template = st.session_state.cv_templates.get(selected_template)
+    if not cv_template:
+      st.error(f"❌ Template {selected_template} não encontrado. Verifique se o arquivo cv_base{selected_template}.txt existe.")
+    else:
+      requests = {}
+      for i, row in df.iterrows():
+        cv_data = row.to_dict()
+        candidate_name = cv_data.get('name') or f'Candidato_{i}'
+        requests[candidate_name] = (generate_cv_content_from_json(cv_data), generate_analysis_from_json(cv_data))
+      with st.spinner(f"Reformulando {len(requests)} currículos em paralelo..."):
+        results = run_async(arewrite_many(
+          llm,
+          requests,
+          prompt_job_details,
+          cv_template,
+          rewrite_options=st.session_state.rewrite_options,
+          idioma=st.session_state.rewrite_options.get("idioma", "Português Brasileiro")
+        ))
+      failures = 0
+      for candidate_name, rewritten in results.items():
+        if isinstance(rewritten, Exception):
+          failures += 1
+          st.warning(f"⚠️ {candidate_name}: {rewritten}")
+        else:
+          st.session_state.rewritten_cvs[candidate_name] = rewritten
+      st.success(f"✅ {len(results) - failures} de {len(results)} currículos reformulados!")
+
   for i, row in df.iterrows():
     candidate_name = row.get('name', f'Candidato_{i}')
     cv_data = row.to_dict()
@@ -575,7 +698,7 @@ if os.path.exists(json_file):
         st.write(f"**{candidate_name}**")
       
       with cols[2]:
-        score = row.get('score', '-')
+        score = active_job_scores.get(i, row.get('score', '-'))
         if isinstance(score, (int, float)):
           st.metric("Score", f"{score:.1f}")
         else:
@@ -606,15 +729,16 @@ if os.path.exists(json_file):
                 st.error(f"❌ Template {selected_template} não encontrado. Verifique se o arquivo cv_base{selected_template}.txt existe.")
                 rewritten = None
               else:
-                rewritten = rewrite_cv(
-                  llm,
-                  cv_content,
-                  analysis,
-                  job_details,
-                  cv_template=cv_template,
-                  rewrite_options=st.session_state.rewrite_options,
-                  idioma=st.session_state.rewrite_options.get("idioma", "Português Brasileiro")
-                )
+                with candidate_usage(int(i)):
+                  rewritten = rewrite_cv(
+                    llm,
+                    cv_content,
+                    analysis,
+                    prompt_job_details,
+                    cv_template=cv_template,
+                    rewrite_options=st.session_state.rewrite_options,
+                    idioma=st.session_state.rewrite_options.get("idioma", "Português Brasileiro")
+                  )
               
               if rewritten and isinstance(rewritten, str) and len(rewritten.strip()) > 50:
                 # Salva no dicionário de CVs reformulados
@@ -646,38 +770,56 @@ if os.path.exists(json_file):
               use_container_width=True
             )
           with col_pdf:
-            # Gera PDF
-            pdf_bytes = generate_pdf_from_cv(
-              st.session_state.rewritten_cvs[candidate_name],
-              primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+            # Gera PDF sob demanda, só quando o download é solicitado
+            st.download_button(
+              label="📕 PDF",
+              data=lazy_export_cv(st.session_state.rewritten_cvs[candidate_name], "pdf", primary_color),
+              file_name=f"curriculo_reformulado_{candidate_name.replace(' ', '_')}.pdf",
+              mime=CV_EXPORT_MIME_TYPES["pdf"],
+              key=f"download_pdf_{i}",
+              use_container_width=True
             )
-            if pdf_bytes:
-              st.download_button(
-                label="📕 PDF",
-                data=pdf_bytes,
-                file_name=f"curriculo_reformulado_{candidate_name.replace(' ', '_')}.pdf",
-                mime="application/pdf",
-                key=f"download_pdf_{i}",
-                use_container_width=True
-              )
           with col_docx:
-            # Gera DOCX
-            docx_bytes = generate_docx_from_cv(
-              st.session_state.rewritten_cvs[candidate_name],
-              primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+            # Gera DOCX sob demanda, só quando o download é solicitado
+            st.download_button(
+              label="📘 DOCX",
+              data=lazy_export_cv(st.session_state.rewritten_cvs[candidate_name], "docx", primary_color),
+              file_name=f"curriculo_reformulado_{candidate_name.replace(' ', '_')}.docx",
+              mime=CV_EXPORT_MIME_TYPES["docx"],
+              key=f"download_docx_{i}",
+              use_container_width=True
             )
-            if docx_bytes:
-              st.download_button(
-                label="📘 DOCX",
-                data=docx_bytes,
-                file_name=f"curriculo_reformulado_{candidate_name.replace(' ', '_')}.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                key=f"download_docx_{i}",
-                use_container_width=True
-              )
       
       st.divider()
 
+  # ============================================
+  # MATRIZ CANDIDATO x VAGA
+  # ============================================
+  st.subheader("📊 Matriz candidato × vaga", divider="gray")
+  pending_matches = len(get_candidate_store(json_file).candidates_without_match(job_id))
+  if pending_matches:
+    prescreen_top_k = st.number_input(
+      "Pré-triagem local: enviar ao LLM apenas os K mais aderentes (0 = todos)",
+      min_value=0, max_value=pending_matches, value=0, step=1, key="prescreen_top_k"
+    )
+    if st.button(f"📊 Pontuar {pending_matches} candidatos pendentes para a vaga ativa", key="btn_fill_matrix"):
+      with st.spinner("Pontuando candidatos já extraídos (sem reprocessar os PDFs)..."):
+        matrix_summary = run_async(afill_match_matrix(llm, json_file, job_id, job_details, top_k=prescreen_top_k or None))
+      st.success(
+        f"✅ {matrix_summary['scored']} candidatos pontuados ({matrix_summary['failed']} falhas, "
+        f"{matrix_summary['skipped']} descartados na pré-triagem)"
+      )
+  else:
+    st.caption("Todos os candidatos já foram pontuados para a vaga ativa.")
+
+  agreement, agreement_pairs = prescreen_agreement(json_file, job_id)
+  if agreement is not None:
+    st.metric("Concordância pré-triagem × LLM (Spearman)", f"{agreement:.2f}", help=f"{agreement_pairs} candidatos com os dois scores")
+
+  match_matrix = match_matrix_table(json_file)
+  if not match_matrix.empty:
+    st.dataframe(match_matrix)
+
 if st.session_state.selected_cv:
   st.markdown("-----")
   selected_name = st.session_state.selected_cv.get('name', 'Candidato')
@@ -721,46 +863,85 @@ if st.session_state.selected_cv:
       )
     
     with col_download_pdf:
-      # Gera PDF
-      pdf_bytes = generate_pdf_from_cv(
-        st.session_state.rewritten_cvs[selected_name],
-        primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+      # Gera PDF sob demanda, só quando o download é solicitado
+      st.download_button(
+        label="📕 PDF (.pdf)",
+        data=lazy_export_cv(st.session_state.rewritten_cvs[selected_name], "pdf", primary_color),
+        file_name=f"curriculo_reformulado_{selected_name.replace(' ', '_')}.pdf",
+        mime=CV_EXPORT_MIME_TYPES["pdf"],
+        key="download_selected_rewritten_pdf",
+        use_container_width=True
       )
-      if pdf_bytes:
-        st.download_button(
-          label="📕 PDF (.pdf)",
-          data=pdf_bytes,
-          file_name=f"curriculo_reformulado_{selected_name.replace(' ', '_')}.pdf",
-          mime="application/pdf",
-          key="download_selected_rewritten_pdf",
-          use_container_width=True
-        )
     
     with col_download_docx:
-      # Gera DOCX
-      docx_bytes = generate_docx_from_cv(
-        st.session_state.rewritten_cvs[selected_name],
-        primary_color=st.session_state.rewrite_options.get("primary_color", "#2563eb")
+      # Gera DOCX sob demanda, só quando o download é solicitado
+      st.download_button(
+        label="📘 Word (.docx)",
+        data=lazy_export_cv(st.session_state.rewritten_cvs[selected_name], "docx", primary_color),
+        file_name=f"curriculo_reformulado_{selected_name.replace(' ', '_')}.docx",
+        mime=CV_EXPORT_MIME_TYPES["docx"],
+        key="download_selected_rewritten_docx",
+        use_container_width=True
       )
-      if docx_bytes:
-        st.download_button(
-          label="📘 Word (.docx)",
-          data=docx_bytes,
-          file_name=f"curriculo_reformulado_{selected_name.replace(' ', '_')}.docx",
-          mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-          key="download_selected_rewritten_docx",
-          use_container_width=True
-        )
 
-if os.path.exists(json_file):
-  with open(json_file, "r", encoding="utf-8") as f:
-    json_data = f.read()
+if has_candidates(json_file):
   st.download_button(
       label = "📥 Baixar arquivo .json",
-      data = json_data,
+      data = get_candidate_store(json_file).export_json,
       file_name = json_file,
       mime="application/json"
   )
 
-  df = display_json_table(json_file)
-  st.dataframe(df)
\ No newline at end of file
+  st.dataframe(df)
+
+# ============================================
+# CONSUMO DE TOKENS (por etapa, modelo, vaga e candidato)
+# ============================================
+with st.sidebar.expander("🪙 Consumo de tokens"):
+  usage_rows = usage_summary(json_file, group_by=("stage", "model"), job_id=job_id)
+  if usage_rows:
+    st.caption("Vaga ativa, por etapa e modelo")
+    st.dataframe(usage_table(usage_rows), hide_index=True, use_container_width=True)
+    st.caption("Vaga ativa, por candidato")
+    st.dataframe(usage_table(usage_summary(json_file, group_by=("candidate",), job_id=job_id)), hide_index=True, use_container_width=True)
+    st.caption("Todas as vagas, por vaga e modelo")
+    st.dataframe(usage_table(usage_summary(json_file, group_by=("job", "model")), job_titles=job_catalog), hide_index=True, use_container_width=True)
+  else:
+    st.caption("Nenhuma chamada ao LLM registrada para esta vaga ainda")
+
+# ============================================
+# PAINEL DE DESEMPENHO (sessão atual)
+# ============================================
+# No fim do script: inclui as etapas executadas neste rerun
+with st.sidebar.expander("⏱️ Desempenho"):
+  perf_rows = get_metrics().session_summary(st.session_state.metrics_session)
+  if perf_rows:
+    st.caption("Tempo por etapa nesta sessão (ms), da etapa mais custosa para a menos custosa")
+    st.dataframe(
+      [{
+        "Etapa": row["stage"],
+        "Chamadas": row["count"],
+        "Erros": row["errors"],
+        "Total": row["total_ms"],
+        "Média": row["mean_ms"],
+        "p50": row["p50_ms"],
+        "p95": row["p95_ms"],
+        "Máx.": row["max_ms"],
+      } for row in perf_rows],
+      hide_index=True,
+      use_container_width=True
+    )
+    if st.button("🧹 Limpar medições", key="clear_metrics"):
+      get_metrics().clear_session(st.session_state.metrics_session)
+      st.rerun()
+  else:
+    st.caption("Nenhuma etapa medida nesta sessão ainda")
+  # Agendador das chamadas ao LLM: compartilhado por todas as sessões do processo
+  scheduler_stats = get_llm_scheduler().stats()
+  st.caption(
+    f"Agendador do LLM (todas as sessões): {scheduler_stats['in_flight']} em andamento, "
+    f"{scheduler_stats['waiting']['interactive']} interativas e {scheduler_stats['waiting']['batch']} em lote na fila, "
+    f"limite {scheduler_stats['limit']:g}/{scheduler_stats['max_concurrency']}, "
+    f"{scheduler_stats['rate_limited']} respostas 429"
+    + (f", pausa de {scheduler_stats['paused_s']:.1f}s pedida pelo provedor" if scheduler_stats["paused_s"] else "")
+  )
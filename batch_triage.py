@@ -0,0 +1,428 @@
+"""
+Triagem em lote de currículos via linha de comando.
+
+Executa parse_doc -> process_cv -> parse_res_llm -> save_json_cv como um
+pipeline produtor/consumidor: enquanto o LLM avalia o currículo N, o PDF
+N+1 já está sendo extraído. A concorrência do LLM é limitada por
+--concurrency e a gravação é feita por um único consumidor.
+
+Uso:
+    python batch_triage.py curriculos/ --concurrency 4
+    python batch_triage.py "entrada/*.pdf" --job-id 3f2a9c1b7d4e5f60 --output curriculos.json
+    python batch_triage.py --fill-matrix --job-id 3f2a9c1b7d4e5f60
+    python batch_triage.py curriculos/ --top-k 50
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from utils_proj03 import (
+    CV_FIELDS,
+    CASCADE_BAND_HIGH,
+    CASCADE_BAND_LOW,
+    CASCADE_ENABLED,
+    CASCADE_FAST_MODEL,
+    CV_SCHEMA,
+    LANE_BATCH,
+    JOB_DIGEST_ENABLED,
+    PROMPT_SCORE,
+    afill_match_matrix,
+    aprocess_cv,
+    aprocess_cv_cascade,
+    candidate_usage,
+    create_triage_prompt_template,
+    current_usage_scope,
+    describe_cascade,
+    ensure_job_digest,
+    get_candidate_store,
+    get_cascade_stats,
+    get_job_registry,
+    get_llm_scheduler,
+    job_prompt_text,
+    load_llm,
+    parse_doc,
+    parse_res_llm,
+    prescreen_agreement,
+    rank_candidates,
+    record_triage_match,
+    run_async,
+    save_json_cv,
+    select_top,
+    set_llm_concurrency,
+    set_llm_lane,
+    set_usage_scope,
+)
+
+# Marca o fim de cada fila do pipeline
+_DONE = object()
+
+
+def collect_pdf_paths(inputs):
+    """
+    Expande diretórios e padrões glob em uma lista ordenada de PDFs.
+
+    Args:
+        inputs: Lista de diretórios, arquivos ou padrões glob
+
+    Returns:
+        list: Caminhos de PDF sem duplicatas
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)
+        else:
+            matches = glob.glob(item)
+        paths.extend(sorted(m for m in matches if m.lower().endswith(".pdf")))
+
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+class Progress:
+    """Contabiliza o andamento do lote e imprime vazão (CVs/min) e ETA."""
+
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, ok=True):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+            self._print()
+
+    def rate_per_min(self):
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0 or self.done == 0:
+            return 0.0
+        return self.done / elapsed * 60
+
+    def eta_seconds(self):
+        rate = self.rate_per_min()
+        if rate == 0:
+            return None
+        return (self.total - self.done) / rate * 60
+
+    def _print(self):
+        eta = self.eta_seconds()
+        eta_text = "--:--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        line = (f"\r[{self.done}/{self.total}] {self.rate_per_min():.1f} CVs/min | "
+                f"ETA {eta_text} | falhas: {self.failed}")
+        self.stream.write(line)
+        self.stream.flush()
+
+    def finish(self):
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+async def arun_pipeline(paths, job_details, llm, json_file, concurrency=4, parse_workers=1, progress=None, job_id=None,
+                        prescreen_scores=None, fast_llm=None, band=None):
+    """
+    Executa a triagem dos PDFs em três estágios encadeados por filas.
+
+    O parse roda em threads (asyncio.to_thread) e as chamadas ao LLM usam
+    aprocess_cv, de modo que um único processo mantém `concurrency`
+    requisições em voo sem uma thread por requisição.
+
+    Args:
+        paths: Lista de caminhos de PDF
+        job_details: Texto da vaga (ver JobRegistry.job_details)
+        llm: Modelo de linguagem
+        json_file: Caminho usado por save_json_cv (curriculos.json -> curriculos.db)
+        concurrency: Número máximo de chamadas simultâneas ao LLM
+        parse_workers: Número de extrações de PDF simultâneas
+        progress: Instância de Progress (opcional)
+        job_id: Id da vaga; se informado, a avaliação vira a célula (candidato, vaga) da matriz
+        prescreen_scores: {caminho: score da pré-triagem local}, gravado ao lado do score do LLM
+        fast_llm: Modelo rápido da cascata; se informado, llm só avalia os casos escalados
+        band: (mínimo, máximo) da faixa de incerteza da cascata (padrão: CASCADE_BAND_LOW/HIGH)
+
+    Returns:
+        dict: Resumo com quantidade de currículos processados e falhas por arquivo
+    """
+    concurrency = max(1, concurrency)
+    parse_workers = max(1, parse_workers)
+    set_llm_concurrency(concurrency)
+    prompt_template = create_triage_prompt_template()
+
+    # Filas limitadas geram contrapressão: o parse não avança muito além do LLM
+    parsed_queue = asyncio.Queue(maxsize=concurrency * 2)
+    result_queue = asyncio.Queue(maxsize=concurrency * 2)
+    parse_semaphore = asyncio.Semaphore(parse_workers)
+    errors = {}
+
+    def record_error(path, exc):
+        errors[path] = str(exc)
+        if progress:
+            progress.update(ok=False)
+
+    async def parse_one(path):
+        async with parse_semaphore:
+            try:
+                content = await asyncio.to_thread(parse_doc, path)
+            except Exception as e:
+                record_error(path, e)
+                return
+        await parsed_queue.put((path, content))
+
+    async def parse_stage():
+        await asyncio.gather(*(parse_one(path) for path in paths))
+        for _ in range(concurrency):
+            await parsed_queue.put(_DONE)
+
+    async def llm_stage():
+        while True:
+            item = await parsed_queue.get()
+            if item is _DONE:
+                await result_queue.put(_DONE)
+                return
+            path, content = item
+            try:
+                with candidate_usage(path) as usage:
+                    if fast_llm is not None:
+                        _, res = await aprocess_cv_cascade(CV_SCHEMA, job_details, prompt_template, PROMPT_SCORE,
+                                                           fast_llm, llm, path, content=content, band=band)
+                    else:
+                        _, res = await aprocess_cv(CV_SCHEMA, job_details, prompt_template, PROMPT_SCORE, llm, path, content=content)
+                await result_queue.put((path, res, usage))
+            except Exception as e:
+                record_error(path, e)
+
+    async def persist_stage(pending_llm_workers):
+        # Único consumidor: as inserções no banco ficam fora do event loop
+        saved = 0
+        while pending_llm_workers:
+            item = await result_queue.get()
+            if item is _DONE:
+                pending_llm_workers -= 1
+                continue
+            path, res, usage = item
+            structured_data = parse_res_llm(res, CV_FIELDS)
+            if structured_data is None:
+                record_error(path, "Resposta do modelo sem JSON válido")
+                continue
+            try:
+                candidate_id = await asyncio.to_thread(save_json_cv, structured_data, json_file, "name")
+                if usage is not None:
+                    if candidate_id is None:
+                        candidate_id = get_candidate_store(json_file).id_for(structured_data.get("name") or "")
+                    # O consumo da triagem passa a apontar para o candidato registrado
+                    await asyncio.to_thread(usage.attach, candidate_id)
+                if job_id:
+                    prescreen_score = (prescreen_scores or {}).get(path)
+                    await asyncio.to_thread(record_triage_match, json_file, job_id, structured_data, "name", prescreen_score)
+                saved += 1
+                if progress:
+                    progress.update()
+            except Exception as e:
+                record_error(path, e)
+        return saved
+
+    results = await asyncio.gather(
+        parse_stage(),
+        *(llm_stage() for _ in range(concurrency)),
+        persist_stage(concurrency),
+    )
+    return {"total": len(paths), "saved": results[-1], "errors": errors}
+
+
+def run_pipeline(paths, job_details, llm, json_file, concurrency=4, parse_workers=1, progress=None, job_id=None,
+                 prescreen_scores=None, fast_llm=None, band=None):
+    """Versão síncrona de arun_pipeline (mesmos argumentos e retorno)."""
+    return run_async(arun_pipeline(paths, job_details, llm, json_file, concurrency, parse_workers, progress, job_id,
+                                     prescreen_scores, fast_llm, band))
+
+
+async def aprescreen_paths(paths, job_text, top_k=None, threshold=None, parse_workers=1):
+    """
+    Extrai todos os PDFs e ranqueia o banco inteiro com a pré-triagem local (TF-IDF).
+    O texto extraído fica no cache de parse, então o pipeline não extrai de novo.
+
+    Returns:
+        tuple: (caminhos selecionados em ordem de score, {caminho: score})
+    """
+    parse_semaphore = asyncio.Semaphore(max(1, parse_workers))
+
+    async def parse_one(path):
+        async with parse_semaphore:
+            try:
+                return await asyncio.to_thread(parse_doc, path)
+            except Exception:
+                # O erro é reportado pelo pipeline, que tenta extrair novamente
+                return ""
+
+    contents = await asyncio.gather(*(parse_one(path) for path in paths))
+    scores = rank_candidates(job_text, contents)
+    selected = [paths[i] for i in select_top(scores, top_k=top_k, threshold=threshold)]
+    return selected, {path: float(score) for path, score in zip(paths, scores)}
+
+
+def print_agreement(json_file, job_id):
+    agreement, pairs = prescreen_agreement(json_file, job_id)
+    if agreement is not None:
+        print(f"Concordância pré-triagem x LLM (Spearman, {pairs} pares): {agreement:.2f}")
+
+
+def print_scheduler():
+    """Limites do provedor atingidos nesta execução (429, novas tentativas e concorrência final)"""
+    stats = get_llm_scheduler().stats()
+    if stats["rate_limited"] or stats["retries"]:
+        print(f"Agendador: {stats['rate_limited']} respostas 429, {stats['retries']} novas tentativas, "
+              f"concorrência ajustada para {stats['limit']:g} de {stats['max_concurrency']}")
+
+
+def print_usage():
+    """Tokens e custo estimado das chamadas ao LLM desta execução"""
+    totals = current_usage_scope().totals
+    if totals["calls"]:
+        print(f"LLM: {totals['calls']} chamadas, {totals['prompt_tokens']} tokens de entrada, "
+              f"{totals['completion_tokens']} de saída ({totals['reasoning_tokens']} de raciocínio), "
+              f"custo estimado US$ {totals['cost_usd']:.4f}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Triagem em lote de currículos em PDF")
+    parser.add_argument("inputs", nargs="*", help="Diretórios, arquivos PDF ou padrões glob")
+    parser.add_argument("--job-id", help="Id da vaga no registro (padrão: vaga ativa no app)")
+    parser.add_argument("--vagas", default="vagas.csv",
+                        help="CSV de vagas legado, importado se o registro ainda não tiver vaga ativa")
+    parser.add_argument("--output", default="curriculos.json",
+                        help="Base dos candidatos (curriculos.json -> curriculos.db, migrando o JSON legado)")
+    parser.add_argument("--model", default="openai/gpt-oss-120b", help="Modelo Groq")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Usa temperatura 0 e o cache persistente de respostas do LLM")
+    parser.add_argument("--concurrency", type=int, default=4, help="Máximo de chamadas simultâneas ao LLM")
+    parser.add_argument("--requests-per-minute", type=float,
+                        help="Orçamento de requisições por minuto ao LLM (padrão: LLM_REQUESTS_PER_MINUTE; 0 = sem limite)")
+    parser.add_argument("--tokens-per-minute", type=float,
+                        help="Orçamento de tokens por minuto ao LLM (padrão: LLM_TOKENS_PER_MINUTE; 0 = sem limite)")
+    parser.add_argument("--parse-workers", type=int, default=1, help="Extrações de PDF simultâneas")
+    parser.add_argument("--pdf-workers", type=int,
+                        help="Processos que dividem as páginas de PDFs grandes (padrão: PDF_PARSE_WORKERS)")
+    parser.add_argument("--max-pages", type=int,
+                        help="Lê no máximo N páginas de cada PDF (padrão: PDF_MAX_PAGES; 0 = sem limite)")
+    parser.add_argument("--top-k", type=int,
+                        help="Pré-triagem local: envia ao LLM apenas os K currículos mais aderentes à vaga")
+    parser.add_argument("--min-prescreen", type=float,
+                        help="Pré-triagem local: envia ao LLM apenas currículos com similaridade >= valor (0 a 1)")
+    parser.add_argument("--cascade", action=argparse.BooleanOptionalAction, default=CASCADE_ENABLED,
+                        help="Triagem com o modelo rápido, escalando ao --model só os casos de fronteira (padrão: CASCADE_ENABLED)")
+    parser.add_argument("--fast-model", default=CASCADE_FAST_MODEL, help="Modelo rápido da cascata")
+    parser.add_argument("--band-low", type=float, default=CASCADE_BAND_LOW,
+                        help="Início da faixa de incerteza: notas do modelo rápido entre --band-low e --band-high são reavaliadas")
+    parser.add_argument("--band-high", type=float, default=CASCADE_BAND_HIGH, help="Fim da faixa de incerteza")
+    parser.add_argument("--fill-matrix", action="store_true",
+                        help="Não lê PDFs: pontua para a vaga os candidatos já registrados que ainda não têm score nela")
+    parser.add_argument("--rescreen", action="store_true",
+                        help="Com --fill-matrix: devolve à pré-triagem os candidatos já descartados por ela para a vaga")
+    return parser
+
+
+def main(argv=None):
+    load_dotenv()
+    args = build_arg_parser().parse_args(argv)
+
+    job_registry = get_job_registry(args.output)
+    job_id = args.job_id or job_registry.active_job_id() or job_registry.import_from_csv(args.vagas)
+    job_details = job_registry.job_details(job_id) if job_id else None
+    if not job_details:
+        print("Nenhuma vaga encontrada: informe --job-id ou cadastre a vaga pelo app.", file=sys.stderr)
+        return 1
+
+    llm = load_llm(args.model, 0.0 if args.deterministic else args.temperature)
+    # Só há trabalho em lote neste processo: nenhuma vaga fica reservada a chamadas interativas
+    set_llm_lane(LANE_BATCH)
+    get_llm_scheduler().configure(requests_per_minute=args.requests_per_minute,
+                                  tokens_per_minute=args.tokens_per_minute, interactive_reserve=0)
+    # Consumo de tokens de cada chamada gravado no banco, por etapa, vaga e candidato
+    set_usage_scope(args.output, job_id)
+
+    if args.fill_matrix:
+        set_llm_concurrency(args.concurrency)
+        started_at = time.monotonic()
+        summary = run_async(afill_match_matrix(llm, args.output, job_id, job_details,
+                                                 top_k=args.top_k, min_prescreen=args.min_prescreen,
+                                                 rescreen=args.rescreen))
+        print(f"{summary['scored']} candidatos pontuados para a vaga {job_id} "
+              f"({summary['failed']} falhas, {summary['skipped']} descartados na pré-triagem) "
+              f"em {time.monotonic() - started_at:.1f}s")
+        print_usage()
+        print_scheduler()
+        print_agreement(args.output, job_id)
+        return 0 if not summary["failed"] else 2
+
+    paths = collect_pdf_paths(args.inputs)
+    if not paths:
+        print("Nenhum PDF encontrado.", file=sys.stderr)
+        return 1
+
+    if args.max_pages is not None or args.pdf_workers is not None:
+        import pdf_pages
+        pdf_pages.configure(max_pages=args.max_pages, workers=args.pdf_workers)
+
+    prescreen_scores = None
+    if args.top_k or args.min_prescreen is not None:
+        total = len(paths)
+        paths, prescreen_scores = run_async(aprescreen_paths(
+            paths, job_details, top_k=args.top_k, threshold=args.min_prescreen, parse_workers=args.parse_workers
+        ))
+        print(f"Pré-triagem local: {len(paths)} de {total} currículos seguem para o LLM", file=sys.stderr)
+
+    # Requisitos da vaga compilados uma vez e usados nos prompts de todos os currículos
+    if JOB_DIGEST_ENABLED and paths and ensure_job_digest(llm, args.output, job_id) is None:
+        print("Não foi possível compilar os requisitos da vaga; usando a descrição completa.", file=sys.stderr)
+
+    fast_llm = load_llm(args.fast_model, 0.0 if args.deterministic else args.temperature) if args.cascade else None
+
+    progress = Progress(len(paths))
+    summary = run_pipeline(
+        paths,
+        job_prompt_text(args.output, job_id, job_details),
+        llm,
+        args.output,
+        concurrency=args.concurrency,
+        parse_workers=args.parse_workers,
+        progress=progress,
+        job_id=job_id,
+        prescreen_scores=prescreen_scores,
+        fast_llm=fast_llm,
+        band=(args.band_low, args.band_high),
+    )
+    progress.finish()
+
+    print(f"{summary['saved']}/{summary['total']} currículos processados em "
+          f"{time.monotonic() - progress.started_at:.1f}s")
+    print_usage()
+    print_scheduler()
+    if fast_llm is not None:
+        print(describe_cascade(get_cascade_stats().summary()))
+    for path, error in summary["errors"].items():
+        print(f"  ERRO {path}: {error}", file=sys.stderr)
+    if prescreen_scores is not None:
+        print_agreement(args.output, job_id)
+    return 0 if not summary["errors"] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""
+Benchmark offline do pipeline (sem rede).
+
+Troca o LLM por um modelo falso determinístico (latência configurável e JSON
+pronto), gera um corpus sintético de currículos em PDF e mede vazão e
+latências p50/p95/p99 de parse_doc, process_cv (ponta a ponta),
+parse_res_llm, save_json_cv com 10/1k/10k registros existentes e dos
+geradores de PDF e DOCX. Os caches de respostas e de parse são desligados
+para medir o trabalho real.
+
+O resultado é um JSON estável (chaves ordenadas, valores arredondados), de
+modo que duas execuções podem ser comparadas com diff ou com --compare.
+
+Uso:
+    python benchmark.py --output bench.json
+    python benchmark.py --cvs 50 --latency-ms 200 --only process_cv_e2e
+    python benchmark.py --quick --compare bench.json
+"""
+
+import os
+
+# Mede o trabalho real: sem cache de respostas do LLM nem de texto extraído
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["PARSE_CACHE_ENABLED"] = "0"
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = (
+    "parse_doc",
+    "process_cv_e2e",
+    "parse_res_llm",
+    "parse_res_llm_repair",
+    "save_json_cv",
+    "generate_pdf_from_cv",
+    "generate_docx_from_cv",
+)
+
+_FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Felipe", "Gabriela", "Heitor", "Isabela", "João"]
+_LAST_NAMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Costa", "Ribeiro", "Almeida", "Rocha"]
+_SKILLS = ["Python", "PHP", "Laravel", "Docker", "Kubernetes", "PostgreSQL", "MongoDB", "n8n", "Scraping",
+           "APIs REST", "AWS", "Terraform", "Pandas", "LangChain", "Redis", "Kafka", "React", "Go"]
+_COMPANIES = ["Acme Dados", "Nuvem Sul", "Orbital Tech", "Rede Norte", "Vértice Sistemas", "Lumen Analytics"]
+_VERBS = ["Desenvolveu", "Automatizou", "Migrou", "Otimizou", "Liderou", "Implantou", "Monitorou"]
+_OBJECTS = ["pipelines de dados", "crawlers de fontes públicas", "APIs de integração", "agentes de IA",
+            "rotinas de coleta", "dashboards operacionais", "serviços de alta disponibilidade"]
+
+JOB_DETAILS = """
+**Vaga para Desenvolvedor(a) Backend Sênior**
+
+Experiência sólida em desenvolvimento backend PHP/Laravel com foco em dados e automação.
+Domínio em scraping, proxies, CAPTCHAs e APIs RESTful. Experiência com bancos relacionais e não relacionais.
+Vivência com n8n, agentes de IA e monitoramento automatizado.
+"""
+
+
+# ============================================
+# LLM falso
+# ============================================
+
+def make_fake_llm(responses, latency=0.0):
+    """
+    Modelo de chat falso: devolve as respostas em ordem (circular) após `latency` segundos.
+    Compatível com invoke/ainvoke/bind do LangChain.
+    """
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from pydantic import PrivateAttr
+
+    class FakeBenchmarkChatModel(BaseChatModel):
+        responses: list
+        latency: float = 0.0
+        model_name: str = "fake-benchmark"
+        _index: int = PrivateAttr(default=0)
+
+        @property
+        def _llm_type(self):
+            return "fake-benchmark"
+
+        def _next(self):
+            content = self.responses[self._index % len(self.responses)]
+            self._index += 1
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            return self._next()
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self._next()
+
+    return FakeBenchmarkChatModel(responses=list(responses), latency=latency)
+
+
+def canned_triage_response(rng, index):
+    """Resposta de triagem no formato do CV_SCHEMA"""
+    skills = rng.sample(_SKILLS, 6)
+    return json.dumps({
+        "name": f"Candidato Sintético {index}",
+        "position": "Desenvolvedor Backend",
+        "summary": "Desenvolvedor backend com foco em dados e automação.",
+        "hard_skills": skills[:4],
+        "soft_skills": ["Comunicação", "Proatividade"],
+        "academic_info": [{"title": "Ciência da Computação", "institution": "UF", "year": "2015"}],
+        "training_courses": [{"title": "Docker", "institution": "Online"}],
+        "experiences": [{"position": "Dev", "company": rng.choice(_COMPANIES), "start_date": "2019",
+                         "end_date": "2024", "description": "Pipelines de dados"}],
+        "certifications": ["AWS Cloud Practitioner"],
+        "interview_questions": ["Como lidou com CAPTCHAs?", "Qual seu uso de n8n?", "Como monitora fontes?"],
+        "strengths": ["Scraping", "APIs"],
+        "areas_for_development": ["Kubernetes"],
+        "important_considerations": ["Verificar experiência com PHP"],
+        "final_recommendations": "Seguir com entrevista técnica.",
+        "score": round(rng.uniform(4, 9.5), 1),
+    }, ensure_ascii=False)
+
+
+def malformed(response):
+    """Versão malformada da resposta: raciocínio, cerca de código, vírgula sobrando e corte no final"""
+    return "<think>avaliando</think>\n```json\n" + response[:-1].replace('"score"', '"extra": [1, 2,],\n"score"') + "\n```"
+
+
+# ============================================
+# Corpus sintético
+# ============================================
+
+def synthetic_cv_lines(rng, index, experiences=4):
+    name = f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)} {index}"
+    lines = [name, "Desenvolvedor Backend", f"✉ candidato{index}@exemplo.com | (71) 9{index:04d}-0000", "",
+             "RESUMO PROFISSIONAL",
+             "Profissional com experiência em desenvolvimento backend, dados e automação de processos.", "",
+             "EXPERIÊNCIAS"]
+    for _ in range(experiences):
+        lines.append(f"{rng.choice(['Desenvolvedor', 'Engenheiro de Dados', 'Tech Lead'])} - {rng.choice(_COMPANIES)} "
+                     f"({rng.randint(2010, 2018)} - {rng.randint(2019, 2025)})")
+        for _ in range(3):
+            lines.append(f"- {rng.choice(_VERBS)} {rng.choice(_OBJECTS)} com {rng.choice(_SKILLS)} e "
+                         f"{rng.choice(_SKILLS)}, reduzindo o tempo de processamento em {rng.randint(10, 80)}%.")
+        lines.append("")
+    lines += ["FORMAÇÃO ACADÊMICA", "Bacharelado em Ciência da Computação - Universidade Federal", "",
+              "HABILIDADES", ", ".join(rng.sample(_SKILLS, 8))]
+    return lines
+
+
+def generate_corpus(directory, count, pages, seed):
+    """Gera `count` currículos em PDF com ~`pages` páginas cada (PyMuPDF)"""
+    import fitz
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        lines = synthetic_cv_lines(rng, index, experiences=6 * pages)
+        doc = fitz.open()
+        per_page = 48
+        for start in range(0, len(lines), per_page):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(40, 40, 555, 800), "\n".join(lines[start:start + per_page]), fontsize=9)
+        path = os.path.join(directory, f"cv_{index:04d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def synthetic_cv_markdown(rng, index):
+    """Currículo reformulado (markdown no formato dos templates cv_base*.txt)"""
+    parts = [f"**_{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)} {index}_**", "__Desenvolvedor Backend Sênior__", "",
+             f"✆ +55 (71) 9{index:04d}-0000", f"✉ candidato{index}@exemplo.com",
+             "[in] https://www.linkedin.com/in/candidato", "",
+             "**Resumo Profissional**", "Desenvolvedor backend com foco em **dados** e *automação*.", "",
+             "**Experiências**", ""]
+    for _ in range(4):
+        parts += [f"- **{rng.choice(['Desenvolvedor', 'Engenheiro de Dados', 'Tech Lead'])}**",
+                  f"  _{rng.choice(_COMPANIES)} - (2019 - 2024)_"]
+        parts += [f"  - *{rng.choice(_VERBS)} {rng.choice(_OBJECTS)} com {rng.choice(_SKILLS)}*" for _ in range(3)]
+        parts.append("")
+    parts += ["**Formação Acadêmica**", "- Bacharelado em Ciência da Computação", "",
+              "**Hard Skills**"] + [f"- {skill}" for skill in rng.sample(_SKILLS, 6)] + [
+              "", "**Soft Skills**", "- Comunicação", "- Proatividade"]
+    return "\n".join(parts)
+
+
+# ============================================
+# Medição
+# ============================================
+
+def percentile(sorted_values, p):
+    """Percentil pelo método do posto mais próximo"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, wall_seconds):
+    values = sorted(latencies)
+    return {
+        "n": len(values),
+        "throughput_per_s": round(len(values) / wall_seconds, 3) if wall_seconds else 0.0,
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+        "min_ms": round(1000 * values[0], 3) if values else 0.0,
+        "max_ms": round(1000 * values[-1], 3) if values else 0.0,
+    }
+
+
+def measure(fn, items, warmup=1):
+    """Executa fn(item) para cada item e retorna as estatísticas (os primeiros `warmup` itens só aquecem)"""
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    started = time.perf_counter()
+    for item in items[warmup:]:
+        begin = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+# ============================================
+# Benchmarks
+# ============================================
+
+def bench_parse_doc(ctx):
+    u = ctx["utils"]
+    return {"parse_doc": measure(lambda path: u.parse_doc(path, use_cache=False), ctx["paths"])}
+
+
+def bench_process_cv_e2e(ctx):
+    u = ctx["utils"]
+    llm = make_fake_llm(ctx["responses"], ctx["latency"])
+    prompt_template = u.create_triage_prompt_template()
+
+    def run(path):
+        _, res = u.process_cv(u.CV_SCHEMA, JOB_DETAILS, prompt_template, u.PROMPT_SCORE, llm, path)
+        if u.parse_res_llm(res, u.CV_FIELDS) is None:
+            raise RuntimeError(f"Resposta inválida para {path}")
+
+    return {"process_cv_e2e": measure(run, ctx["paths"])}
+
+
+def bench_parse_res_llm(ctx):
+    u = ctx["utils"]
+    responses = [ctx["responses"][i % len(ctx["responses"])] for i in range(ctx["iterations"] + 1)]
+    broken = [malformed(response) for response in responses]
+    for response in broken[:3]:
+        if u.parse_res_llm(response, u.CV_FIELDS) is None:
+            raise RuntimeError("O reparo local não recuperou a resposta malformada")
+    return {
+        "parse_res_llm": measure(lambda text: u.parse_res_llm(text, u.CV_FIELDS), responses),
+        "parse_res_llm_repair": measure(lambda text: u.parse_res_llm(text, u.CV_FIELDS), broken),
+    }
+
+
+def bench_save_json_cv(ctx):
+    u = ctx["utils"]
+    rng = random.Random(ctx["seed"])
+    results = {}
+    for existing in ctx["records"]:
+        path_json = os.path.join(ctx["workdir"], f"save_{existing}.json")
+        # Pré-carrega os registros existentes pelo import do JSON legado (uma única transação)
+        base = json.loads(ctx["responses"][0])
+        with open(path_json, "w", encoding="utf-8") as f:
+            json.dump([{**base, "name": f"Existente {i}"} for i in range(existing)], f, ensure_ascii=False)
+        u.get_candidate_store(path_json)
+        records = [{**json.loads(rng.choice(ctx["responses"])), "name": f"Novo {existing} {i}"}
+                   for i in range(ctx["iterations"] + 1)]
+        results[f"save_json_cv@{existing}"] = measure(lambda record: u.save_json_cv(record, path_json), records)
+    return results
+
+
+def bench_renderers(ctx, name):
+    u = ctx["utils"]
+    rng = random.Random(ctx["seed"])
+    # Conteúdo diferente a cada iteração: não mede o cache da IR do markdown
+    contents = [synthetic_cv_markdown(rng, i) for i in range(ctx["render_iterations"] + 1)]
+    fn = getattr(u, name)
+    return {name: measure(lambda content: fn(content), contents)}
+
+
+RUNNERS = {
+    "parse_doc": bench_parse_doc,
+    "process_cv_e2e": bench_process_cv_e2e,
+    "parse_res_llm": bench_parse_res_llm,
+    "parse_res_llm_repair": bench_parse_res_llm,
+    "save_json_cv": bench_save_json_cv,
+    "generate_pdf_from_cv": lambda ctx: bench_renderers(ctx, "generate_pdf_from_cv"),
+    "generate_docx_from_cv": lambda ctx: bench_renderers(ctx, "generate_docx_from_cv"),
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Imprime a variação de p50/p95 em relação a outra execução; retorna as regressões"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"{'benchmark':<28}{'p50 base':>12}{'p50 atual':>12}{'Δ p50':>9}{'Δ p95':>9}", file=sys.stderr)
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name], results[name]
+        deltas = []
+        for metric in ("p50_ms", "p95_ms"):
+            deltas.append((new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0)
+        flag = " <- regressão" if deltas[0] > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<28}{old['p50_ms']:>12.3f}{new['p50_ms']:>12.3f}{deltas[0]:>8.1f}%{deltas[1]:>8.1f}%{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de currículos")
+    parser.add_argument("--cvs", type=int, default=30, help="Currículos do corpus sintético")
+    parser.add_argument("--pages", type=int, default=2, help="Páginas aproximadas por currículo")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latência simulada do LLM falso (ms)")
+    parser.add_argument("--iterations", type=int, default=200, help="Amostras de parse_res_llm e save_json_cv")
+    parser.add_argument("--render-iterations", type=int, default=30, help="Amostras dos geradores de PDF/DOCX")
+    parser.add_argument("--records", default="10,1000,10000", help="Registros existentes para save_json_cv")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", metavar="NOME", help=f"Subconjunto: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="Amostras reduzidas (verificação rápida)")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Aumento de p50 (%%) considerado regressão")
+    parser.add_argument("--keep", action="store_true", help="Mantém o diretório de trabalho")
+    args = parser.parse_args(argv)
+
+    selected = args.only or list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmark desconhecido: {', '.join(sorted(unknown))}")
+    if args.quick:
+        args.cvs, args.iterations, args.render_iterations = min(args.cvs, 8), min(args.iterations, 40), min(args.render_iterations, 8)
+
+    workdir = tempfile.mkdtemp(prefix="lang_rh_bench_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        import utils_proj03
+        utils_proj03.load_llm = lambda *a, **k: make_fake_llm(responses, args.latency_ms / 1000)
+
+        rng = random.Random(args.seed)
+        responses = [canned_triage_response(rng, i) for i in range(16)]
+        ctx = {
+            "utils": utils_proj03,
+            "workdir": workdir,
+            "paths": generate_corpus(workdir, args.cvs + 1, args.pages, args.seed)
+            if {"parse_doc", "process_cv_e2e"} & set(selected) else [],
+            "responses": responses,
+            "latency": args.latency_ms / 1000,
+            "iterations": args.iterations,
+            "render_iterations": args.render_iterations,
+            "records": [int(value) for value in args.records.split(",") if value.strip()],
+            "seed": args.seed,
+        }
+
+        results = {}
+        for name in selected:
+            runner = RUNNERS[name]
+            if any(key.split("@")[0] == name for key in results):
+                continue
+            started = time.perf_counter()
+            results.update(runner(ctx))
+            print(f"{name}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {
+            "cvs": args.cvs, "pages": args.pages, "latency_ms": args.latency_ms, "iterations": args.iterations,
+            "render_iterations": args.render_iterations, "records": ctx["records"], "seed": args.seed,
+        },
+        "results": {name: results[name] for name in sorted(results)},
+    }
+    text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        return 1 if compare(report["results"], args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
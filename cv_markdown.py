@@ -0,0 +1,286 @@
+"""
+Representação intermediária (IR) do currículo reformulado em Markdown.
+
+O Markdown gerado pelo agente reformulador é analisado uma única vez em uma
+estrutura tipada (cabeçalho, seções, grupos de subtítulo e itens) e os
+geradores de PDF e DOCX renderizam a partir dela. Os padrões são compilados
+no carregamento do módulo e o resultado fica em cache pelo SHA-256 do texto,
+então gerar os dois formatos do mesmo currículo custa uma única análise.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Tuple, Union
+
+# Seções conhecidas e seus ícones (a ordem importa: a primeira chave contida no título vence)
+SECTION_ICONS = {
+    "Resumo Profissional": "👤",
+    "Resumo": "👤",
+    "Experiências": "💼",
+    "Experiência": "💼",
+    "Formação Acadêmica": "🎓",
+    "Formação": "🎓",
+    "Certificações": "🏆",
+    "Certificação": "🏆",
+    "Cursos": "📚",
+    "Cursos e Treinamentos": "📚",
+    "Projetos e Consultorias Relevantes": "🚀",
+    "Projetos": "🚀",
+    "Hard Skills": "⚙️",
+    "Habilidades Técnicas": "⚙️",
+    "Soft Skills": "🤝",
+    "Habilidades Comportamentais": "🤝"
+}
+DEFAULT_SECTION_ICON = "📋"
+
+_SECTION_KEYS = [(key.lower(), key) for key in SECTION_ICONS]
+_CONTACT_MARKERS = ('✉', '✆', '[in]', 'http')
+
+_BOLD_EDGES = re.compile(r'^\*\*|\*\*$')
+_UNDERSCORE_EDGES = re.compile(r'^_+|_+$')
+_PHONE = re.compile(r'\(\d{2}\)')
+_LINKEDIN_MARKER = re.compile(r'\[in\]\s*', re.IGNORECASE)
+# Negrito, itálico e links [texto](url), em uma única varredura da linha
+_INLINE = re.compile(r'\*\*(.+?)\*\*|\*([^*]+?)\*|\[([^\]]+)\]\([^\)]+\)')
+
+# Tipos de bloco do corpo
+TEXT = "text"                  # parágrafo normal
+BULLET = "bullet"              # - item
+NOTE = "note"                  # _empresa / período_
+ITALIC_ITEM = "italic_item"    # - *item em itálico*
+SEPARATOR = "separator"        # ---
+
+
+@dataclass(frozen=True)
+class Run:
+    """Trecho de texto com formatação uniforme"""
+    text: str
+    bold: bool = False
+    italic: bool = False
+
+
+@dataclass(frozen=True)
+class Block:
+    """Linha do corpo já classificada (TEXT, BULLET, NOTE, ITALIC_ITEM ou SEPARATOR)"""
+    kind: str
+    runs: Tuple[Run, ...] = ()
+
+    @property
+    def text(self):
+        return "".join(run.text for run in self.runs)
+
+
+@dataclass(frozen=True)
+class SubtitleGroup:
+    """Subtítulo de seção (- **Cargo**) e os blocos que vêm depois dele"""
+    title: Tuple[Run, ...]
+    blocks: Tuple[Block, ...] = ()
+
+    @property
+    def title_text(self):
+        return "".join(run.text for run in self.title)
+
+
+@dataclass(frozen=True)
+class Section:
+    """Seção principal (**Título**); kind é a seção conhecida correspondente, se houver"""
+    title: str
+    kind: Optional[str]
+    items: Tuple[Union[Block, SubtitleGroup], ...] = ()
+
+    @property
+    def icon(self):
+        return SECTION_ICONS[self.kind] if self.kind else DEFAULT_SECTION_ICON
+
+
+@dataclass(frozen=True)
+class CVHeader:
+    name: Optional[str] = None
+    position: Optional[str] = None
+    contacts: Tuple[Tuple[Run, ...], ...] = ()
+
+    def __bool__(self):
+        return bool(self.name or self.position or self.contacts)
+
+
+@dataclass(frozen=True)
+class CVDocument:
+    header: CVHeader = field(default_factory=CVHeader)
+    sections: Tuple[Section, ...] = ()
+
+
+def section_kind(title):
+    """Seção conhecida contida no título (comparação sem diferenciar maiúsculas), ou None"""
+    lowered = title.lower()
+    for key_lower, key in _SECTION_KEYS:
+        if key_lower in lowered:
+            return key
+    return None
+
+
+def parse_inline(text):
+    """Converte negrito, itálico e links de uma linha em uma tupla de Runs"""
+    runs = []
+    position = 0
+    for match in _INLINE.finditer(text):
+        if match.start() > position:
+            runs.append(Run(text[position:match.start()]))
+        bold, italic, link = match.groups()
+        if bold is not None:
+            runs.append(Run(bold, bold=True))
+        elif italic is not None:
+            runs.append(Run(italic, italic=True))
+        else:
+            runs.append(Run(link))
+        position = match.end()
+    if position < len(text):
+        runs.append(Run(text[position:]))
+    return tuple(runs)
+
+
+def _strip_emphasis(text):
+    """Remove ** e _ das bordas (formatos **_NOME_**, **__NOME__** e **NOME**)"""
+    return _UNDERSCORE_EDGES.sub('', _BOLD_EDGES.sub('', text)).strip()
+
+
+def _is_header_title(candidate):
+    return bool(candidate) and section_kind(candidate) is None and not any(
+        marker in candidate for marker in _CONTACT_MARKERS
+    )
+
+
+def _is_section_line(line):
+    return line.startswith('**') and line.endswith('**') and not line.startswith('- **')
+
+
+def _contact_line(line):
+    """Dado de contato da linha do cabeçalho (sem o ícone), ou None"""
+    if line.replace('*', '').strip() == '':
+        return None
+    if '✉' in line or '@' in line:
+        return line.replace('✉', '').strip() or None
+    if '✆' in line or _PHONE.search(line):
+        return line.replace('✆', '').strip() or None
+    lowered = line.lower()
+    if '[in]' in lowered or 'linkedin' in lowered or 'http' in lowered:
+        return _LINKEDIN_MARKER.sub('', line).strip() or None
+    return None
+
+
+def _classify(line):
+    """Classifica uma linha do corpo que não é título de seção nem subtítulo"""
+    if line.startswith('_') and line.endswith('_'):
+        text = line.replace('_', '').strip()
+        return Block(NOTE, parse_inline(text)) if text else None
+    if line.startswith('- *') and line.endswith('*'):
+        text = line.replace('- *', '').replace('*', '').strip()
+        return Block(ITALIC_ITEM, parse_inline(text)) if text else None
+    if line.startswith('- '):
+        return Block(BULLET, parse_inline(line[2:].strip()))
+    if line.startswith('---'):
+        return Block(SEPARATOR)
+    if not line.startswith('**') and not line.startswith('-'):
+        return Block(TEXT, parse_inline(line))
+    return None
+
+
+def parse_cv_markdown(cv_content):
+    """
+    Analisa o Markdown do currículo em uma única passagem.
+
+    O cabeçalho (nome, cargo e contatos) vai até a primeira seção conhecida;
+    a partir dela, cada **Título** abre uma seção e cada - **Subtítulo** abre
+    um grupo que reúne os blocos seguintes até o próximo subtítulo ou seção.
+
+    Returns:
+        CVDocument
+    """
+    name = None
+    position = None
+    contacts = []
+    sections = []
+
+    in_header = True
+    section_title = None
+    section_items = []
+    group_title = None
+    group_blocks = []
+
+    def close_group():
+        nonlocal group_title, group_blocks
+        if group_title is not None:
+            section_items.append(SubtitleGroup(group_title, tuple(group_blocks)))
+        group_title, group_blocks = None, []
+
+    def close_section():
+        nonlocal section_items
+        close_group()
+        if section_title is not None:
+            sections.append(Section(section_title, section_kind(section_title), tuple(section_items)))
+        section_items = []
+
+    for raw_line in cv_content.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        if in_header:
+            if line.startswith('**') and (name is None or position is None):
+                candidate = _strip_emphasis(line)
+                if _is_header_title(candidate):
+                    if name is None:
+                        name = candidate
+                    else:
+                        position = candidate
+                    continue
+            if _is_section_line(line) and section_kind(_strip_emphasis(line.replace('**', ''))):
+                in_header = False
+            else:
+                contact = _contact_line(line)
+                if contact:
+                    contacts.append(parse_inline(contact))
+                continue
+
+        if _is_section_line(line):
+            title = _UNDERSCORE_EDGES.sub('', line.replace('**', '').strip()).strip()
+            if title:
+                close_section()
+                section_title = title
+            continue
+
+        if line.startswith('- **') and line.endswith('**'):
+            close_group()
+            group_title = parse_inline(line.replace('- **', '').replace('**', '').strip())
+            continue
+
+        block = _classify(line)
+        if block is not None:
+            (group_blocks if group_title is not None else section_items).append(block)
+
+    close_section()
+    return CVDocument(CVHeader(name, position, tuple(contacts)), tuple(sections))
+
+
+_CACHE_MAX_ENTRIES = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_cv_document(cv_content):
+    """parse_cv_markdown com cache (LRU) pelo SHA-256 do conteúdo"""
+    key = hashlib.sha256(cv_content.encode('utf-8')).hexdigest()
+    with _cache_lock:
+        document = _cache.get(key)
+        if document is not None:
+            _cache.move_to_end(key)
+            return document
+    document = parse_cv_markdown(cv_content)
+    with _cache_lock:
+        _cache[key] = document
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return document
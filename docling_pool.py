@@ -0,0 +1,303 @@
+"""
+Pool de processos com conversores do docling já inicializados.
+
+Criar um DocumentConverter recarrega os modelos de layout a cada documento.
+Aqui cada worker cria o conversor uma única vez e atende as conversões
+enfileiradas pelo processo principal. Os workers são reciclados após N documentos ou quando a
+memória (RSS) passa do teto configurado, e rodam fora do processo do
+Streamlit: o crescimento de memória do docling não derruba o app.
+"""
+
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+DOCLING_WORKERS = int(os.getenv("DOCLING_WORKERS", "1"))
+DOCLING_MAX_DOCS_PER_WORKER = int(os.getenv("DOCLING_MAX_DOCS_PER_WORKER", "50"))
+DOCLING_MAX_RSS_MB = int(os.getenv("DOCLING_MAX_RSS_MB", "4096"))
+DOCLING_TIMEOUT = float(os.getenv("DOCLING_TIMEOUT", "600"))
+
+
+class DoclingError(RuntimeError):
+    """Falha na conversão de um documento (ou morte do worker durante a conversão)"""
+
+
+def _create_converter():
+    """Conversor padrão: DocumentConverter do docling exportando markdown"""
+    from docling.document_converter import DocumentConverter
+    converter = DocumentConverter()
+    return lambda file_path: converter.convert(file_path).document.export_to_markdown()
+
+
+def _rss_bytes():
+    """Memória residente do processo atual (0 se não for possível medir)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _worker_main(worker_id, tasks, results, converter_factory, max_docs, max_rss_bytes):
+    """Loop do worker: inicializa o conversor uma vez e atende sua fila até ser reciclado"""
+    try:
+        convert = converter_factory()
+    except Exception as e:
+        results.put(("failed", worker_id, None, f"{type(e).__name__}: {e}", None))
+        return
+    results.put(("ready", worker_id, None, None, None))
+
+    converted = 0
+    while True:
+        job = tasks.get()
+        if job is None:
+            return
+        job_id, file_path = job
+        try:
+            kind, payload = "done", convert(file_path)
+        except Exception as e:
+            kind, payload = "error", f"{type(e).__name__}: {e}"
+
+        converted += 1
+        retire = None
+        if converted >= max_docs:
+            retire = f"{converted} documentos"
+        elif max_rss_bytes and _rss_bytes() > max_rss_bytes:
+            retire = "teto de memória"
+        results.put((kind, worker_id, job_id, payload, retire))
+        if retire:
+            return
+
+
+class DoclingPool:
+    """
+    Workers do docling atendendo uma fila de conversões.
+
+    O processo principal mantém a fila e entrega cada documento a um worker
+    ocioso, então sempre sabe qual conversão cada worker está fazendo: se o
+    worker morrer (ex.: falta de memória), só aquela conversão falha.
+
+    Args:
+        workers: Quantidade de processos
+        max_docs_per_worker: Documentos convertidos antes de reciclar o worker
+        max_rss_mb: Teto de memória (MB) a partir do qual o worker é reciclado (0 = sem teto)
+        converter_factory: Função (importável) que cria o conversor no worker e
+            retorna um callable caminho -> markdown
+    """
+
+    def __init__(self, workers=DOCLING_WORKERS, max_docs_per_worker=DOCLING_MAX_DOCS_PER_WORKER,
+                 max_rss_mb=DOCLING_MAX_RSS_MB, converter_factory=_create_converter):
+        self.workers = max(1, workers)
+        self.max_docs_per_worker = max(1, max_docs_per_worker)
+        self.max_rss_bytes = max(0, max_rss_mb) * 1024 * 1024
+        self.converter_factory = converter_factory
+        self.recycled = 0
+
+        # spawn: o worker não herda threads nem o estado do Streamlit
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._worker_ids = itertools.count()
+        self._backlog = deque()   # (job_id, caminho) aguardando worker
+        self._pending = {}        # job_id -> Future
+        self._workers = {}        # worker_id -> (Process, fila de tarefas)
+        self._idle = set()        # workers prontos e sem conversão
+        self._in_flight = {}      # worker_id -> job_id
+        self._closed = False
+        self._init_error = None
+
+        with self._lock:
+            for _ in range(self.workers):
+                self._spawn_worker()
+        self._collector = threading.Thread(target=self._collect, name="docling-pool", daemon=True)
+        self._collector.start()
+
+    def _spawn_worker(self):
+        """Inicia um worker (chamado com o lock)"""
+        worker_id = next(self._worker_ids)
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, tasks, self._results, self.converter_factory,
+                  self.max_docs_per_worker, self.max_rss_bytes),
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = (process, tasks)
+
+    def _dispatch(self):
+        """Entrega a fila aos workers ociosos (chamado com o lock)"""
+        while self._backlog and self._idle:
+            worker_id = self._idle.pop()
+            job_id, file_path = self._backlog.popleft()
+            self._in_flight[worker_id] = job_id
+            self._workers[worker_id][1].put((job_id, file_path))
+
+    def submit(self, file_path):
+        """Enfileira a conversão e retorna um Future com o markdown"""
+        return self._submit(file_path)[1]
+
+    def _submit(self, file_path):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise DoclingError("Pool do docling encerrado")
+            if not self._workers:
+                raise DoclingError(f"Falha ao inicializar o docling: {self._init_error}")
+            job_id = next(self._job_ids)
+            self._pending[job_id] = future
+            self._backlog.append((job_id, os.path.abspath(file_path)))
+            self._dispatch()
+        return job_id, future
+
+    def convert(self, file_path, timeout=DOCLING_TIMEOUT):
+        """
+        Converte o documento em markdown (bloqueia até o resultado).
+
+        Raises:
+            TimeoutError: Se passar de timeout; o worker travado na conversão é encerrado e substituído
+        """
+        job_id, future = self._submit(file_path)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._abandon(job_id)
+            raise
+
+    def _abandon(self, job_id):
+        """Descarta uma conversão que passou do prazo, encerrando o worker que a fazia"""
+        with self._lock:
+            self._pending.pop(job_id, None)
+            queued = [job for job in self._backlog if job[0] == job_id]
+            for job in queued:
+                self._backlog.remove(job)
+            worker_id = next((wid for wid, jid in self._in_flight.items() if jid == job_id), None)
+            process = self._workers[worker_id][0] if worker_id in self._workers else None
+        if process is None:
+            return
+        # O worker não atende mais ninguém enquanto não terminar: mata e respawna pelo caminho da reciclagem
+        process.terminate()
+        self._remove_worker(worker_id, respawn=True)
+
+    def _resolve(self, job_id, result=None, error=None):
+        with self._lock:
+            future = self._pending.pop(job_id, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(DoclingError(error))
+        else:
+            future.set_result(result)
+
+    def _remove_worker(self, worker_id, respawn):
+        """
+        Remove um worker reciclado, morto ou que não inicializou.
+        Falha a conversão que ele fazia e, se pedido, inicia um substituto.
+        """
+        with self._lock:
+            entry = self._workers.pop(worker_id, None)
+            job_id = self._in_flight.pop(worker_id, None)
+            self._idle.discard(worker_id)
+            if entry is not None and respawn and not self._closed:
+                self.recycled += 1
+                self._spawn_worker()
+            orphaned = []
+            if not self._workers:
+                # Nenhum worker restante (o conversor não inicializa): falha o que está na fila
+                orphaned = [queued_job_id for queued_job_id, _ in self._backlog]
+                self._backlog.clear()
+        if entry is None:
+            return
+        process = entry[0]
+        process.join(timeout=5)
+        if job_id is not None:
+            self._resolve(job_id, error=f"Worker do docling encerrado durante a conversão (exit code {process.exitcode})")
+        for queued_job_id in orphaned:
+            self._resolve(queued_job_id, error=f"Falha ao inicializar o docling: {self._init_error}")
+
+    def _collect(self):
+        """Thread que recebe os resultados dos workers e monitora processos mortos"""
+        while True:
+            try:
+                kind, worker_id, job_id, payload, retire = self._results.get(timeout=1)
+            except queue.Empty:
+                if self._closed:
+                    return
+                with self._lock:
+                    dead = [wid for wid, (process, _) in self._workers.items() if not process.is_alive()]
+                for wid in dead:
+                    self._remove_worker(wid, respawn=True)
+                continue
+            except (EOFError, OSError):
+                return
+
+            if kind in ("done", "error"):
+                with self._lock:
+                    self._in_flight.pop(worker_id, None)
+                if kind == "done":
+                    self._resolve(job_id, result=payload)
+                else:
+                    self._resolve(job_id, error=payload)
+
+            if kind == "failed":
+                # Não respawna em loop se o conversor não pode ser criado
+                self._init_error = payload
+                self._remove_worker(worker_id, respawn=False)
+            elif retire:
+                self._remove_worker(worker_id, respawn=True)
+            else:
+                with self._lock:
+                    if worker_id in self._workers:
+                        self._idle.add(worker_id)
+                        self._dispatch()
+
+    def shutdown(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+            pending = list(self._pending)
+            self._backlog.clear()
+        for _, tasks in workers:
+            tasks.put(None)
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for job_id in pending:
+            self._resolve(job_id, error="Pool do docling encerrado")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_docling_pool():
+    """Pool compartilhado pelo processo, criado na primeira conversão"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DoclingPool()
+        return _pool
+
+
+@atexit.register
+def shutdown_docling_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
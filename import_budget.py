@@ -0,0 +1,95 @@
+"""
+Mede o tempo de import dos módulos de entrada (python -X importtime) e
+compara com o orçamento de cold start.
+
+Cenários:
+    app: import de utils_proj03 com o Streamlit já carregado (como no `streamlit run`)
+    cli: import de batch_triage em um processo novo
+
+Uso:
+    python import_budget.py
+    python import_budget.py --budget-ms 300 --repeat 5 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+SCENARIOS = {
+    "app": ("import streamlit; import utils_proj03", "utils_proj03"),
+    "cli": ("import batch_triage", "batch_triage"),
+}
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(code):
+    """
+    Executa o código em um interpretador novo com -X importtime.
+
+    Returns:
+        list: Tuplas (módulo, nível de aninhamento, cumulativo em µs), na ordem do relatório
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "falha no import")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), (len(match.group(3)) - 1) // 2, int(match.group(2))))
+    return entries
+
+
+def scenario_report(code, module, repeat):
+    """Menor tempo cumulativo do módulo entre as repetições e os imports diretos mais caros"""
+    best = None
+    for _ in range(max(1, repeat)):
+        entries = measure(code)
+        index = next(i for i, (name, level, _) in enumerate(entries) if name == module and level == 0)
+        total = entries[index][2]
+        if best is None or total < best[0]:
+            # Os filhos aparecem antes do pai no relatório, com um nível a mais
+            children = []
+            for name, level, cumulative in reversed(entries[:index]):
+                if level == 0:
+                    break
+                if level == 1:
+                    children.append((name, cumulative))
+            best = (total, sorted(children, key=lambda item: -item[1]))
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Orçamento de tempo de import (cold start)")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Tempo máximo por cenário (ms)")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por cenário (vale a menor)")
+    parser.add_argument("--top", type=int, default=10, help="Imports diretos mais caros a exibir")
+    parser.add_argument("scenarios", nargs="*", help=f"Cenários: {', '.join(SCENARIOS)} (padrão: todos)")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenário desconhecido: {', '.join(sorted(unknown))}")
+
+    over_budget = False
+    for scenario in args.scenarios or list(SCENARIOS):
+        code, module = SCENARIOS[scenario]
+        total, children = scenario_report(code, module, args.repeat)
+        total_ms = total / 1000
+        status = "OK" if total_ms <= args.budget_ms else "ACIMA DO ORÇAMENTO"
+        over_budget |= total_ms > args.budget_ms
+        print(f"[{scenario}] {module}: {total_ms:.0f} ms (orçamento {args.budget_ms:.0f} ms) - {status}")
+        for name, cumulative in children[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Cache persistente (SQLite) das respostas do LLM.
+
+A chave é o SHA-256 do texto do template de prompt, do modelo, da temperatura
+e de todas as variáveis de entrada. Só faz sentido reutilizar uma resposta
+quando a geração é determinística, por isso o cache só é consultado quando o
+modelo roda com temperatura 0 (ver is_deterministic).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+DEFAULT_MAX_AGE_SECONDS = int(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+
+
+def llm_model_name(llm):
+    """Nome do modelo configurado no cliente LangChain"""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def llm_temperature(llm):
+    return getattr(llm, "temperature", None)
+
+
+def is_deterministic(llm):
+    """True quando o modelo roda com temperatura 0 (modo determinístico)"""
+    temperature = llm_temperature(llm)
+    return temperature is not None and float(temperature) == 0.0
+
+
+def prompt_template_text(prompt_template):
+    """Texto bruto de todas as mensagens do template (usado na chave do cache)"""
+    parts = []
+    for message in getattr(prompt_template, "messages", [prompt_template]):
+        prompt = getattr(message, "prompt", None)
+        parts.append(getattr(prompt, "template", None) or getattr(message, "template", None) or repr(message))
+    return "\n".join(parts)
+
+
+def make_cache_key(prompt_template, llm, inputs, options=None):
+    """Chave da resposta; options são parâmetros extras da chamada (ex.: response_format)"""
+    payload = {
+        "prompt": prompt_template_text(prompt_template),
+        "model": llm_model_name(llm),
+        "temperature": llm_temperature(llm),
+        "inputs": inputs,
+    }
+    if options:
+        payload["options"] = options
+    payload = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Cache de respostas endereçado por conteúdo.
+
+    Args:
+        path: Arquivo SQLite
+        max_entries: Quantidade máxima de respostas guardadas (LRU)
+        max_age_seconds: Idade máxima de uma resposta antes de ser descartada
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT NOT NULL,
+                metadata TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Retorna {"content", "metadata"} ou None (contabiliza acerto/falha)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds and now - row[2] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return {"content": row[0], "metadata": json.loads(row[1]) if row[1] else {}}
+
+    def put(self, key, content, model=None, metadata=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, content, metadata, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, json.dumps(metadata or {}, default=str), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        if self.max_age_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age_seconds,))
+        if self.max_entries:
+            self._conn.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Instância compartilhada pelo processo (ou None se desabilitada via LLM_CACHE_ENABLED=0)"""
+    global _default_cache
+    if os.getenv("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
@@ -0,0 +1,150 @@
+"""
+Registro de clientes do LLM compartilhado pelo processo.
+
+O app chama load_llm a cada rerun de cada sessão do Streamlit. Aqui os
+modelos ficam registrados por (modelo, temperatura, opções) e todos usam o
+mesmo cliente HTTP, com pool de conexões limitado, keep-alive (e HTTP/2 se o
+pacote h2 estiver instalado) e timeout explícito: chamadas seguintes
+reaproveitam as conexões TLS já abertas.
+
+O cliente assíncrono do httpx fica preso ao event loop em que as conexões
+foram abertas. Por isso os caminhos assíncronos usam for_running_loop, que
+mantém um cliente por loop; o app e a CLI rodam as corrotinas no loop de fundo
+de run_async (utils_proj03), então na prática há um único cliente assíncrono,
+reaproveitado entre operações.
+"""
+
+import os
+import threading
+import weakref
+from importlib.util import find_spec
+
+# Timeout total de uma requisição ao LLM e da abertura da conexão (segundos)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+# Pool de conexões HTTP compartilhado
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# Novas tentativas por chamada (feitas pelo agendador, não pelo SDK)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
+
+def _http_settings():
+    import httpx
+    return {
+        "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+def _registry_key(model, temperature, options):
+    return (model, float(temperature), tuple(sorted(options.items())))
+
+
+class LLMClientRegistry:
+    """
+    Modelos ChatGroq compartilhados, um por (modelo, temperatura, opções).
+
+    Todos usam o mesmo httpx.Client (seguro entre threads/sessões). Os
+    clientes assíncronos são criados por event loop em for_running_loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._models = {}      # chave -> ChatGroq
+        self._keys = {}        # id(ChatGroq) -> chave
+        self._loop_models = weakref.WeakKeyDictionary()  # loop -> {chave: ChatGroq}
+
+    def _sync_client(self):
+        """Cliente HTTP compartilhado (chamado com o lock)"""
+        if self._http_client is None:
+            import httpx
+            self._http_client = httpx.Client(**_http_settings())
+        return self._http_client
+
+    def _create(self, key, http_async_client=None):
+        from langchain_groq import ChatGroq
+        model, temperature, options = key
+        # As novas tentativas ficam com o agendador (llm_scheduler.py), que vê os 429 e honra o retry-after
+        params = {"max_tokens": None, "timeout": _http_settings()["timeout"], "max_retries": 0}
+        params.update(options)
+        return ChatGroq(
+            model=model,
+            temperature=temperature,
+            http_client=self._sync_client(),
+            http_async_client=http_async_client,
+            **params,
+        )
+
+    def get(self, model, temperature, **options):
+        """
+        Retorna o modelo registrado, criando-o na primeira chamada.
+
+        Args:
+            model: Identificador do modelo
+            temperature: Temperatura
+            **options: Outros parâmetros do ChatGroq (max_tokens, max_retries, timeout, ...)
+        """
+        key = _registry_key(model, temperature, options)
+        with self._lock:
+            llm = self._models.get(key)
+            if llm is None:
+                llm = self._create(key)
+                self._models[key] = llm
+                self._keys[id(llm)] = key
+            return llm
+
+    def for_running_loop(self, llm):
+        """
+        Versão do modelo cujo cliente assíncrono pertence ao event loop atual.
+
+        Modelos que não vieram do registro (ex.: modelos falsos em testes) são
+        retornados sem alteração.
+        """
+        import asyncio
+        key = self._keys.get(id(llm))
+        if key is None:
+            return llm
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            models = self._loop_models.get(loop)
+            if models is None:
+                models = {}
+                self._loop_models[loop] = models
+            bound = models.get(key)
+            if bound is None:
+                import httpx
+                bound = self._create(key, http_async_client=httpx.AsyncClient(**_http_settings()))
+                models[key] = bound
+            return bound
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            self._models.clear()
+            self._keys.clear()
+            self._loop_models = weakref.WeakKeyDictionary()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry():
+    """Registro compartilhado pelo processo (todas as sessões do Streamlit)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMClientRegistry()
+        return _registry
@@ -0,0 +1,471 @@
+"""
+Agendador central das chamadas ao LLM.
+
+Todas as chamadas (invoke_chain, ainvoke_chain e stream_chain, de todas as
+sessões do Streamlit e das threads/loops da CLI) pedem uma vaga a este
+agendador antes de ir ao provedor. A vaga respeita:
+
+- o orçamento por minuto de requisições e de tokens (baldes de fichas,
+  LLM_REQUESTS_PER_MINUTE e LLM_TOKENS_PER_MINUTE), acertado com os tokens
+  efetivamente consumidos ao final de cada chamada;
+- o limite de chamadas simultâneas, ajustado por AIMD: cresce uma unidade a
+  cada "janela" de chamadas bem-sucedidas e cai pela metade a cada rajada
+  de 429 (até LLM_MAX_CONCURRENCY);
+- as pausas pedidas pelo provedor (cabeçalhos retry-after/retry-after-ms
+  dos 429), que valem para o processo todo;
+- as faixas de prioridade: chamadas interativas (upload e análise no app)
+  passam à frente das chamadas em lote (matriz, CLI) que ainda estão na
+  fila, e LLM_INTERACTIVE_RESERVE vagas ficam fora do alcance do lote.
+
+As novas tentativas (429, 408/409, 5xx e falhas de conexão) são feitas aqui,
+e não pelo SDK (max_retries=0 no registro de clientes): assim o 429 chega ao
+AIMD e a espera não ocupa uma vaga.
+"""
+
+import asyncio
+import contextvars
+import email.utils
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from llm_clients import LLM_MAX_RETRIES
+
+# Limite (teto do AIMD) e piso de chamadas simultâneas ao LLM
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+# Orçamento por minuto da conta no provedor (0 = sem limite)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Vagas reservadas às chamadas interativas
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+# Fator de redução do limite a cada rajada de 429
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", "0.5"))
+# Espera base (segundos, dobrada a cada tentativa) quando o provedor não informa retry-after
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "60"))
+# Tokens de saída previstos por chamada, somados à entrada na reserva do balde de tokens
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1500"))
+
+LANE_INTERACTIVE = 0
+LANE_BATCH = 1
+LANE_NAMES = {LANE_INTERACTIVE: "interactive", LANE_BATCH: "batch"}
+
+# Mesmos status que o SDK repetiria
+RETRYABLE_STATUS = {408, 409, 429}
+
+_lane = contextvars.ContextVar("llm_lane", default=LANE_INTERACTIVE)
+
+
+def set_llm_lane(lane):
+    """Faixa de prioridade das próximas chamadas do contexto atual (LANE_INTERACTIVE ou LANE_BATCH)"""
+    _lane.set(lane)
+
+
+def current_lane():
+    return _lane.get()
+
+
+@contextmanager
+def llm_lane(lane):
+    """Versão com escopo delimitado de set_llm_lane (tarefas criadas no bloco herdam a faixa)"""
+    token = _lane.set(lane)
+    try:
+        yield lane
+    finally:
+        _lane.reset(token)
+
+
+def estimate_tokens(inputs):
+    """Reserva de tokens de uma chamada: ~4 caracteres por token nas entradas mais a saída prevista"""
+    chars = sum(len(value) if isinstance(value, str) else len(str(value)) for value in (inputs or {}).values())
+    return chars // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _is_connection_error(error):
+    try:
+        import groq
+    except ImportError:
+        return False
+    # APITimeoutError é subclasse de APIConnectionError
+    return isinstance(error, groq.APIConnectionError)
+
+
+def retry_after_seconds(error):
+    """
+    Espera pedida pelo provedor na resposta de erro (retry-after-ms ou
+    retry-after, em segundos ou como data HTTP), ou None se ausente.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    value = headers.get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    date = email.utils.parsedate_tz(value) if value else None
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+class TokenBucket:
+    """Balde de fichas com capacidade por minuto, reposto continuamente (capacidade 0 = sem limite)"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute or 0)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Segundos até haver `amount` fichas no balde (0 = já há)"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # Um pedido maior que o balde inteiro espera o balde cheio, em vez de nunca passar
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        if self.capacity:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        """Acerta a reserva pelo consumo real (o saldo pode ficar negativo: a dívida atrasa os próximos)"""
+        if self.capacity:
+            self.level = min(self.capacity, self.level - delta)
+
+
+class Ticket:
+    """Pedido de vaga de uma chamada; depois de concedido, é devolvido com release"""
+
+    __slots__ = ("lane", "tokens", "enqueued_at", "granted_at", "released", "cancelled", "_grant")
+
+    def __init__(self, lane, tokens, grant):
+        self.lane = lane
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.released = False
+        self.cancelled = False
+        self._grant = grant
+
+    @property
+    def wait_ms(self):
+        """Tempo na fila do agendador até a vaga ser concedida"""
+        return (self.granted_at - self.enqueued_at) * 1000 if self.granted_at is not None else None
+
+
+class LLMScheduler:
+    """
+    Fila de prioridade das chamadas ao LLM com baldes de fichas e limite AIMD.
+
+    Seguro entre threads e event loops: uma thread de despacho concede as
+    vagas, acordando chamadas síncronas (threading.Event) e assíncronas
+    (future do loop de cada chamada).
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, interactive_reserve=LLM_INTERACTIVE_RESERVE,
+                 min_concurrency=LLM_MIN_CONCURRENCY, max_retries=LLM_MAX_RETRIES):
+        self._cond = threading.Condition()
+        self._queue = []  # heap (faixa, ordem de chegada, Ticket)
+        self._order = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._thread = None
+        self.max_retries = max_retries
+        self.configure(max_concurrency, requests_per_minute, tokens_per_minute, min_concurrency, interactive_reserve)
+        self.reset_stats()
+
+    def configure(self, max_concurrency=None, requests_per_minute=None, tokens_per_minute=None, min_concurrency=None,
+                  interactive_reserve=None):
+        """Redefine o teto do AIMD (o limite volta ao teto), os orçamentos por minuto e/ou a reserva interativa"""
+        with self._cond:
+            if max_concurrency is not None:
+                self.max_concurrency = max(1, int(max_concurrency))
+                self.limit = float(self.max_concurrency)
+            if min_concurrency is not None:
+                self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+            if requests_per_minute is not None:
+                self._requests = TokenBucket(requests_per_minute)
+            if tokens_per_minute is not None:
+                self._tokens = TokenBucket(tokens_per_minute)
+            if interactive_reserve is not None:
+                self.interactive_reserve = max(0, int(interactive_reserve))
+            self._cond.notify()
+
+    def reset_stats(self):
+        with self._cond:
+            self._stats = {
+                "granted": {name: 0 for name in LANE_NAMES.values()},
+                "wait_ms": {name: 0.0 for name in LANE_NAMES.values()},
+                "rate_limited": 0,
+                "retries": 0,
+                "errors": 0,
+            }
+
+    # ----- despacho -----
+
+    def _lane_limit(self, lane):
+        limit = max(self.min_concurrency, int(self.limit))
+        if lane == LANE_INTERACTIVE:
+            return limit
+        return max(1, limit - self.interactive_reserve)
+
+    def _dispatch(self, now):
+        """
+        Concede vagas na ordem (faixa, chegada) enquanto possível (com o lock).
+
+        Returns:
+            float: Segundos até uma nova tentativa (pausa ou balde vazio), ou None para esperar um evento
+        """
+        while self._queue:
+            lane, _, ticket = self._queue[0]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self._paused_until > now:
+                return self._paused_until - now
+            if self._in_flight >= self._lane_limit(lane):
+                return None
+            wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(ticket.tokens, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self._requests.take(1, now)
+            self._tokens.take(ticket.tokens, now)
+            ticket.granted_at = now
+            if not ticket._grant():
+                # O event loop da chamada já foi encerrado: a vaga volta ao agendador
+                ticket.released = True
+                self._requests.adjust(-1)
+                self._tokens.adjust(-ticket.tokens)
+                continue
+            self._in_flight += 1
+            name = LANE_NAMES.get(lane, str(lane))
+            self._stats["granted"][name] = self._stats["granted"].get(name, 0) + 1
+            self._stats["wait_ms"][name] = self._stats["wait_ms"].get(name, 0.0) + ticket.wait_ms
+        return None
+
+    def _run_dispatcher(self):
+        with self._cond:
+            while True:
+                timeout = self._dispatch(time.monotonic())
+                self._cond.wait(timeout)
+
+    def _enqueue(self, ticket):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_dispatcher, name="llm-scheduler", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._queue, (ticket.lane, next(self._order), ticket))
+            self._cond.notify()
+
+    # ----- vagas -----
+
+    def acquire(self, tokens=0, lane=None):
+        """Espera (bloqueando a thread) e retorna a vaga de uma chamada"""
+        event = threading.Event()
+
+        def grant():
+            event.set()
+            return True
+
+        ticket = Ticket(current_lane() if lane is None else lane, tokens, grant)
+        self._enqueue(ticket)
+        event.wait()
+        return ticket
+
+    async def aacquire(self, tokens=0, lane=None):
+        """Versão assíncrona de acquire (não bloqueia o event loop)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        def grant():
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                return False
+            return True
+
+        ticket = Ticket(current_lane() if lane is None else lane, tokens, grant)
+        self._enqueue(ticket)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._cond:
+                granted = ticket.granted_at is not None
+                ticket.cancelled = True
+            if granted:
+                self.release(ticket, cancelled=True)
+            raise
+        return ticket
+
+    def release(self, ticket, error=None, used_tokens=None, attempt=0, cancelled=False):
+        """
+        Devolve a vaga e registra o resultado da chamada no AIMD.
+
+        Args:
+            error: Exceção da chamada (None = sucesso)
+            used_tokens: Tokens consumidos de fato, para acertar o balde de tokens
+            attempt: Número da tentativa (0 = primeira)
+            cancelled: Chamada interrompida sem resultado (não mexe no limite)
+
+        Returns:
+            float: Segundos a esperar antes de tentar de novo (0 se a pausa já é do
+            agendador), ou None se a chamada não deve ser repetida
+        """
+        with self._cond:
+            if ticket.released:
+                return None
+            ticket.released = True
+            self._in_flight -= 1
+            now = time.monotonic()
+            if used_tokens is not None:
+                self._tokens.adjust(used_tokens - ticket.tokens)
+            delay = None
+            if cancelled:
+                pass
+            elif error is None:
+                # Aumento aditivo: ~+1 a cada `limit` chamadas bem-sucedidas
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            else:
+                self._stats["errors"] += 1
+                status = _status_code(error)
+                if status == 429:
+                    self._stats["rate_limited"] += 1
+                    wait = retry_after_seconds(error)
+                    if wait is None:
+                        wait = LLM_RETRY_BACKOFF * 2 ** attempt
+                    # O limite do provedor é da conta: pausa todas as chamadas do processo
+                    self._paused_until = max(self._paused_until, now + min(wait, LLM_RETRY_MAX_WAIT))
+                    # Redução multiplicativa uma vez por rajada: 429 de chamadas liberadas
+                    # antes da última redução não reduzem de novo
+                    if ticket.granted_at >= self._last_decrease:
+                        self.limit = max(float(self.min_concurrency), self.limit * LLM_AIMD_DECREASE)
+                        self._last_decrease = now
+                    delay = 0.0
+                elif status in RETRYABLE_STATUS or (status or 0) >= 500 or _is_connection_error(error):
+                    delay = min(LLM_RETRY_BACKOFF * 2 ** attempt, LLM_RETRY_MAX_WAIT)
+                if delay is not None:
+                    if attempt >= self.max_retries:
+                        delay = None
+                    else:
+                        self._stats["retries"] += 1
+            self._cond.notify()
+            return delay
+
+    def run(self, fn, tokens=0, usage=None, lane=None):
+        """
+        Executa fn() com uma vaga, repetindo nos erros transitórios.
+
+        Args:
+            fn: Função sem argumentos que faz a chamada
+            tokens: Reserva de tokens (ver estimate_tokens)
+            usage: Função resultado -> tokens consumidos (opcional)
+
+        Returns:
+            tuple: (resultado, Ticket da tentativa que deu certo)
+        """
+        for attempt in itertools.count():
+            ticket = self.acquire(tokens, lane)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self.release(ticket, error=e, attempt=attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.release(ticket, cancelled=True)
+                raise
+            self.release(ticket, used_tokens=usage(result) if usage else None)
+            return result, ticket
+
+    async def arun(self, coro_fn, tokens=0, usage=None, lane=None):
+        """Versão assíncrona de run (coro_fn retorna uma corrotina nova a cada tentativa)"""
+        for attempt in itertools.count():
+            ticket = await self.aacquire(tokens, lane)
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                delay = self.release(ticket, error=e, attempt=attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release(ticket, cancelled=True)
+                raise
+            self.release(ticket, used_tokens=usage(result) if usage else None)
+            return result, ticket
+
+    def stats(self):
+        """
+        Estado atual e contadores do agendador.
+
+        Returns:
+            dict: limit, max_concurrency, in_flight, waiting (por faixa), paused_s,
+            granted e mean_wait_ms (por faixa), rate_limited, retries e errors
+        """
+        with self._cond:
+            waiting = {name: 0 for name in LANE_NAMES.values()}
+            for lane, _, ticket in self._queue:
+                if not ticket.cancelled:
+                    name = LANE_NAMES.get(lane, str(lane))
+                    waiting[name] = waiting.get(name, 0) + 1
+            granted = dict(self._stats["granted"])
+            return {
+                "limit": round(self.limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "waiting": waiting,
+                "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 3),
+                "granted": granted,
+                "mean_wait_ms": {name: round(self._stats["wait_ms"][name] / count, 3) if count else 0.0
+                                 for name, count in granted.items()},
+                "rate_limited": self._stats["rate_limited"],
+                "retries": self._stats["retries"],
+                "errors": self._stats["errors"],
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler():
+    """Agendador compartilhado pelo processo (todas as sessões do Streamlit)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
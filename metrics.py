@@ -0,0 +1,450 @@
+"""
+Instrumentação por etapa do pipeline (spans), histogramas e exportação.
+
+Cada etapa (parse do PDF, chamada ao LLM, leitura do JSON, gravação no
+banco, geração de PDF/DOCX...) é medida com span/timed. Os spans são
+gravados em um arquivo JSONL com rotação, agregados em histogramas por
+etapa (exportáveis no formato texto do Prometheus, em arquivo ou por HTTP)
+e guardados por sessão do Streamlit para o painel de desempenho.
+
+A sessão e o span pai seguem o contexto (contextvars), então chegam às
+corrotinas e às threads de asyncio.to_thread sem serem passados adiante.
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Arquivo JSONL com um span por linha ("" = não grava) e sua rotação
+METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH", "traces.jsonl")
+METRICS_TRACE_MAX_BYTES = int(os.getenv("METRICS_TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+METRICS_TRACE_BACKUPS = int(os.getenv("METRICS_TRACE_BACKUPS", "3"))
+# Exportação no formato texto do Prometheus: arquivo (reescrito a cada intervalo) e/ou porta HTTP (/metrics)
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH", "")
+METRICS_PROMETHEUS_INTERVAL = float(os.getenv("METRICS_PROMETHEUS_INTERVAL", "10"))
+METRICS_PROMETHEUS_PORT = int(os.getenv("METRICS_PROMETHEUS_PORT", "0"))
+# Spans recentes mantidos por sessão (painel do app) e sessões mantidas
+METRICS_SESSION_MAX_SPANS = int(os.getenv("METRICS_SESSION_MAX_SPANS", "500"))
+METRICS_MAX_SESSIONS = int(os.getenv("METRICS_MAX_SESSIONS", "100"))
+
+# Limites dos buckets dos histogramas (ms)
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+_session = contextvars.ContextVar("metrics_session", default=None)
+_parent = contextvars.ContextVar("metrics_parent", default=None)  # (id, etapa) do span aberto
+
+
+def set_session(session_id):
+    """Associa os próximos spans do contexto atual à sessão (ex.: sessão do Streamlit)"""
+    _session.set(session_id)
+
+
+def current_session():
+    return _session.get()
+
+
+def current_stage(default=None):
+    """Etapa do span aberto mais interno no contexto atual (ex.: "process_cv")"""
+    parent = _parent.get()
+    return parent[1] if parent is not None else default
+
+
+def run_in_session(session_id, fn, *args, **kwargs):
+    """Executa fn em uma cópia do contexto associada à sessão (ex.: callbacks fora do script)"""
+    def run():
+        _session.set(session_id)
+        return fn(*args, **kwargs)
+    return contextvars.copy_context().run(run)
+
+
+# ============================================
+# Histogramas
+# ============================================
+
+class Histogram:
+    """Contagens por bucket (ms), soma, total e erros de uma etapa"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.errors = 0
+
+    def observe(self, duration_ms, error=False):
+        index = 0
+        while index < len(BUCKETS_MS) and duration_ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Estimativa do quantil por interpolação linear dentro do bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS_MS[index - 1] if index else 0.0
+                upper = BUCKETS_MS[index] if index < len(BUCKETS_MS) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return float(BUCKETS_MS[-1])
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+# ============================================
+# Registro
+# ============================================
+
+class MetricsRegistry:
+    """
+    Agrega os spans do processo: histogramas por etapa, spans recentes por
+    sessão, arquivo JSONL com rotação e exportação para o Prometheus.
+    """
+
+    def __init__(self, trace_path=METRICS_TRACE_PATH, prometheus_path=METRICS_PROMETHEUS_PATH):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._sessions = OrderedDict()  # sessão -> spans recentes (as menos ativas saem primeiro)
+        self._trace_path = trace_path
+        self._trace_logger = None
+        self._pending = queue.SimpleQueue()  # spans ainda não gravados no JSONL
+        self._writer = None
+        self._prometheus_path = prometheus_path
+        self._prometheus_written = 0.0
+        self._server = None
+
+    def _trace(self):
+        """Logger dedicado com RotatingFileHandler (criado no primeiro span)"""
+        if self._trace_logger is None and self._trace_path:
+            from logging.handlers import RotatingFileHandler
+            trace_logger = logging.getLogger(f"{__name__}.trace.{id(self)}")
+            trace_logger.propagate = False
+            trace_logger.setLevel(logging.INFO)
+            try:
+                handler = RotatingFileHandler(self._trace_path, maxBytes=METRICS_TRACE_MAX_BYTES,
+                                              backupCount=METRICS_TRACE_BACKUPS, encoding="utf-8", delay=True)
+            except OSError:
+                self._trace_path = ""
+                return None
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            trace_logger.addHandler(handler)
+            self._trace_logger = trace_logger
+        return self._trace_logger
+
+    def record(self, span):
+        """Registra um span finalizado (dict com stage, duration_ms, status, session...)"""
+        with self._lock:
+            histogram = self._histograms.get(span["stage"])
+            if histogram is None:
+                histogram = self._histograms[span["stage"]] = Histogram()
+            histogram.observe(span["duration_ms"], span["status"] != "ok")
+            if span.get("session") is not None:
+                recent = self._sessions.get(span["session"])
+                if recent is None:
+                    recent = self._sessions[span["session"]] = deque(maxlen=METRICS_SESSION_MAX_SPANS)
+                    while len(self._sessions) > METRICS_MAX_SESSIONS:
+                        self._sessions.popitem(last=False)
+                self._sessions.move_to_end(span["session"])
+                recent.append(span)
+            if self._trace_path and self._writer is None:
+                self._writer = threading.Thread(target=self._write_traces, name="metrics-trace", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        if self._trace_path:
+            # A serialização e a escrita ficam com a thread de gravação, fora da etapa medida
+            self._pending.put(span)
+        if self._prometheus_path and time.monotonic() - self._prometheus_written >= METRICS_PROMETHEUS_INTERVAL:
+            self.write_prometheus(self._prometheus_path)
+
+    def _write_traces(self):
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        trace_logger = self._trace()
+        if trace_logger is None:
+            return
+        for span in batch:
+            trace_logger.info(json.dumps(span, ensure_ascii=False, default=str))
+
+    def flush(self):
+        """Grava no JSONL os spans ainda pendentes (chamado também ao encerrar o processo)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        self._write_batch(batch)
+
+    def snapshot(self):
+        """Resumo por etapa de todo o processo (quantis estimados pelos histogramas)"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": h.count,
+                    "errors": h.errors,
+                    "total_ms": round(h.sum_ms, 3),
+                    "mean_ms": round(h.sum_ms / h.count, 3) if h.count else 0.0,
+                    "p50_ms": round(h.quantile(0.5), 3),
+                    "p95_ms": round(h.quantile(0.95), 3),
+                }
+                for stage, h in sorted(self._histograms.items())
+            }
+
+    def session_spans(self, session_id):
+        with self._lock:
+            return list(self._sessions.get(session_id, ()))
+
+    def session_summary(self, session_id):
+        """
+        Resumo por etapa dos spans recentes da sessão (quantis exatos).
+
+        Returns:
+            list: dicts (etapa, chamadas, erros, total, média, p50, p95, máximo), do maior total ao menor
+        """
+        durations = {}
+        errors = {}
+        for span in self.session_spans(session_id):
+            durations.setdefault(span["stage"], []).append(span["duration_ms"])
+            errors[span["stage"]] = errors.get(span["stage"], 0) + (span["status"] != "ok")
+        rows = []
+        for stage, values in durations.items():
+            values.sort()
+            rows.append({
+                "stage": stage,
+                "count": len(values),
+                "errors": errors[stage],
+                "total_ms": round(sum(values), 1),
+                "mean_ms": round(sum(values) / len(values), 1),
+                "p50_ms": round(_percentile(values, 0.5), 1),
+                "p95_ms": round(_percentile(values, 0.95), 1),
+                "max_ms": round(values[-1], 1),
+            })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def clear_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def render_prometheus(self):
+        """Histogramas no formato texto de exposição do Prometheus (segundos)"""
+        lines = [
+            "# HELP lang_rh_stage_duration_seconds Duração das etapas do pipeline",
+            "# TYPE lang_rh_stage_duration_seconds histogram",
+        ]
+        errors = []
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                label = stage.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS, h.counts):
+                    cumulative += count
+                    lines.append(f'lang_rh_stage_duration_seconds_bucket{{stage="{label}",le="{bound / 1000:g}"}} {cumulative}')
+                lines.append(f'lang_rh_stage_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {h.count}')
+                lines.append(f'lang_rh_stage_duration_seconds_sum{{stage="{label}"}} {h.sum_ms / 1000:.6f}')
+                lines.append(f'lang_rh_stage_duration_seconds_count{{stage="{label}"}} {h.count}')
+                errors.append(f'lang_rh_stage_errors_total{{stage="{label}"}} {h.errors}')
+        lines += ["# HELP lang_rh_stage_errors_total Etapas encerradas com exceção",
+                  "# TYPE lang_rh_stage_errors_total counter"] + errors
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Grava o texto do Prometheus (troca atômica, para o node_exporter textfile collector)"""
+        self._prometheus_written = time.monotonic()
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except OSError:
+            logging.getLogger(__name__).warning("Não foi possível gravar as métricas em %s", path, exc_info=True)
+
+    def serve_prometheus(self, port, host="0.0.0.0"):
+        """Expõe GET /metrics em uma thread daemon (uma vez por processo)"""
+        with self._lock:
+            if self._server is not None:
+                return self._server
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            registry = self
+
+            class _Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = registry.render_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError:
+                logging.getLogger(__name__).warning("Porta %s indisponível para as métricas", port, exc_info=True)
+                return None
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            return self._server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Registro de métricas compartilhado pelo processo (todas as sessões do Streamlit)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry()
+            if METRICS_PROMETHEUS_PORT:
+                _metrics.serve_prometheus(METRICS_PROMETHEUS_PORT)
+        return _metrics
+
+
+# ============================================
+# Spans
+# ============================================
+
+class span:
+    """
+    Mede uma etapa: `with span("parse_doc", engine="pymupdf") as s: ...`.
+
+    Atributos podem ser acrescentados durante a etapa (s["cache_hit"] = True).
+    Exceções são registradas (status "error") e relançadas. Spans abertos
+    dentro de outro ficam com o id dele em "parent".
+    """
+
+    __slots__ = ("stage", "attrs", "_id", "_start", "_wall", "_token", "_nest")
+
+    def __init__(self, stage, nest=True, **attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self._nest = nest
+        self._token = None
+
+    def __setitem__(self, key, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self._id = uuid.uuid4().hex[:16]
+        if self._nest:
+            self._token = _parent.set((self._id, self.stage))
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        if self._token is not None:
+            parent = self._token.old_value if self._token.old_value is not contextvars.Token.MISSING else None
+            try:
+                _parent.reset(self._token)
+            except ValueError:
+                # Encerrado em outro contexto (ex.: gerador consumido em outra thread)
+                pass
+        else:
+            parent = _parent.get()
+        parent = parent[0] if parent is not None else None
+        if METRICS_ENABLED:
+            record = {
+                "id": self._id,
+                "parent": parent,
+                "session": _session.get(),
+                "stage": self.stage,
+                "start": round(self._wall, 6),
+                "duration_ms": round(duration_ms, 3),
+                "status": "ok" if exc_type is None else "error",
+            }
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            if self.attrs:
+                record["attrs"] = self.attrs
+            get_metrics().record(record)
+        return False
+
+
+def _resume(s, method, *args):
+    """Avança um gerador medido com o span dele como etapa corrente (current_stage)"""
+    previous = _parent.get()
+    _parent.set((s._id, s.stage))
+    try:
+        return method(*args)
+    finally:
+        _parent.set(previous)
+
+
+def timed(stage):
+    """
+    Decorador que mede cada chamada da função como um span da etapa.
+    Aceita funções comuns, corrotinas e geradores (medidos até o fim da iteração).
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                # O span é o pai só enquanto o gerador executa: entre os itens o
+                # consumidor pode abrir outros spans, que não ficam aninhados nele
+                with span(stage, nest=False) as s:
+                    gen = fn(*args, **kwargs)
+                    try:
+                        item = _resume(s, next, gen)
+                        while True:
+                            try:
+                                sent = yield item
+                            except GeneratorExit:
+                                _resume(s, gen.close)
+                                raise
+                            except BaseException as e:
+                                item = _resume(s, gen.throw, e)
+                            else:
+                                item = _resume(s, gen.send, sent)
+                    except StopIteration as stop:
+                        return stop.value
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
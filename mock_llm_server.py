@@ -0,0 +1,240 @@
+"""
+Servidor local que imita a API de chat do Groq (formato OpenAI) e responde
+429 com retry-after ao passar dos limites configurados, para exercitar o
+agendador das chamadas (llm_scheduler.py) sem a API real.
+
+Uso:
+    # Só o servidor; aponte o app ou a CLI para ele com GROQ_API_BASE
+    python mock_llm_server.py --port 8765 --rpm 60 --max-concurrent 4
+    GROQ_API_BASE=http://127.0.0.1:8765 python batch_triage.py curriculos/
+
+    # Simulação: sobe o servidor, dispara chamadas em lote e, no meio delas,
+    # chamadas interativas pelo ainvoke_chain e mostra os 429, as novas
+    # tentativas, o limite final do AIMD e a espera de cada faixa
+    python mock_llm_server.py --drill --batch 40 --interactive 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATH = "/openai/v1/chat/completions"
+# Resposta fixa (um objeto JSON, válido também no modo JSON)
+MOCK_CONTENT = json.dumps({"ok": True, "source": "mock_llm_server"})
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    API de chat falsa com limite de requisições por minuto (janela deslizante)
+    e de requisições simultâneas; acima deles, ou ao acaso com error_rate,
+    responde 429 como o provedor.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, rpm=60, max_concurrent=4, latency=0.2, error_rate=0.0, seed=0):
+        super().__init__(address, _Handler)
+        self.rpm = rpm
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = deque()
+        self._active = 0
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "peak_concurrent": 0}
+
+    def admit(self):
+        """
+        Reserva a requisição nos limites.
+
+        Returns:
+            float: None se admitida; senão, os segundos do retry-after
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if self.rpm and len(self._window) >= self.rpm:
+                wait = 60 - (now - self._window[0])
+            elif self.max_concurrent and self._active >= self.max_concurrent:
+                wait = self.latency
+            elif self.error_rate and self._rng.random() < self.error_rate:
+                wait = self.latency
+            else:
+                self._window.append(now)
+                self._active += 1
+                self.stats["peak_concurrent"] = max(self.stats["peak_concurrent"], self._active)
+                return None
+            self.stats["rate_limited"] += 1
+            return max(wait, 0.01)
+
+    def done(self):
+        with self._lock:
+            self._active -= 1
+            self.stats["ok"] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != CHAT_PATH:
+            self._send_json(404, {"error": {"message": f"Rota desconhecida: {self.path}", "type": "invalid_request_error"}})
+            return
+        if request.get("stream"):
+            self._send_json(400, {"error": {"message": "Streaming não suportado pelo servidor de teste", "type": "invalid_request_error"}})
+            return
+        wait = self.server.admit()
+        if wait is not None:
+            self._send_json(429, {"error": {
+                "message": f"Rate limit reached for model `{request.get('model')}`. Please try again in {wait:.2f}s.",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }}, headers={"retry-after": f"{wait:.2f}"})
+            return
+        try:
+            time.sleep(self.server.latency)
+            prompt_tokens = sum(len(str(message.get("content", ""))) for message in request.get("messages", [])) // 4
+            completion_tokens = len(MOCK_CONTENT) // 4
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{self.server.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": MOCK_CONTENT},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        finally:
+            self.server.done()
+
+
+def start_server(host="127.0.0.1", port=0, **limits):
+    """Sobe o servidor em uma thread de fundo (port=0 escolhe uma porta livre)"""
+    server = MockLLMServer((host, port), **limits)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+
+def _lane_report(durations):
+    if not durations:
+        return "nenhuma chamada"
+    return f"{len(durations)} chamadas, média {sum(durations) / len(durations):.2f}s, máx. {max(durations):.2f}s"
+
+
+def run_drill(server, args):
+    """Chamadas em lote e interativas contra o servidor, pelo agendador do processo"""
+    from langchain_core.prompts import ChatPromptTemplate
+    from utils_proj03 import LANE_BATCH, LANE_INTERACTIVE, ainvoke_chain, get_llm_scheduler, llm_lane, load_llm, run_async
+
+    # Temperatura acima de 0: as respostas não passam pelo cache
+    llm = load_llm("mock-model", 0.5, base_url=f"http://127.0.0.1:{server.server_port}", api_key="mock")
+    prompt = ChatPromptTemplate.from_template("{text}")
+    scheduler = get_llm_scheduler()
+    scheduler.configure(max_concurrency=args.concurrency, requests_per_minute=args.client_rpm)
+    scheduler.max_retries = args.retries
+
+    async def call(lane, i):
+        with llm_lane(lane):
+            started = time.perf_counter()
+            await ainvoke_chain(prompt, llm, {"text": f"chamada {i}"})
+            return time.perf_counter() - started
+
+    async def drill():
+        batch = [asyncio.create_task(call(LANE_BATCH, i)) for i in range(args.batch)]
+        # As interativas chegam com o lote já na fila
+        await asyncio.sleep(args.interactive_delay)
+        interactive = [asyncio.create_task(call(LANE_INTERACTIVE, i)) for i in range(args.interactive)]
+        return (await asyncio.gather(*batch, return_exceptions=True),
+                await asyncio.gather(*interactive, return_exceptions=True))
+
+    started = time.perf_counter()
+    batch, interactive = run_async(drill())
+    elapsed = time.perf_counter() - started
+    failures = [r for r in batch + interactive if isinstance(r, BaseException)]
+    stats = scheduler.stats()
+    print(f"Simulação em {elapsed:.1f}s")
+    print(f"  Lote: {_lane_report([r for r in batch if not isinstance(r, BaseException)])}")
+    print(f"  Interativas: {_lane_report([r for r in interactive if not isinstance(r, BaseException)])}")
+    print(f"  Servidor: {server.stats['requests']} requisições, {server.stats['rate_limited']} respostas 429, "
+          f"pico de {server.stats['peak_concurrent']} simultâneas")
+    print(f"  Agendador: {stats['retries']} novas tentativas, limite final {stats['limit']:g}/{stats['max_concurrency']}, "
+          f"espera média na fila {stats['mean_wait_ms']}")
+    for error in failures[:5]:
+        print(f"  ERRO: {error!r}", file=sys.stderr)
+    return 0 if not failures else 2
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="API de chat falsa que responde 429 acima dos limites")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=60, help="Requisições por minuto antes do 429 (0 = sem limite)")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="Requisições simultâneas antes do 429 (0 = sem limite)")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Latência de cada resposta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de 429 aleatórios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drill", action="store_true", help="Roda a simulação em vez de só servir")
+    parser.add_argument("--batch", type=int, default=40, help="Chamadas em lote na simulação")
+    parser.add_argument("--interactive", type=int, default=5, help="Chamadas interativas na simulação")
+    parser.add_argument("--interactive-delay", type=float, default=0.5,
+                        help="Segundos entre o início do lote e a chegada das interativas")
+    parser.add_argument("--concurrency", type=int, default=16, help="Teto de concorrência do agendador")
+    parser.add_argument("--client-rpm", type=float, default=0,
+                        help="Orçamento de requisições por minuto do agendador (0 = só reage aos 429)")
+    parser.add_argument("--retries", type=int, default=5, help="Novas tentativas por chamada no agendador")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    limits = {"rpm": args.rpm, "max_concurrent": args.max_concurrent, "latency": args.latency_ms / 1000,
+              "error_rate": args.error_rate, "seed": args.seed}
+    if args.drill:
+        os.environ.setdefault("GROQ_API_KEY", "mock")
+        server = start_server(port=0, **limits)
+        try:
+            return run_drill(server, args)
+        finally:
+            server.shutdown()
+    server = MockLLMServer(("127.0.0.1", args.port), **limits)
+    print(f"Servidor de teste em http://127.0.0.1:{args.port} (GROQ_API_BASE)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
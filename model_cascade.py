@@ -0,0 +1,125 @@
+"""
+Cascata de modelos na triagem: modelo pequeno e rápido primeiro, modelo
+grande só para os casos de fronteira.
+
+O currículo é avaliado pelo modelo rápido; a resposta só sobe para o modelo
+grande quando o JSON não valida (ou vem sem nome/nota) ou quando a nota cai
+na faixa de incerteza, em que um erro do modelo pequeno mudaria a decisão
+de seguir ou não com o candidato. As escaladas e as latências de cada
+modelo são acumuladas aqui para estimar a economia frente a usar sempre o
+modelo grande.
+"""
+
+import os
+import threading
+
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "0") == "1"
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "llama-3.1-8b-instant")
+# Faixa de incerteza da nota do modelo rápido (inclusiva): dentro dela, o modelo grande decide
+CASCADE_BAND_LOW = float(os.getenv("CASCADE_BAND_LOW", "5.0"))
+CASCADE_BAND_HIGH = float(os.getenv("CASCADE_BAND_HIGH", "7.5"))
+
+ROUTE_FAST = "fast"
+REASON_BAND = "band"
+REASON_INVALID = "invalid"
+
+
+def escalation_reason(data, band=None):
+    """
+    Motivo para escalar a resposta do modelo rápido, ou None se ela pode ser usada.
+
+    Args:
+        data: Registro validado (structured_output.CVRecord) ou None
+        band: (mínimo, máximo) da faixa de incerteza (padrão: CASCADE_BAND_LOW/HIGH)
+
+    Returns:
+        str: REASON_INVALID, REASON_BAND ou None
+    """
+    low, high = band or (CASCADE_BAND_LOW, CASCADE_BAND_HIGH)
+    # Nome e nota já são exigidos pelo schema; aqui só a faixa válida da nota
+    if data is None or not 0 < data["score"] <= 10:
+        return REASON_INVALID
+    if low <= data["score"] <= high:
+        return REASON_BAND
+    return None
+
+
+class CascadeStats:
+    """Contagem de rotas e latências da cascata no processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.routes = {ROUTE_FAST: 0, REASON_BAND: 0, REASON_INVALID: 0}
+            self.fast_ms = 0.0
+            self.large_ms = 0.0
+
+    def record(self, route, fast_ms, large_ms=0.0):
+        with self._lock:
+            self.routes[route] = self.routes.get(route, 0) + 1
+            self.fast_ms += fast_ms
+            self.large_ms += large_ms
+
+    def summary(self):
+        """
+        Taxa de escalada e economia estimada.
+
+        A latência de referência (sempre o modelo grande) usa a média das
+        chamadas escaladas ao modelo grande; sem nenhuma, a economia fica None.
+
+        Returns:
+            dict: calls, escalated, escalation_rate, routes, mean_fast_ms,
+            mean_large_ms, actual_ms, baseline_ms, saved_ms e saved_pct
+        """
+        with self._lock:
+            routes = dict(self.routes)
+            fast_ms, large_ms = self.fast_ms, self.large_ms
+        calls = sum(routes.values())
+        escalated = calls - routes[ROUTE_FAST]
+        mean_large = large_ms / escalated if escalated else None
+        actual = fast_ms + large_ms
+        baseline = mean_large * calls if mean_large is not None else None
+        saved = baseline - actual if baseline is not None else None
+        return {
+            "calls": calls,
+            "escalated": escalated,
+            "escalation_rate": escalated / calls if calls else 0.0,
+            "routes": routes,
+            "mean_fast_ms": fast_ms / calls if calls else 0.0,
+            "mean_large_ms": mean_large,
+            "actual_ms": actual,
+            "baseline_ms": baseline,
+            "saved_ms": saved,
+            "saved_pct": 100 * saved / baseline if baseline else None,
+        }
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_cascade_stats():
+    """Estatísticas da cascata compartilhadas pelo processo (todas as sessões do Streamlit)"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = CascadeStats()
+        return _stats
+
+
+def describe(summary):
+    """Resumo de uma linha das estatísticas (para a CLI e o app)"""
+    if not summary["calls"]:
+        return "Cascata: nenhuma triagem ainda"
+    text = (f"Cascata: {summary['escalated']}/{summary['calls']} escaladas ao modelo grande "
+            f"({100 * summary['escalation_rate']:.0f}%: {summary['routes'][REASON_BAND]} na faixa de incerteza, "
+            f"{summary['routes'][REASON_INVALID]} com JSON inválido)")
+    if summary["saved_ms"] is not None:
+        # Com muitas escaladas a cascata pode sair mais lenta que o modelo grande sozinho
+        verb = "economizados" if summary["saved_ms"] >= 0 else "a mais"
+        text += (f", {abs(summary['saved_ms']) / 1000:.1f}s de latência {verb} "
+                 f"({abs(summary['saved_pct']):.0f}% frente a usar só o modelo grande)")
+    return text
@@ -0,0 +1,116 @@
+"""
+Cache persistente (SQLite) do texto extraído dos PDFs.
+
+A chave é o SHA-256 dos bytes do arquivo mais o motor de extração (PyMuPDF ou
+docling) e sua versão, de modo que cada PDF é extraído uma única vez, mesmo
+entre sessões e reinícios, e uma atualização do parser invalida o cache.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", os.path.join(".cache", "parse_cache.sqlite"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("PARSE_CACHE_MAX_ENTRIES", "20000"))
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """SHA-256 dos bytes do arquivo (lido em blocos)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParsedTextCache:
+    """
+    Texto extraído indexado por (sha256, motor, versão do motor, opções).
+
+    Args:
+        path: Arquivo SQLite
+        max_entries: Quantidade máxima de documentos guardados (LRU)
+    """
+
+    def __init__(self, path=DEFAULT_PARSE_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS parsed_text (
+                sha256 TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                engine_version TEXT NOT NULL,
+                options TEXT NOT NULL DEFAULT '',
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (sha256, engine, engine_version, options)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_parsed_text_accessed ON parsed_text(accessed_at)")
+        self._conn.commit()
+
+    def get(self, sha256, engine, engine_version, options=""):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM parsed_text WHERE sha256 = ? AND engine = ? AND engine_version = ? AND options = ?",
+                (sha256, engine, engine_version, options),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE parsed_text SET accessed_at = ? WHERE sha256 = ? AND engine = ? AND engine_version = ? AND options = ?",
+                (time.time(), sha256, engine, engine_version, options),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, sha256, engine, engine_version, content, options=""):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed_text "
+                "(sha256, engine, engine_version, options, content, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sha256, engine, engine_version, options, content, now, now),
+            )
+            if self.max_entries:
+                self._conn.execute("""
+                    DELETE FROM parsed_text WHERE rowid IN (
+                        SELECT rowid FROM parsed_text ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM parsed_text").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_parse_cache():
+    """Instância compartilhada pelo processo (ou None se desabilitada via PARSE_CACHE_ENABLED=0)"""
+    global _default_cache
+    if os.getenv("PARSE_CACHE_ENABLED", "1") == "0":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ParsedTextCache()
+        return _default_cache
@@ -0,0 +1,122 @@
+"""
+Extração de texto de PDFs página a página com PyMuPDF.
+
+Documentos pequenos são lidos em série. Documentos grandes (portfólios,
+lotes escaneados) têm os intervalos de páginas divididos entre um pool de
+processos, cada worker com seu próprio handle do PyMuPDF, e o texto é
+juntado uma única vez no final. Um limite de páginas evita carregar mais
+páginas do que o necessário.
+
+Este módulo é importado pelos workers do pool, por isso depende apenas do
+PyMuPDF (e não do Streamlit ou do LangChain).
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+# Limite de páginas por documento (0 = sem limite)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+# Processos usados na extração paralela (1 = sempre em série)
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# A partir de quantas páginas vale a pena dividir o documento entre processos
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def configure(max_pages=None, workers=None):
+    """Ajusta o limite de páginas e o número de processos (ex.: a partir dos argumentos da CLI)"""
+    global PDF_MAX_PAGES, PDF_PARSE_WORKERS
+    if max_pages is not None:
+        PDF_MAX_PAGES = max(0, int(max_pages))
+    if workers is not None:
+        PDF_PARSE_WORKERS = max(1, int(workers))
+
+
+def _page_marker(page_num):
+    return f"\n--- Página {page_num + 1} ---\n"
+
+
+def _pages_text(doc, start, stop):
+    """Partes de texto (marcador, texto, marcador, texto, ...) das páginas [start, stop)"""
+    parts = []
+    for page_num in range(start, stop):
+        text = doc[page_num].get_text()
+        if text:
+            parts.append(_page_marker(page_num))
+            parts.append(text)
+    return parts
+
+
+def extract_page_range(file_path, start, stop):
+    """Executado nos workers do pool: abre um handle próprio do documento"""
+    with fitz.open(file_path) as doc:
+        return _pages_text(doc, start, stop)
+
+
+def _page_ranges(page_count, workers):
+    """Divide [0, page_count) em até `workers` intervalos contíguos de tamanho parecido"""
+    chunk = -(-page_count // workers)
+    return [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+
+
+def get_executor(workers):
+    """Pool de processos compartilhado (criado sob demanda e recriado se o tamanho mudar)"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn: seguro em processos com threads (Streamlit, asyncio.to_thread)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+
+@atexit.register
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def extract_text(file_path, max_pages=None, workers=None, parallel_min_pages=None):
+    """
+    Extrai o texto do PDF, em paralelo quando o documento é grande.
+
+    Args:
+        file_path: Caminho do PDF
+        max_pages: Lê no máximo essa quantidade de páginas (None = PDF_MAX_PAGES; 0 = sem limite)
+        workers: Processos na extração paralela (None = PDF_PARSE_WORKERS)
+        parallel_min_pages: Páginas mínimas para usar o pool (None = PDF_PARALLEL_MIN_PAGES)
+
+    Returns:
+        str: Texto com os marcadores "--- Página N ---"
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    workers = PDF_PARSE_WORKERS if workers is None else workers
+    parallel_min_pages = PDF_PARALLEL_MIN_PAGES if parallel_min_pages is None else parallel_min_pages
+
+    with fitz.open(file_path) as doc:
+        page_count = len(doc)
+        if max_pages:
+            page_count = min(page_count, max_pages)
+        if workers <= 1 or page_count < max(parallel_min_pages, 2):
+            return "".join(_pages_text(doc, 0, page_count)).strip()
+
+    ranges = _page_ranges(page_count, min(workers, page_count))
+    executor = get_executor(workers)
+    futures = [executor.submit(extract_page_range, file_path, start, stop) for start, stop in ranges]
+    parts = []
+    for future in futures:
+        parts.extend(future.result())
+    return "".join(parts).strip()
@@ -0,0 +1,132 @@
+"""
+Pré-triagem local (CPU) antes de qualquer chamada ao LLM.
+
+Vetoriza o texto da vaga e dos currículos com TF-IDF (matrizes esparsas do
+SciPy) e calcula a similaridade de cosseno de todo o banco em uma única
+multiplicação matriz-vetor. Apenas os top-K (ou acima de um limiar) seguem
+para a avaliação do LLM.
+"""
+
+import re
+import unicodedata
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+
+# Palavras muito frequentes em currículos/vagas que não ajudam a discriminar perfis
+STOPWORDS = frozenset("""
+a o e de da do das dos em no na nos nas um uma uns umas para por com sem que se ao aos as os
+como mais muito ou ser sua seu suas seus nao sim ja foi sao este esta isso essa esse entre
+sobre ate pela pelo pelas pelos voce nos the and of to in for with on at by an is are be as
+from or this that it its we you your our pagina
+""".split())
+
+
+def tokenize(text):
+    """Minúsculas, sem acentos, tokens com 2+ caracteres e sem stopwords"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return [token for token in _TOKEN_PATTERN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def _count_matrix(token_lists, vocabulary):
+    """Matriz CSR (documentos x termos) de contagens; estende o vocabulário in-place"""
+    import numpy as np
+    from scipy import sparse
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in token_lists:
+        counts = {}
+        for token in tokens:
+            index = vocabulary.setdefault(token, len(vocabulary))
+            counts[index] = counts.get(index, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(token_lists), len(vocabulary)),
+    )
+
+
+def _l2_normalize(matrix):
+    import numpy as np
+    from scipy import sparse
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def rank_candidates(job_text, cv_texts):
+    """
+    Similaridade TF-IDF (cosseno) entre a vaga e cada currículo.
+
+    Args:
+        job_text: Texto da vaga (ex.: job['details'])
+        cv_texts: Lista com o texto de cada currículo
+
+    Returns:
+        numpy.ndarray: Score em [0, 1] para cada currículo, na mesma ordem
+    """
+    # NumPy/SciPy só são importados na primeira pré-triagem (custo alto no início do app)
+    import numpy as np
+    from scipy import sparse
+
+    if not cv_texts:
+        return np.zeros(0)
+
+    vocabulary = {}
+    docs = _count_matrix([tokenize(text) for text in cv_texts], vocabulary)
+    query = _count_matrix([tokenize(job_text)], vocabulary)
+    docs.resize((docs.shape[0], len(vocabulary)))
+
+    # tf sublinear e idf suavizado calculado sobre o banco de currículos
+    docs.data = 1.0 + np.log(docs.data)
+    query.data = 1.0 + np.log(query.data)
+    document_frequency = np.bincount(docs.indices, minlength=len(vocabulary))
+    idf = np.log((1.0 + docs.shape[0]) / (1.0 + document_frequency)) + 1.0
+    idf_diagonal = sparse.diags(idf)
+
+    docs = _l2_normalize(docs @ idf_diagonal)
+    query = _l2_normalize(query @ idf_diagonal)
+
+    return np.asarray((docs @ query.T).todense()).ravel()
+
+
+def select_top(scores, top_k=None, threshold=None):
+    """
+    Índices dos currículos que seguem para o LLM, do maior para o menor score.
+
+    Args:
+        scores: Saída de rank_candidates
+        top_k: Quantidade máxima de currículos (None = sem limite)
+        threshold: Score mínimo (None = sem limiar)
+    """
+    import numpy as np
+    order = np.argsort(-scores, kind="stable")
+    if threshold is not None:
+        order = order[scores[order] >= threshold]
+    if top_k:
+        order = order[:top_k]
+    return order.tolist()
+
+
+def rank_agreement(prescreen_scores, llm_scores):
+    """
+    Correlação de Spearman entre o score local e o score do LLM.
+
+    Returns:
+        float: Valor em [-1, 1], ou None com menos de 3 pares
+    """
+    import numpy as np
+    from scipy.stats import rankdata
+
+    x = np.asarray(prescreen_scores, dtype=np.float64)
+    y = np.asarray(llm_scores, dtype=np.float64)
+    if len(x) < 3:
+        return None
+    rank_x = rankdata(x)
+    rank_y = rankdata(y)
+    if rank_x.std() == 0 or rank_y.std() == 0:
+        return None
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
@@ -0,0 +1,232 @@
+"""
+Índice invertido de competências dos candidatos.
+
+Mapeia cada valor normalizado de hard_skills, soft_skills e certifications
+(e cada palavra desses valores) para o conjunto de candidatos que o possuem,
+representado como bitmap (int do Python, um bit por id de candidato). As
+consultas AND/OR/NOT viram operações bit a bit, sem percorrer os registros.
+
+Exemplos de consulta:
+    laravel AND scraping AND n8n
+    (python OR java) AND NOT estágio
+    "machine learning", docker        (vírgula = AND)
+    python docker                     (palavras soltas = AND)
+"""
+
+import re
+import threading
+
+from storage import get_candidate_store, normalize_identity
+
+SKILL_FIELDS = ("hard_skills", "soft_skills", "certifications")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+_QUERY_TOKEN_PATTERN = re.compile(r'"([^"]*)"|(\()|(\))|(,)|([^\s(),"]+)')
+
+_OPERATORS = {
+    "and": "AND", "e": "AND",
+    "or": "OR", "ou": "OR",
+    "not": "NOT", "nao": "NOT",
+}
+
+
+class QuerySyntaxError(ValueError):
+    """Consulta de competências mal formada"""
+
+
+def normalize_skill(value):
+    """Normaliza o valor de uma competência: sem acentos, minúsculo e com espaços únicos"""
+    return normalize_identity(value).strip(" .;:-")
+
+
+def skill_terms(record):
+    """
+    Termos indexados de um registro de candidato: cada competência completa
+    (ex.: "machine learning") e cada palavra dela (ex.: "laravel" em "php/laravel").
+    """
+    terms = set()
+    for field in SKILL_FIELDS:
+        values = record.get(field) or []
+        if isinstance(values, str):
+            values = re.split(r"[,;\n]", values)
+        for value in values:
+            skill = normalize_skill(value)
+            if not skill:
+                continue
+            terms.add(skill)
+            terms.update(_WORD_PATTERN.findall(skill))
+    return terms
+
+
+def _tokenize_query(query):
+    """
+    Converte a consulta em tokens ("TERM", valor), ("AND"|"OR"|"NOT"|"(" |")", None).
+    Cada palavra solta é um termo (palavras adjacentes viram AND no parser);
+    competências com mais de uma palavra vão entre aspas ("machine learning").
+    """
+    tokens = []
+    for quoted, open_paren, close_paren, comma, word in _QUERY_TOKEN_PATTERN.findall(query):
+        if quoted:
+            tokens.append(("TERM", normalize_skill(quoted)))
+        elif open_paren:
+            tokens.append(("(", None))
+        elif close_paren:
+            tokens.append((")", None))
+        elif comma:
+            tokens.append(("AND", None))
+        else:
+            operator = _OPERATORS.get(normalize_identity(word))
+            tokens.append((operator, None) if operator else ("TERM", normalize_skill(word)))
+    return [token for token in tokens if token != ("TERM", "")]
+
+
+class _QueryParser:
+    """
+    Parser descendente recursivo (precedência: NOT > AND > OR).
+    Termos ou NOT adjacentes sem operador são combinados com AND.
+    """
+
+    def __init__(self, tokens, index):
+        self.tokens = tokens
+        self.position = 0
+        self.index = index
+
+    def parse(self):
+        if not self.tokens:
+            return self.index.universe
+        result = self._or()
+        if self.position != len(self.tokens):
+            raise QuerySyntaxError(f"Token inesperado na posição {self.position + 1}")
+        return result
+
+    def _peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == "OR":
+            self.position += 1
+            result |= self._and()
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() in ("AND", "NOT", "TERM", "("):
+            if self._peek() == "AND":
+                self.position += 1
+            result &= self._not()
+        return result
+
+    def _not(self):
+        if self._peek() == "NOT":
+            self.position += 1
+            return self.index.universe & ~self._not()
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind == "TERM":
+            term = self.tokens[self.position][1]
+            self.position += 1
+            return self.index.lookup(term)
+        if kind == "(":
+            self.position += 1
+            result = self._or()
+            if self._peek() != ")":
+                raise QuerySyntaxError("Parêntese não fechado")
+            self.position += 1
+            return result
+        raise QuerySyntaxError("Consulta incompleta" if kind is None else f"Operador {kind} sem termo")
+
+
+def _bitmap_ids(bitmap):
+    """Ids (bits ligados) do bitmap, em ordem crescente"""
+    bits = bin(bitmap)[:1:-1]
+    return [candidate_id for candidate_id, bit in enumerate(bits) if bit == "1"]
+
+
+class SkillIndex:
+    """
+    Índice invertido termo -> bitmap de ids de candidatos.
+
+    Args:
+        store: CandidateStore de onde os registros são lidos
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.postings = {}
+        self.universe = 0
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, candidate_id, record):
+        """
+        Indexa um candidato recém-inserido (atualização incremental).
+
+        Não avança a marca de leitura (last_id): ids menores inseridos por outros
+        processos antes deste ainda precisam ser lidos por refresh.
+        """
+        bit = 1 << candidate_id
+        with self._lock:
+            for term in skill_terms(record):
+                self.postings[term] = self.postings.get(term, 0) | bit
+            self.universe |= bit
+
+    def refresh(self):
+        """Indexa candidatos inseridos por outros processos (ex.: a CLI em lote) desde a última leitura"""
+        for candidate_id, record in self.store.iter_since(self.last_id):
+            # Reindexar um candidato já adicionado por add não muda os bitmaps
+            self.add(candidate_id, record)
+            with self._lock:
+                self.last_id = max(self.last_id, candidate_id)
+
+    def lookup(self, term):
+        """Bitmap dos candidatos com o termo (competência completa ou palavra)"""
+        return self.postings.get(normalize_skill(term), 0)
+
+    def search(self, query):
+        """
+        Responde a consulta booleana de competências.
+
+        Args:
+            query: Ex.: "laravel AND scraping AND n8n", "python OR java", "react, NOT angular"
+
+        Returns:
+            list: Ids dos candidatos, em ordem crescente (todos se a consulta for vazia)
+
+        Raises:
+            QuerySyntaxError: Se a consulta estiver mal formada
+        """
+        self.refresh()
+        with self._lock:
+            bitmap = _QueryParser(_tokenize_query(query or ""), self).parse()
+        return _bitmap_ids(bitmap)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_skill_index(path_json):
+    """Índice associado ao banco de path_json, construído na primeira chamada e compartilhado pelo processo"""
+    store = get_candidate_store(path_json)
+    with _indexes_lock:
+        index = _indexes.get(store.db_path)
+        if index is None:
+            index = SkillIndex(store)
+            _indexes[store.db_path] = index
+    index.refresh()
+    return index
+
+
+def index_candidate(path_json, candidate_id, record):
+    """
+    Atualiza o índice já carregado com um candidato recém-inserido.
+    Se o índice ainda não foi construído neste processo, não faz nada:
+    ele é montado a partir do banco na primeira consulta.
+    """
+    with _indexes_lock:
+        index = _indexes.get(get_candidate_store(path_json).db_path)
+    if index is not None:
+        index.add(candidate_id, record)
@@ -0,0 +1,673 @@
+"""
+Armazenamento dos candidatos e das vagas em SQLite (modo WAL).
+
+Substitui o curriculos.json: cada inserção é uma única transação atômica
+(sem reescrever o arquivo inteiro), a identidade do candidato tem índice
+único e as listagens são paginadas por índices de score/nome.
+
+Substitui também o vagas.csv: cada vaga é registrada uma vez pelo hash do
+conteúdo e a vaga ativa é carregada por chave, sem ler o histórico.
+
+O mesmo banco guarda o consumo de tokens de cada chamada ao LLM (etapa,
+modelo, vaga e candidato), agregado por etapa, modelo, vaga ou candidato.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Status da célula (candidato, vaga) descartada pela pré-triagem local, sem avaliação do LLM
+MATCH_PRESCREEN_SKIPPED = "prescreen_skipped"
+
+
+def connect_db(db_path):
+    """Abre uma conexão SQLite em modo WAL, segura para várias sessões/processos"""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _ensure_column(conn, table, column, definition):
+    """Adiciona a coluna em bancos criados por versões anteriores"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def db_path_for(path_json):
+    """Caminho do banco correspondente a um arquivo JSON legado (curriculos.json -> curriculos.db)"""
+    return os.path.splitext(path_json)[0] + ".db"
+
+
+def normalize_identity(value):
+    """Normaliza o nome para comparação: sem acentos, minúsculo e com espaços únicos"""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.casefold().split())
+
+
+class CandidateStore:
+    """
+    Repositório de candidatos.
+
+    Args:
+        db_path: Arquivo SQLite
+    """
+
+    ORDER_BY = {
+        "created": "id ASC",
+        "score": "score DESC, id ASC",
+        "name": "name COLLATE NOCASE ASC, id ASC",
+    }
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect_db(db_path)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS candidates (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    identity TEXT NOT NULL,
+                    name TEXT,
+                    score REAL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_candidates_identity ON candidates(identity)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_candidates_score ON candidates(score DESC)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_candidates_name ON candidates(name COLLATE NOCASE)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            # Matriz candidato x vaga: o registro do candidato é extraído uma vez e pontuado por vaga
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS matches (
+                    candidate_id INTEGER NOT NULL REFERENCES candidates(id),
+                    job_id TEXT NOT NULL,
+                    score REAL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (candidate_id, job_id)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_job_score ON matches(job_id, score DESC)")
+            _ensure_column(self._conn, "matches", "prescreen_score", "REAL")
+            # NULL = avaliado pelo LLM; MATCH_PRESCREEN_SKIPPED = descartado pela pré-triagem local
+            _ensure_column(self._conn, "matches", "status", "TEXT")
+
+    @staticmethod
+    def identity_for(record, key_name="name"):
+        value = record.get(key_name)
+        if value:
+            return normalize_identity(value)
+        # Sem nome: usa o próprio conteúdo como identidade
+        payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+        return "sha256:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _score(record):
+        try:
+            return float(record.get("score"))
+        except (TypeError, ValueError):
+            return None
+
+    def insert(self, record, key_name="name"):
+        """
+        Insere o candidato de forma atômica.
+
+        Returns:
+            int: id do candidato, ou None se já existir um com a mesma identidade
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO candidates (identity, name, score, data, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(identity) DO NOTHING",
+                (
+                    self.identity_for(record, key_name),
+                    record.get("name"),
+                    self._score(record),
+                    json.dumps(record, ensure_ascii=False, default=str),
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def get(self, candidate_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM candidates WHERE id = ?", (candidate_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def exists(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM candidates WHERE identity = ?", (normalize_identity(name),)
+            ).fetchone()
+        return row is not None
+
+    def id_for(self, name):
+        """Id do candidato com esse nome (comparação normalizada), ou None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM candidates WHERE identity = ?", (normalize_identity(name),)
+            ).fetchone()
+        return row["id"] if row else None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM candidates").fetchone()[0]
+
+    def upsert_match(self, candidate_id, job_id, data, prescreen_score=None):
+        """Grava (ou substitui) a avaliação do candidato para a vaga, ao lado do score da pré-triagem local"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO matches (candidate_id, job_id, score, data, created_at, prescreen_score) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(candidate_id, job_id) DO UPDATE SET score = excluded.score, data = excluded.data, "
+                "created_at = excluded.created_at, status = NULL, "
+                "prescreen_score = COALESCE(excluded.prescreen_score, matches.prescreen_score)",
+                (candidate_id, job_id, self._score(data), json.dumps(data, ensure_ascii=False, default=str),
+                 time.time(), prescreen_score),
+            )
+
+    def mark_prescreen_skipped(self, job_id, prescreen_scores):
+        """
+        Registra os candidatos descartados pela pré-triagem local para a vaga (sem score do LLM),
+        para que não voltem a contar como pendentes. Avaliações já gravadas não são alteradas.
+
+        Args:
+            prescreen_scores: {candidate_id: score da pré-triagem}
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO matches (candidate_id, job_id, score, data, created_at, prescreen_score, status) "
+                "VALUES (?, ?, NULL, '{}', ?, ?, ?) ON CONFLICT(candidate_id, job_id) DO NOTHING",
+                [(candidate_id, job_id, now, score, MATCH_PRESCREEN_SKIPPED)
+                 for candidate_id, score in prescreen_scores.items()],
+            )
+
+    def get_match(self, candidate_id, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM matches WHERE candidate_id = ? AND job_id = ? AND status IS NULL",
+                (candidate_id, job_id),
+            ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def candidates_without_match(self, job_id, include_skipped=False):
+        """
+        Candidatos ainda não pontuados para a vaga (preenchimento incremental da matriz).
+
+        Args:
+            include_skipped: Inclui os já descartados pela pré-triagem (ex.: com um corte mais amplo)
+
+        Returns:
+            list: Tuplas (id, registro)
+        """
+        skipped = " OR m.status = ?" if include_skipped else ""
+        params = (job_id, MATCH_PRESCREEN_SKIPPED) if include_skipped else (job_id,)
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT c.id, c.data FROM candidates c
+                LEFT JOIN matches m ON m.candidate_id = c.id AND m.job_id = ?
+                WHERE m.candidate_id IS NULL{skipped}
+                ORDER BY c.id
+            """, params).fetchall()
+        return [(row["id"], json.loads(row["data"])) for row in rows]
+
+    def match_scores(self, job_id):
+        """Scores de todos os candidatos pontuados para a vaga: {candidate_id: score}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT candidate_id, score FROM matches WHERE job_id = ? AND status IS NULL", (job_id,)
+            ).fetchall()
+        return {row["candidate_id"]: row["score"] for row in rows}
+
+    def score_pairs(self, job_id):
+        """
+        Pares (score da pré-triagem, score do LLM) da vaga, para medir a concordância.
+
+        Returns:
+            list: Tuplas (prescreen_score, score)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prescreen_score, score FROM matches "
+                "WHERE job_id = ? AND prescreen_score IS NOT NULL AND score IS NOT NULL",
+                (job_id,),
+            ).fetchall()
+        return [(row["prescreen_score"], row["score"]) for row in rows]
+
+    def match_matrix(self):
+        """
+        Todas as células preenchidas da matriz.
+
+        Returns:
+            list: Tuplas (candidate_id, nome, job_id, score)
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT m.candidate_id, c.name, m.job_id, m.score FROM matches m
+                JOIN candidates c ON c.id = m.candidate_id
+                WHERE m.status IS NULL
+                ORDER BY m.candidate_id
+            """).fetchall()
+        return [(row["candidate_id"], row["name"], row["job_id"], row["score"]) for row in rows]
+
+    def list_page(self, offset=0, limit=50, order_by="created", candidate_ids=None):
+        """
+        Lista uma página de candidatos.
+
+        Args:
+            candidate_ids: Restringe a listagem a esses ids (ex.: resultado do filtro de competências)
+
+        Returns:
+            list: Tuplas (id, registro)
+        """
+        order = self.ORDER_BY.get(order_by, self.ORDER_BY["created"])
+        where, params = "", ()
+        if candidate_ids is not None:
+            # Um único parâmetro JSON, sem o limite de variáveis do SQLite
+            where, params = "WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(candidate_ids)),)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, data FROM candidates {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+        return [(row["id"], json.loads(row["data"])) for row in rows]
+
+    def iter_since(self, last_id):
+        """Candidatos com id maior que last_id, em ordem de inserção (atualização incremental de índices)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM candidates WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        for row in rows:
+            yield row["id"], json.loads(row["data"])
+
+    def iter_all(self, order_by="created"):
+        order = self.ORDER_BY.get(order_by, self.ORDER_BY["created"])
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, data FROM candidates ORDER BY {order}").fetchall()
+        for row in rows:
+            yield row["id"], json.loads(row["data"])
+
+    def export_json(self):
+        """Exporta todos os candidatos no formato do antigo curriculos.json"""
+        return json.dumps([record for _, record in self.iter_all()], indent=2, ensure_ascii=False)
+
+    def migrate_from_json(self, path_json, key_name="name"):
+        """
+        Importa (uma única vez) os registros de um curriculos.json legado.
+
+        Returns:
+            int: Quantidade de registros importados (0 se já migrado ou inexistente)
+        """
+        meta_key = "migrated:" + os.path.abspath(path_json)
+        with self._lock:
+            done = self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (meta_key,)).fetchone()
+        if done or not os.path.exists(path_json):
+            return 0
+
+        with open(path_json, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [data]
+
+        imported = 0
+        now = time.time()
+        with self._lock, self._conn:
+            for record in data:
+                cursor = self._conn.execute(
+                    "INSERT INTO candidates (identity, name, score, data, created_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(identity) DO NOTHING",
+                    (
+                        self.identity_for(record, key_name),
+                        record.get("name"),
+                        self._score(record),
+                        json.dumps(record, ensure_ascii=False, default=str),
+                        now,
+                    ),
+                )
+                imported += cursor.rowcount
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (meta_key, str(now)))
+        return imported
+
+
+def render_job_details(job):
+    """Texto da vaga usado nos prompts (mesmo formato de load_job)"""
+    prompt_text = f"""
+    **Vaga para {job['title']}**
+
+    **Descrição da Vaga:**
+    {job['description']}
+
+    **Detalhes Completos:**
+    {job['details']}
+    """
+    return prompt_text.strip()
+
+
+def job_content_id(job):
+    """Id estável da vaga: hash do título, descrição e detalhes"""
+    payload = json.dumps(
+        [job.get("title", ""), job.get("description", ""), job.get("details", "")],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class JobRegistry:
+    """
+    Registro de vagas: cada vaga é gravada uma única vez, identificada pelo hash do
+    conteúdo, junto com o texto já renderizado para os prompts.
+
+    Args:
+        db_path: Arquivo SQLite (o mesmo dos candidatos)
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect_db(db_path)
+        self._details_cache = {}
+        self._digest_cache = {}
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    details TEXT,
+                    job_details TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Resumo estruturado dos requisitos (JSON), compilado uma vez por vaga
+            _ensure_column(self._conn, "jobs", "digest", "TEXT")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+    def register(self, job):
+        """
+        Registra a vaga se ainda não existir.
+
+        Returns:
+            str: Id da vaga
+        """
+        job_id = job_content_id(job)
+        if job_id in self._details_cache:
+            return job_id
+        job_details = render_job_details(job)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, title, description, details, job_details, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job.get("title", ""), job.get("description", ""), job.get("details", ""), job_details, time.time()),
+            )
+        self._details_cache[job_id] = job_details
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, description, details FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def job_details(self, job_id):
+        """Texto da vaga para os prompts (lido do banco uma vez e mantido em memória)"""
+        cached = self._details_cache.get(job_id)
+        if cached is not None:
+            return cached
+        with self._lock:
+            row = self._conn.execute("SELECT job_details FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        self._details_cache[job_id] = row["job_details"]
+        return row["job_details"]
+
+    def get_digest(self, job_id):
+        """Resumo de requisitos da vaga (dict), ou None se ainda não foi compilado"""
+        if job_id in self._digest_cache:
+            return self._digest_cache[job_id]
+        with self._lock:
+            row = self._conn.execute("SELECT digest FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        digest = json.loads(row["digest"]) if row and row["digest"] else None
+        if digest is not None:
+            self._digest_cache[job_id] = digest
+        return digest
+
+    def set_digest(self, job_id, digest):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET digest = ? WHERE id = ?", (json.dumps(digest, ensure_ascii=False), job_id)
+            )
+        self._digest_cache[job_id] = digest
+
+    def list_jobs(self):
+        """Catálogo de vagas: lista de (id, título) em ordem de cadastro"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, title FROM jobs ORDER BY created_at, id").fetchall()
+        return [(row["id"], row["title"]) for row in rows]
+
+    def set_active(self, job_id):
+        if getattr(self, "_active_id", None) == job_id:
+            return
+        self._active_id = job_id
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('active_job', ?)", (job_id,))
+
+    def active_job_id(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'active_job'").fetchone()
+        return row["value"] if row else None
+
+    def import_from_csv(self, csv_path):
+        """
+        Importa as vagas de um vagas.csv legado (sem duplicatas) e ativa a última.
+
+        Returns:
+            str: Id da última vaga do arquivo, ou None se vazio/inexistente
+        """
+        if not os.path.exists(csv_path):
+            return None
+        import csv
+        last_id = None
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f, delimiter=";"):
+                last_id = self.register(row)
+        if last_id:
+            self.set_active(last_id)
+        return last_id
+
+
+class UsageLedger:
+    """
+    Consumo de tokens de cada chamada ao LLM: tokens de entrada, de saída e de
+    raciocínio, latência e custo estimado, com a etapa, o modelo, a vaga e o
+    candidato (nome antes do registro existir, id depois).
+
+    Args:
+        db_path: Arquivo SQLite (o mesmo dos candidatos)
+    """
+
+    GROUP_BY = {
+        "stage": "u.stage",
+        "model": "u.model",
+        "job": "u.job_id",
+        "candidate": "COALESCE(c.name, u.candidate_name)",
+    }
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = connect_db(db_path)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    stage TEXT NOT NULL,
+                    model TEXT,
+                    job_id TEXT,
+                    candidate_id INTEGER,
+                    candidate_name TEXT,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    reasoning_tokens INTEGER NOT NULL DEFAULT 0,
+                    total_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency_ms REAL,
+                    cached INTEGER NOT NULL DEFAULT 0,
+                    cost_usd REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_job ON llm_usage(job_id, stage)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_candidate ON llm_usage(candidate_id)")
+
+    def record(self, usage, stage, model=None, job_id=None, candidate_id=None, candidate_name=None,
+               latency_ms=None, cached=False, cost_usd=None):
+        """
+        Registra uma chamada.
+
+        Args:
+            usage: dict com prompt_tokens, completion_tokens, reasoning_tokens e total_tokens
+
+        Returns:
+            int: id do registro
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO llm_usage (created_at, stage, model, job_id, candidate_id, candidate_name, prompt_tokens, "
+                "completion_tokens, reasoning_tokens, total_tokens, latency_ms, cached, cost_usd) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(), stage, model, job_id, candidate_id, candidate_name,
+                    usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                    usage.get("reasoning_tokens", 0), usage.get("total_tokens", 0),
+                    latency_ms, int(bool(cached)), cost_usd,
+                ),
+            )
+            return cursor.lastrowid
+
+    def assign_candidate(self, usage_ids, candidate_id):
+        """Associa ao candidato registrado as chamadas feitas antes de ele ter id (ex.: a triagem)"""
+        if not usage_ids or candidate_id is None:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE llm_usage SET candidate_id = ? WHERE id = ?", [(candidate_id, usage_id) for usage_id in usage_ids]
+            )
+
+    def summary(self, group_by=("stage", "model"), job_id=None, candidate_id=None):
+        """
+        Consumo agregado.
+
+        Respostas do cache entram na contagem de chamadas ("cached"), mas não
+        nos tokens nem no custo: elas não consomem a cota do provedor.
+
+        Args:
+            group_by: Colunas de agrupamento ("stage", "model", "job", "candidate")
+            job_id: Restringe a uma vaga
+            candidate_id: Restringe a um candidato
+
+        Returns:
+            list: dicts com as colunas agrupadas, calls, cached, prompt_tokens,
+            completion_tokens, reasoning_tokens, total_tokens, avg_latency_ms e cost_usd
+            (do maior total de tokens ao menor)
+        """
+        columns = [f"{self.GROUP_BY[name]} AS {name}" for name in group_by]
+        conditions, params = [], []
+        if job_id is not None:
+            conditions.append("u.job_id = ?")
+            params.append(job_id)
+        if candidate_id is not None:
+            conditions.append("u.candidate_id = ?")
+            params.append(candidate_id)
+        sql = (
+            f"SELECT {', '.join(columns + [''])}"
+            "COUNT(*) AS calls, SUM(u.cached) AS cached, "
+            "SUM(CASE WHEN u.cached THEN 0 ELSE u.prompt_tokens END) AS prompt_tokens, "
+            "SUM(CASE WHEN u.cached THEN 0 ELSE u.completion_tokens END) AS completion_tokens, "
+            "SUM(CASE WHEN u.cached THEN 0 ELSE u.reasoning_tokens END) AS reasoning_tokens, "
+            "SUM(CASE WHEN u.cached THEN 0 ELSE u.total_tokens END) AS total_tokens, "
+            "AVG(CASE WHEN u.cached THEN NULL ELSE u.latency_ms END) AS avg_latency_ms, "
+            "SUM(CASE WHEN u.cached THEN 0 ELSE u.cost_usd END) AS cost_usd "
+            "FROM llm_usage u LEFT JOIN candidates c ON c.id = u.candidate_id"
+        )
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_by:
+            sql += " GROUP BY " + ", ".join(self.GROUP_BY[name] for name in group_by)
+        sql += " ORDER BY total_tokens DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_candidate_store(path_json):
+    """
+    Retorna o repositório associado ao caminho do JSON legado, migrando-o na primeira abertura.
+    A instância é compartilhada pelo processo (todas as sessões do Streamlit).
+    """
+    db_path = db_path_for(path_json)
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = CandidateStore(db_path)
+            store.migrate_from_json(path_json)
+            _stores[db_path] = store
+        return store
+
+
+_registries = {}
+
+
+def get_job_registry(path_json):
+    """Registro de vagas no mesmo banco dos candidatos (compartilhado pelo processo)"""
+    db_path = db_path_for(path_json)
+    with _stores_lock:
+        registry = _registries.get(db_path)
+        if registry is None:
+            registry = JobRegistry(db_path)
+            _registries[db_path] = registry
+        return registry
+
+
+_ledgers = {}
+
+
+def get_usage_ledger(path_json):
+    """Registro de consumo de tokens no mesmo banco dos candidatos (compartilhado pelo processo)"""
+    db_path = db_path_for(path_json)
+    # A agregação por candidato junta com a tabela de candidatos: garante que ela exista
+    get_candidate_store(path_json)
+    with _stores_lock:
+        ledger = _ledgers.get(db_path)
+        if ledger is None:
+            ledger = UsageLedger(db_path)
+            _ledgers[db_path] = ledger
+        return ledger
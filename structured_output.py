@@ -0,0 +1,354 @@
+"""
+Saída estruturada dos agentes: modelos tipados e reparo local de JSON.
+
+Os schemas de triagem, análise, matriz e vaga são modelos pydantic que
+validam (e normalizam) a resposta do LLM. O JSON é localizado por
+balanceamento de chaves, não pelo primeiro "{" e último "}", e respostas
+malformadas ou cortadas passam por um reparo local barato (vírgulas
+sobrando, aspas tipográficas, quebras de linha dentro de strings, literais
+do Python, estruturas não fechadas) antes de se recorrer a uma nova chamada.
+"""
+
+import json
+import re
+from typing import Any, List
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator, model_validator
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = "“”„"
+# Depois de uma aspa de fechamento só vem espaço, ":", ",", "}" ou "]"
+_AFTER_STRING = re.compile(r"\s*(?:[:,}\]]|$)")
+
+
+class StructuredOutputError(ValueError):
+    """Resposta do LLM sem JSON válido para o schema esperado"""
+
+
+# ============================================
+# Modelos
+# ============================================
+
+def _as_list(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if item is not None]
+    return [value]
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(item) for item in value)
+    return str(value)
+
+
+def _as_score(value):
+    """
+    Nota numérica a partir de 7.5, "7,5", "7.5/10" etc. Sem número ("N/A",
+    vazio, null) retorna None, que a validação rejeita: a resposta segue para
+    o reparo em vez de virar nota 0.0.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value)) if isinstance(value, str) else None
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+class _Schema(BaseModel):
+    """
+    Base tolerante: campos opcionais ausentes assumem o padrão e listas
+    aceitam um item solto. Nome e notas são obrigatórios: sem eles a resposta
+    (cortada ou vazia) é inválida.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _coerce(cls, value, info):
+        annotation = cls.model_fields[info.field_name].annotation
+        if annotation is float:
+            return _as_score(value)
+        if annotation is str:
+            return _as_text(value)
+        if getattr(annotation, "__origin__", None) is list:
+            items = _as_list(value)
+            if annotation == List[str]:
+                return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in items]
+            return items
+        return value
+
+
+class MatchResult(_Schema):
+    """Avaliação de um candidato para uma vaga (MATCH_SCHEMA)"""
+    interview_questions: List[str] = []
+    strengths: List[str] = []
+    areas_for_development: List[str] = []
+    important_considerations: List[str] = []
+    final_recommendations: str = ""
+    score: float
+
+
+class CVRecord(MatchResult):
+    """Registro estruturado do candidato extraído na triagem (CV_SCHEMA)"""
+    name: str
+    position: str = ""
+    summary: str = ""
+    hard_skills: List[str] = []
+    soft_skills: List[str] = []
+    academic_info: List[Any] = []
+    training_courses: List[Any] = []
+    experiences: List[Any] = []
+    certifications: List[str] = []
+
+    @model_validator(mode="after")
+    def _require_name(self):
+        if not self.name.strip():
+            raise ValueError("name não pode estar vazio")
+        return self
+
+
+class CVAnalysis(_Schema):
+    """Análise detalhada do currículo frente à vaga (agente analisador)"""
+    analysis_summary: str = ""
+    alignment_score: float
+    strengths: List[str] = []
+    weaknesses: List[str] = []
+    missing_skills: List[str] = []
+    underutilized_skills: List[str] = []
+    recommendations: List[str] = []
+    key_improvements: List[str] = []
+
+
+class CombinedResult(CVRecord):
+    """Triagem + análise detalhada em uma única resposta (COMBINED_SCHEMA)"""
+    analysis_summary: str = ""
+    missing_skills: List[str] = []
+    underutilized_skills: List[str] = []
+    recommendations: List[str] = []
+    key_improvements: List[str] = []
+
+
+class JobDigest(_Schema):
+    """Resumo de requisitos da vaga (JOB_DIGEST_SCHEMA)"""
+    seniority: str = ""
+    summary: str = ""
+    must_have: List[Any] = []
+    nice_to_have: List[Any] = []
+    responsibilities: List[str] = []
+    soft_skills: List[str] = []
+    keywords: List[str] = []
+
+    # Validador de modelo: o pydantic não valida padrões, então um campo
+    # ausente passaria por um field_validator
+    @model_validator(mode="after")
+    def _require_must_have(self):
+        if not self.must_have:
+            raise ValueError("must_have não pode estar vazio")
+        return self
+
+
+# ============================================
+# Extração e reparo
+# ============================================
+
+def _strip_wrappers(text):
+    """Remove o raciocínio (<think>) e cercas de código markdown"""
+    if "</think>" in text:
+        text = text.split("</think>")[-1]
+    return _FENCE.sub("", text.strip()).strip()
+
+
+def extract_json(text):
+    """
+    Trecho JSON da resposta: do primeiro "{" até a chave que o fecha
+    (respeitando strings). Se o objeto não fechar (resposta cortada),
+    retorna do "{" até o fim, para o reparo.
+    """
+    text = _strip_wrappers(text or "")
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return text[start:]
+
+
+def repair_json(text):
+    """
+    Reparo local de JSON malformado ou incompleto.
+
+    Corrige aspas tipográficas usadas como delimitadores (dentro de strings
+    são mantidas), vírgulas antes de "}" ou "]", quebras de linha cruas
+    dentro de strings e True/False/None; fecha strings e estruturas abertas
+    e, se preciso, descarta o último item incompleto.
+
+    Returns:
+        str: JSON reparado (pode continuar inválido se o texto não tiver conserto)
+    """
+    output = []
+    stack = []
+    commas = []       # (posição em output, profundidade) das vírgulas fora de strings
+    in_string = escaped = False
+    smart_string = False  # string aberta por aspa tipográfica
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif smart_string and char in _SMART_QUOTES and _AFTER_STRING.match(text, index + 1):
+                char = '"'
+                in_string = False
+            elif char == "\n":
+                char = "\\n"
+            elif char == "\t":
+                char = "\\t"
+            output.append(char)
+        elif char == '"' or char in _SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            output.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            output.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(output)
+            if stack:
+                stack.pop()
+            output.append(char)
+            if not stack:
+                break
+        elif char == ",":
+            commas.append((len(output), len(stack)))
+            output.append(char)
+        elif char.isalpha():
+            end = index
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            output.append(_PYTHON_LITERALS.get(word, word))
+            index = end
+            continue
+        else:
+            output.append(char)
+        index += 1
+
+    if in_string:
+        output.append('"')
+    candidate = _close("".join(output), stack)
+    # Resposta cortada no meio de um item: volta até a última vírgula e fecha de novo
+    for position, depth in reversed(commas):
+        if _loads_or_none(candidate) is not None:
+            break
+        candidate = _close("".join(output[:position]), _stack_at(output[:position]))
+    return candidate
+
+
+def _drop_trailing_comma(output):
+    position = len(output) - 1
+    while position >= 0 and output[position].isspace():
+        position -= 1
+    if position >= 0 and output[position] == ",":
+        del output[position]
+
+
+def _stack_at(chars):
+    """Estruturas abertas no prefixo (já reparado) do JSON"""
+    stack = []
+    in_string = escaped = False
+    for char in "".join(chars):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return stack
+
+
+def _close(text, stack):
+    text = text.rstrip()
+    if text.endswith(":"):
+        text += " null"
+    text = text.rstrip(",").rstrip()
+    return text + "".join(reversed(stack))
+
+
+def _loads_or_none(text):
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def parse_structured(text, model):
+    """
+    Localiza, repara (se preciso) e valida o JSON da resposta.
+
+    Returns:
+        tuple: (dict validado ou None, descrição do erro ou None)
+    """
+    snippet = extract_json(text)
+    if snippet is None:
+        return None, "Nenhum JSON encontrado na resposta"
+    data = _loads_or_none(snippet)
+    if data is None:
+        data = _loads_or_none(repair_json(snippet))
+    if not isinstance(data, dict):
+        return None, "JSON inválido ou incompleto"
+    try:
+        return model.model_validate(data).model_dump(), None
+    except ValidationError as e:
+        return None, "; ".join(_describe_error(err) for err in e.errors())
+
+
+def _describe_error(err):
+    # Erros de validadores de modelo não têm campo (loc vazio)
+    location = ".".join(map(str, err["loc"]))
+    return f"{location}: {err['msg']}" if location else err["msg"]
+
+
+def failed_generation(error):
+    """
+    Texto gerado pelo modelo quando o provedor rejeita a resposta no modo JSON
+    (Groq: erro 400 json_validate_failed com o campo failed_generation), ou None.
+    """
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict) and body.get("failed_generation"):
+            return body["failed_generation"]
+    return None
@@ -0,0 +1,319 @@
+"""
+Compactação do texto do currículo e da vaga antes de montar os prompts.
+
+O texto extraído do PDF traz marcadores de página, cabeçalhos e rodapés
+repetidos, hifenização quebrando palavras e sequências de espaços. Aqui o
+texto é normalizado e deduplicado, os tokens são contados com um tokenizador
+local e cada etapa (triagem, análise, reformulação) tem um orçamento de
+tokens de entrada: acima dele o texto é truncado por seção, preservando o
+título e o início de cada seção em vez de cortar o final do documento.
+"""
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from importlib.util import find_spec
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_ENABLED = os.getenv("CV_COMPACTION_ENABLED", "1") != "0"
+
+# Orçamento de tokens do currículo por etapa (0 = sem limite) e da descrição da vaga
+STAGE_TOKEN_BUDGETS = {
+    "triage": int(os.getenv("TOKEN_BUDGET_TRIAGE", "6000")),
+    "analysis": int(os.getenv("TOKEN_BUDGET_ANALYSIS", "6000")),
+    "rewrite": int(os.getenv("TOKEN_BUDGET_REWRITE", "10000")),
+}
+JOB_TOKEN_BUDGET = int(os.getenv("TOKEN_BUDGET_JOB", "2000"))
+
+TRUNCATION_MARKER = "[...]"
+
+_PAGE_MARKER = re.compile(r"^--- Página \d+ ---$")
+# Número de página: "Página 2", "page 2 of 3" ou só "2" / "2 de 3" com até 3 dígitos
+# (um ano sozinho na linha, ex.: 2015, não é número de página)
+_PAGE_NUMBER = re.compile(
+    r"^(?:(?:página|pagina|page|pág\.?)\s*\d{1,4}(?:\s*(?:/|de|of)\s*\d{1,4})?|\d{1,3}(?:\s*(?:/|de|of)\s*\d{1,3})?)$",
+    re.IGNORECASE,
+)
+# Linhas do topo e do rodapé de cada página em que um número de página é procurado
+_PAGE_NUMBER_EDGE_LINES = 2
+_HYPHEN_BREAK = re.compile(r"(\w+)-\n[ \t]*(\w+)")
+_WORDS = re.compile(r"\w+")
+_SPACES = re.compile(r"[ \t\u00a0\u2000-\u200b\u202f\u3000]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_DIGITS = re.compile(r"\d+")
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+_HEADING_WORDS = (
+    "resumo", "perfil", "objetivo", "sobre", "experiência", "experiencia", "histórico profissional",
+    "formação", "formacao", "educação", "educacao", "escolaridade", "habilidades", "competências",
+    "competencias", "conhecimentos", "cursos", "certificações", "certificacoes", "certificados",
+    "idiomas", "projetos", "atividades", "prêmios", "publicações", "voluntariado", "contato",
+    "summary", "profile", "experience", "education", "skills", "courses", "certifications",
+    "languages", "projects",
+)
+
+
+# ============================================
+# Contagem de tokens
+# ============================================
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    """Encoding do tiktoken, se instalado e com o vocabulário disponível localmente"""
+    if find_spec("tiktoken") is None:
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """
+    Conta os tokens do texto.
+
+    Usa o tiktoken quando disponível; senão, estima como um tokenizador BPE:
+    cada pontuação é um token e cada palavra ocupa um token a cada 4 caracteres.
+    """
+    if not text:
+        return 0
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+# ============================================
+# Normalização
+# ============================================
+
+def _split_pages(text):
+    """Separa o texto nos marcadores "--- Página N ---" e nas quebras de página (\\f); um único bloco se não houver"""
+    pages = [[]]
+    for line in text.split("\n"):
+        if _PAGE_MARKER.match(line.strip()):
+            if pages[-1]:
+                pages.append([])
+            continue
+        pieces = line.split("\f")
+        pages[-1].append(pieces[0])
+        for piece in pieces[1:]:
+            pages.append([piece])
+    return pages
+
+
+def _join_hyphenated(text):
+    """
+    Junta as palavras hifenizadas na quebra de linha só quando a junção é
+    conferível: as duas partes em minúsculas e a palavra inteira presente em
+    outro ponto do texto. Nos demais casos (ex.: "front-end") o hífen fica.
+    """
+    if "-\n" not in text:
+        return text
+    words = {word.lower() for word in _WORDS.findall(text)}
+
+    def join(match):
+        left, right = match.group(1), match.group(2)
+        if left[-1].islower() and right[0].islower() and (left + right).lower() in words:
+            return left + right
+        return f"{left}-{right}"
+
+    return _HYPHEN_BREAK.sub(join, text)
+
+
+def _page_number_lines(page):
+    """Índices das linhas de número de página nas margens (topo e rodapé) da página"""
+    filled = [i for i, line in enumerate(page) if line]
+    edges = filled[:_PAGE_NUMBER_EDGE_LINES] + filled[-_PAGE_NUMBER_EDGE_LINES:]
+    return {i for i in edges if _PAGE_NUMBER.match(page[i])}
+
+
+def _line_signature(line):
+    """Linha comparável entre páginas (números trocados, ex.: "Página 2 de 3")"""
+    return _DIGITS.sub("#", line.lower())
+
+
+def _repeated_margins(pages, edge_lines=3):
+    """Assinaturas das linhas que se repetem no topo ou no rodapé da maioria das páginas"""
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for page in pages:
+        signatures = Counter(_line_signature(line) for line in page if line)
+        lines = [line for line in page if line]
+        # Só conta linhas únicas na página: corpo com linhas parecidas não é cabeçalho
+        counts.update({
+            signature for signature in map(_line_signature, lines[:edge_lines] + lines[-edge_lines:])
+            if signatures[signature] == 1
+        })
+    min_pages = max(2, math.ceil(len(pages) * 0.6))
+    return {signature for signature, count in counts.items() if count >= min_pages}
+
+
+def normalize_text(text):
+    """
+    Normaliza o texto extraído: remove marcadores e números de página (só no
+    topo e no rodapé de cada página), cabeçalhos/rodapés repetidos (mantendo a
+    primeira ocorrência), junta palavras hifenizadas na quebra de linha quando
+    a palavra inteira aparece no texto, colapsa espaços e linhas em branco e
+    descarta linhas e parágrafos duplicados.
+    """
+    if not text:
+        return ""
+    text = _join_hyphenated(text.replace("\r\n", "\n").replace("\r", "\n"))
+    pages = [[_SPACES.sub(" ", line).strip() for line in page] for page in _split_pages(text)]
+    margins = _repeated_margins(pages)
+
+    lines = []
+    seen_margins = set()
+    for page in pages:
+        page_numbers = _page_number_lines(page)
+        for i, line in enumerate(page):
+            if i in page_numbers:
+                continue
+            signature = _line_signature(line) if line else None
+            if signature in margins:
+                if signature in seen_margins:
+                    continue
+                seen_margins.add(signature)
+            if line and lines and line == lines[-1]:
+                continue
+            lines.append(line)
+        lines.append("")
+
+    # Parágrafos repetidos (ex.: bloco de contato em todas as páginas)
+    paragraphs = []
+    seen = set()
+    for paragraph in "\n".join(lines).split("\n\n"):
+        paragraph = paragraph.strip("\n")
+        if not paragraph:
+            continue
+        key = paragraph.lower()
+        if len(paragraph) >= 40 and key in seen:
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    return _BLANK_LINES.sub("\n\n", "\n\n".join(paragraphs)).strip()
+
+
+# ============================================
+# Truncamento por seção
+# ============================================
+
+def _is_heading(line):
+    stripped = line.strip("#*_ :").strip()
+    if not stripped or len(stripped) > 60:
+        return False
+    if line.lstrip().startswith("#") or line.rstrip().endswith(":"):
+        return True
+    letters = [char for char in stripped if char.isalpha()]
+    if len(letters) >= 4 and all(char.isupper() for char in letters):
+        return True
+    lowered = stripped.lower()
+    return len(stripped.split()) <= 5 and any(lowered.startswith(word) for word in _HEADING_WORDS)
+
+
+def _split_sections(text):
+    """Lista de (título ou None, linhas do corpo); a primeira seção é o cabeçalho do documento"""
+    sections = [(None, [])]
+    for line in text.split("\n"):
+        if _is_heading(line):
+            sections.append((line, []))
+        else:
+            sections[-1][1].append(line)
+    return sections
+
+
+def _fair_caps(sizes, budget):
+    """Limite por seção que reparte o orçamento igualmente (seções menores cabem inteiras)"""
+    caps = [0] * len(sizes)
+    remaining = budget
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        index = pending[0]
+        if sizes[index] <= share:
+            caps[index] = sizes[index]
+            remaining -= sizes[index]
+            pending.pop(0)
+        else:
+            for index in pending:
+                caps[index] = share
+            break
+    return caps
+
+
+def truncate_to_budget(text, max_tokens):
+    """
+    Reduz o texto para caber em max_tokens, repartindo o orçamento entre as seções.
+
+    Títulos de seção são sempre mantidos; o corpo de cada seção é cortado em
+    fim de linha e recebe o marcador [...] quando truncado.
+    """
+    if not max_tokens or count_tokens(text) <= max_tokens:
+        return text
+    sections = _split_sections(text)
+    heading_tokens = sum(count_tokens(title) + 1 for title, _ in sections if title)
+    marker_tokens = count_tokens(TRUNCATION_MARKER) + 1
+    body_budget = max(0, max_tokens - heading_tokens - marker_tokens * len(sections))
+    line_tokens = [[count_tokens(line) + 1 for line in body] for _, body in sections]
+    caps = _fair_caps([sum(tokens) for tokens in line_tokens], body_budget)
+
+    output = []
+    for (title, body), tokens, cap in zip(sections, line_tokens, caps):
+        if title is not None:
+            output.append(title)
+        used = 0
+        for line, cost in zip(body, tokens):
+            if used + cost > cap:
+                output.append(TRUNCATION_MARKER)
+                break
+            output.append(line)
+            used += cost
+    return "\n".join(output).strip()
+
+
+# ============================================
+# Compactação por etapa
+# ============================================
+
+@lru_cache(maxsize=128)
+def _compact(text, max_tokens, label):
+    normalized = normalize_text(text)
+    compacted = truncate_to_budget(normalized, max_tokens)
+    if logger.isEnabledFor(logging.INFO):
+        before, after = count_tokens(text), count_tokens(compacted)
+        logger.info("%s: %d -> %d tokens (%.0f%% menos)%s", label, before, after,
+                    100 * (before - after) / before if before else 0,
+                    " [truncado]" if compacted is not normalized else "")
+    return compacted
+
+
+def compact_cv_text(text, stage):
+    """
+    Texto do currículo pronto para o prompt da etapa ("triage", "analysis" ou "rewrite").
+
+    O resultado fica em cache: o mesmo currículo passa pelas três etapas.
+    """
+    if not COMPACTION_ENABLED or not text:
+        return text
+    return _compact(text, STAGE_TOKEN_BUDGETS.get(stage, 0), f"cv/{stage}")
+
+
+def compact_job_text(text):
+    """Descrição da vaga normalizada e limitada a JOB_TOKEN_BUDGET"""
+    if not COMPACTION_ENABLED or not text:
+        return text
+    return _compact(text, JOB_TOKEN_BUDGET, "job")
+
+
+def compact_schema(schema):
+    """Schema do prompt sem a indentação (o modelo não precisa dela)"""
+    if not COMPACTION_ENABLED or not schema:
+        return schema
+    return "\n".join(line.strip() for line in schema.strip().split("\n") if line.strip())
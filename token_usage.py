@@ -0,0 +1,179 @@
+"""
+Contabilidade de tokens e custo das chamadas ao LLM.
+
+Cada chamada feita por invoke_chain/ainvoke_chain/stream_chain tem o uso
+(tokens de entrada, de saída e de raciocínio) lido da resposta e, dentro de
+um escopo de uso, gravado no banco com a etapa (o span aberto: process_cv,
+analyze_cv_and_job, rewrite_cv...), o modelo, a vaga e o candidato.
+
+O escopo segue o contexto (contextvars), como a sessão das métricas: o app
+define a vaga uma vez por rerun e cada currículo abre um escopo de candidato.
+Chamadas feitas antes de o candidato ter id (a triagem) ficam com o nome e
+são associadas ao id com UsageScope.attach depois do registro.
+"""
+
+import contextvars
+import json
+import os
+from contextlib import contextmanager
+
+from storage import get_usage_ledger
+
+# Preço de referência por milhão de tokens (entrada, saída) em USD; confira a tabela
+# atual do provedor. LLM_PRICES (JSON {"modelo": [entrada, saída]}) sobrepõe/acrescenta modelos.
+DEFAULT_LLM_PRICES = {
+    "openai/gpt-oss-120b": (0.15, 0.60),
+    "openai/gpt-oss-20b": (0.075, 0.30),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+
+
+def _load_prices():
+    prices = dict(DEFAULT_LLM_PRICES)
+    try:
+        prices.update({model: tuple(value) for model, value in json.loads(os.getenv("LLM_PRICES") or "{}").items()})
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return prices
+
+
+LLM_PRICES = _load_prices()
+
+_scope = contextvars.ContextVar("usage_scope", default=None)
+
+
+class UsageScope:
+    """
+    Destino dos registros de uso: banco (path_json), vaga e candidato (id ou nome).
+    Guarda os ids dos registros e os totais das chamadas feitas no escopo
+    (incluindo as dos escopos de candidato abertos a partir dele).
+    """
+
+    def __init__(self, path_json, job_id=None, candidate_id=None, candidate_name=None, parent=None):
+        self.path_json = path_json
+        self.parent = parent
+        self.job_id = job_id
+        self.candidate_id = candidate_id
+        self.candidate_name = candidate_name
+        self.usage_ids = []
+        self.totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0,
+                       "total_tokens": 0, "cost_usd": 0.0}
+
+    def for_candidate(self, candidate):
+        """Escopo filho na mesma vaga para um candidato (id inteiro ou nome)"""
+        if isinstance(candidate, int):
+            return UsageScope(self.path_json, self.job_id, candidate_id=candidate, parent=self)
+        return UsageScope(self.path_json, self.job_id, candidate_name=candidate, parent=self)
+
+    def attach(self, candidate_id):
+        """Associa ao candidato (já registrado) as chamadas feitas neste escopo"""
+        if candidate_id is None:
+            return
+        self.candidate_id = candidate_id
+        get_usage_ledger(self.path_json).assign_candidate(self.usage_ids, candidate_id)
+
+
+def set_usage_scope(path_json, job_id=None):
+    """Grava o uso das próximas chamadas do contexto atual no banco de path_json, para a vaga"""
+    _scope.set(UsageScope(path_json, job_id) if path_json else None)
+
+
+def current_usage_scope():
+    return _scope.get()
+
+
+@contextmanager
+def usage_scope(path_json, job_id=None):
+    """Versão com escopo delimitado de set_usage_scope"""
+    token = _scope.set(UsageScope(path_json, job_id))
+    try:
+        yield _scope.get()
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def candidate_usage(candidate):
+    """
+    Atribui ao candidato (id inteiro ou nome) o uso das chamadas do bloco.
+    Sem escopo de uso ativo, o bloco roda normalmente e o escopo é None.
+    """
+    parent = _scope.get()
+    if parent is None:
+        yield None
+        return
+    token = _scope.set(parent.for_candidate(candidate))
+    try:
+        yield _scope.get()
+    finally:
+        _scope.reset(token)
+
+
+async def run_for_candidate(candidate, coro):
+    """Aguarda a corrotina atribuindo o uso ao candidato (para tarefas de asyncio.gather)"""
+    with candidate_usage(candidate):
+        return await coro
+
+
+def extract_usage(output):
+    """
+    Tokens da resposta: prompt_tokens, completion_tokens, reasoning_tokens e total_tokens.
+
+    Lê usage_metadata do LangChain e, se ausente (ex.: resposta do cache), o
+    token_usage bruto do provedor em response_metadata.
+    """
+    metadata = getattr(output, "usage_metadata", None)
+    if metadata:
+        prompt = metadata.get("input_tokens") or 0
+        completion = metadata.get("output_tokens") or 0
+        reasoning = (metadata.get("output_token_details") or {}).get("reasoning") or 0
+        total = metadata.get("total_tokens") or prompt + completion
+    else:
+        raw = (getattr(output, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt = raw.get("prompt_tokens") or raw.get("input_tokens") or 0
+        completion = raw.get("completion_tokens") or raw.get("output_tokens") or 0
+        details = raw.get("completion_tokens_details") or raw.get("output_tokens_details") or {}
+        reasoning = details.get("reasoning_tokens") or 0
+        total = raw.get("total_tokens") or prompt + completion
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "reasoning_tokens": reasoning,
+            "total_tokens": total}
+
+
+def estimate_cost(model, usage):
+    """Custo estimado em USD (None se o modelo não tiver preço configurado)"""
+    price = LLM_PRICES.get(model)
+    if price is None:
+        return None
+    return (usage["prompt_tokens"] * price[0] + usage["completion_tokens"] * price[1]) / 1_000_000
+
+
+def record_llm_call(output, model, stage, latency_ms=None, cached=False):
+    """
+    Registra o uso de uma chamada no escopo ativo (se houver).
+
+    Returns:
+        dict: Tokens da chamada (para os atributos do span)
+    """
+    usage = extract_usage(output)
+    scope = _scope.get()
+    if scope is None:
+        return usage
+    cost = None if cached else estimate_cost(model, usage)
+    usage_id = get_usage_ledger(scope.path_json).record(
+        usage, stage or "other", model=model, job_id=scope.job_id, candidate_id=scope.candidate_id,
+        candidate_name=scope.candidate_name, latency_ms=latency_ms, cached=cached, cost_usd=cost,
+    )
+    scope.usage_ids.append(usage_id)
+    while scope is not None and not cached:
+        scope.totals["calls"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "reasoning_tokens", "total_tokens"):
+            scope.totals[key] += usage[key]
+        scope.totals["cost_usd"] += cost or 0.0
+        scope = scope.parent
+    return usage
+
+
+def usage_summary(path_json, group_by=("stage", "model"), job_id=None, candidate_id=None):
+    """Consumo agregado do banco de path_json (ver UsageLedger.summary)"""
+    return get_usage_ledger(path_json).summary(group_by=group_by, job_id=job_id, candidate_id=candidate_id)
@@ -1,43 +1,354 @@
 
 import os
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
+import sys
+import importlib
 import json
-import pandas as pd
 import csv
-import streamlit as st
 import re
+import asyncio
+import contextvars
+import time
+import itertools
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from importlib.util import find_spec
 from io import BytesIO
-
-# Importa PyMuPDF (mais simples e confiável)
-try:
-    import fitz  # PyMuPDF
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    PYMUPDF_AVAILABLE = False
-
-# Tenta importar docling como opção alternativa (pode ter problemas de permissão no Windows)
+from llm_clients import get_llm_registry
+from llm_scheduler import LANE_BATCH, LANE_INTERACTIVE, LANE_NAMES, estimate_tokens, get_llm_scheduler, llm_lane, set_llm_lane
+from metrics import current_session, current_stage, get_metrics, run_in_session, set_session as set_metrics_session, span, timed
+from llm_cache import get_llm_cache, is_deterministic, llm_model_name, make_cache_key
+from parse_cache import file_sha256, get_parse_cache
+from storage import get_candidate_store, get_job_registry, render_job_details
+from prescreen import rank_agreement, rank_candidates, select_top
+from skill_index import QuerySyntaxError, get_skill_index, index_candidate
+from docling_pool import get_docling_pool
+from model_cascade import CASCADE_BAND_HIGH, CASCADE_BAND_LOW, CASCADE_ENABLED, CASCADE_FAST_MODEL, ROUTE_FAST, describe as describe_cascade, escalation_reason, get_cascade_stats
+from token_usage import candidate_usage, current_usage_scope, extract_usage, record_llm_call, run_for_candidate, set_usage_scope, usage_scope, usage_summary
+from text_compaction import compact_cv_text, compact_job_text, compact_schema
+from cv_markdown import BULLET, DEFAULT_SECTION_ICON, ITALIC_ITEM, NOTE, SEPARATOR, SubtitleGroup, get_cv_document
+
+# Backends pesados (langchain, pandas, PyMuPDF, reportlab, python-docx) são importados
+# no primeiro uso, dentro das funções; veja import_budget.py para o tempo de import.
+
+
+class _LazyModule:
+  """Módulo importado no primeiro acesso a um atributo"""
+
+  def __init__(self, name):
+    self._name = name
+
+  def __getattr__(self, attr):
+    module = importlib.import_module(self._name)
+    self.__dict__.update(module.__dict__)
+    return getattr(module, attr)
+
+
+# No app o Streamlit já está carregado; na CLI ele só é importado se alguma mensagem for exibida
+st = sys.modules.get("streamlit") or _LazyModule("streamlit")
+# Modelos tipados das respostas (pydantic), carregados na primeira chamada estruturada
+structured_output = _LazyModule("structured_output")
+
+# PyMuPDF (mais simples e confiável): só verifica se está instalado
+PYMUPDF_AVAILABLE = find_spec("fitz") is not None
+
+# docling como opção alternativa (pode ter problemas de permissão no Windows).
+# Só verifica se está instalado: os modelos são carregados nos workers de docling_pool
 try:
-    from docling.document_converter import DocumentConverter
-    DOCLING_AVAILABLE = True
+    DOCLING_AVAILABLE = find_spec("docling") is not None
 except Exception:
     DOCLING_AVAILABLE = False
 
 # Verifica se pelo menos uma biblioteca está disponível
 if not PYMUPDF_AVAILABLE and not DOCLING_AVAILABLE:
-    import sys
     print("ERRO: Nenhuma biblioteca de PDF disponível. Instale PyMuPDF: pip install PyMuPDF")
     sys.exit(1)
 
-def load_llm(id_model, temperature):
-  llm = ChatGroq(
-      model=id_model,
-      temperature=temperature,
-      max_tokens=None,
-      timeout=None,
-      max_retries=2,
-  )
-  return llm
+def load_llm(id_model, temperature, **options):
+  """
+  Retorna o modelo compartilhado pelo processo para (modelo, temperatura, opções).
+
+  Reruns e sessões do Streamlit reaproveitam o mesmo cliente e suas conexões
+  HTTP (pool limitado, keep-alive e timeout explícito; veja llm_clients.py).
+  """
+  return get_llm_registry().get(id_model, temperature, **options)
+
+
+def set_llm_concurrency(limit):
+  """Define o número máximo de chamadas simultâneas ao LLM (teto do limite adaptativo do agendador)."""
+  get_llm_scheduler().configure(max_concurrency=limit)
+
+
+def _total_tokens(output):
+  return extract_usage(output)["total_tokens"] or None
+
+
+def _scheduled(s, ticket):
+  """Atributos do span "llm" vindos do agendador: faixa e espera na fila (fora da latência do provedor)"""
+  s["lane"] = LANE_NAMES.get(ticket.lane, ticket.lane)
+  s["queue_ms"] = round(ticket.wait_ms, 3)
+
+
+def _cache_lookup(prompt_template, llm, inputs, options=None):
+  """
+  Consulta o cache de respostas. Só é usado no modo determinístico (temperatura 0),
+  em que repetir a chamada produziria a mesma resposta.
+
+  Returns:
+    tuple: (chave ou None, AIMessage do cache ou None)
+  """
+  if not is_deterministic(llm):
+    return None, None
+  cache = get_llm_cache()
+  if cache is None:
+    return None, None
+  key = make_cache_key(prompt_template, llm, inputs, options)
+  hit = cache.get(key)
+  if hit is None:
+    return key, None
+  from langchain_core.messages import AIMessage
+  return key, AIMessage(content=hit["content"], response_metadata={**hit["metadata"], "cache_hit": True})
+
+
+def _cache_store(key, llm, output):
+  cache = get_llm_cache()
+  if key is None or cache is None or not output.content:
+    return
+  cache.put(key, output.content, model=llm_model_name(llm), metadata=output.response_metadata)
+
+
+# Modo JSON do provedor (response_format) nas chamadas que esperam um objeto JSON
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1") != "0"
+
+
+def _call_options(json_mode):
+  return {"response_format": {"type": "json_object"}} if json_mode and LLM_JSON_MODE else None
+
+
+def invoke_chain(prompt_template, llm, inputs, json_mode=False):
+  """
+  Executa prompt_template | llm passando pelo cache de respostas.
+  Com json_mode, pede ao provedor uma resposta em JSON (response_format).
+  """
+  options = _call_options(json_mode)
+  stage = current_stage()
+  with span("llm", model=llm_model_name(llm)) as s:
+    key, cached = _cache_lookup(prompt_template, llm, inputs, options)
+    if cached is not None:
+      s["cache_hit"] = True
+      record_llm_call(cached, llm_model_name(llm), stage, cached=True)
+      return cached
+    chain = prompt_template | (llm.bind(**options) if options else llm)
+    started = time.perf_counter()
+    # O agendador dá a vaga (prioridade, orçamento por minuto, limite adaptativo) e refaz os 429
+    output, ticket = get_llm_scheduler().run(lambda: chain.invoke(inputs), estimate_tokens(inputs), _total_tokens)
+    _scheduled(s, ticket)
+    s.attrs.update(record_llm_call(output, llm_model_name(llm), stage, (time.perf_counter() - started) * 1000 - ticket.wait_ms))
+  _cache_store(key, llm, output)
+  return output
+
+
+async def ainvoke_chain(prompt_template, llm, inputs, json_mode=False):
+  """Versão assíncrona de invoke_chain (mesmo agendador, sem bloquear o event loop)."""
+  options = _call_options(json_mode)
+  stage = current_stage()
+  with span("llm", model=llm_model_name(llm)) as s:
+    key, cached = _cache_lookup(prompt_template, llm, inputs, options)
+    if cached is not None:
+      s["cache_hit"] = True
+      record_llm_call(cached, llm_model_name(llm), stage, cached=True)
+      return cached
+    # O cliente assíncrono do httpx não pode ser reaproveitado entre event loops
+    bound_llm = get_llm_registry().for_running_loop(llm)
+    chain = prompt_template | (bound_llm.bind(**options) if options else bound_llm)
+    started = time.perf_counter()
+    output, ticket = await get_llm_scheduler().arun(lambda: chain.ainvoke(inputs), estimate_tokens(inputs), _total_tokens)
+    _scheduled(s, ticket)
+    s.attrs.update(record_llm_call(output, llm_model_name(llm), stage, (time.perf_counter() - started) * 1000 - ticket.wait_ms))
+  _cache_store(key, llm, output)
+  return output
+
+
+# Reparo com uma chamada curta ("corrija este JSON") quando o reparo local não basta
+LLM_JSON_REPAIR_CALL = os.getenv("LLM_JSON_REPAIR_CALL", "1") != "0"
+# Tamanho máximo (caracteres) da resposta inválida enviada na chamada de reparo
+JSON_REPAIR_MAX_CHARS = 12000
+
+
+def create_json_fix_prompt_template():
+  """Cria o template de prompt da chamada de reparo de JSON"""
+  from langchain_core.prompts import ChatPromptTemplate
+  return ChatPromptTemplate.from_template("""
+O JSON abaixo, gerado por você, está inválido ou incompleto ({error}).
+Corrija-o para seguir o schema, mantendo todo o conteúdo já presente e completando o que faltar de forma concisa.
+Responda apenas com o JSON corrigido, sem explicações.
+Schema:
+{schema}
+
+JSON:
+{response}
+""")
+
+
+def _failed_output(error):
+  """AIMessage com o texto rejeitado pelo modo JSON do provedor (ou relança o erro)"""
+  text = structured_output.failed_generation(error)
+  if text is None:
+    raise error
+  from langchain_core.messages import AIMessage
+  return AIMessage(content=text, response_metadata={"json_validate_failed": True})
+
+
+def _repair_inputs(text, error, schema):
+  return {"schema": compact_schema(schema), "error": error, "response": text[:JSON_REPAIR_MAX_CHARS]}
+
+
+def invoke_structured(prompt_template, llm, inputs, model, schema, repair_call=None):
+  """
+  Chamada que espera um JSON no formato do modelo tipado (structured_output).
+
+  A resposta é pedida no modo JSON, validada e, se malformada ou cortada, passa
+  pelo reparo local; só se ainda assim falhar é feita uma chamada curta de
+  reparo (sem o prompt original), em vez de repetir a chamada inteira.
+  repair_call=False dispensa essa chamada (padrão: LLM_JSON_REPAIR_CALL).
+
+  Returns:
+    tuple: (saída do modelo, dict validado ou None)
+  """
+  try:
+    output = invoke_chain(prompt_template, llm, inputs, json_mode=True)
+  except Exception as e:
+    output = _failed_output(e)
+  with span("json_parse", schema=model.__name__):
+    data, error = structured_output.parse_structured(output.content, model)
+  if data is None and (LLM_JSON_REPAIR_CALL if repair_call is None else repair_call) and output.content:
+    try:
+      with span("json_repair", schema=model.__name__):
+        fixed = invoke_chain(create_json_fix_prompt_template(), llm, _repair_inputs(output.content, error, schema), json_mode=True).content
+    except Exception as e:
+      fixed = structured_output.failed_generation(e) or ""
+    with span("json_parse", schema=model.__name__, repair_call=True):
+      data, _ = structured_output.parse_structured(fixed, model)
+  return output, data
+
+
+async def ainvoke_structured(prompt_template, llm, inputs, model, schema, repair_call=None):
+  """Versão assíncrona de invoke_structured."""
+  try:
+    output = await ainvoke_chain(prompt_template, llm, inputs, json_mode=True)
+  except Exception as e:
+    output = _failed_output(e)
+  with span("json_parse", schema=model.__name__):
+    data, error = structured_output.parse_structured(output.content, model)
+  if data is None and (LLM_JSON_REPAIR_CALL if repair_call is None else repair_call) and output.content:
+    try:
+      with span("json_repair", schema=model.__name__):
+        fixed = (await ainvoke_chain(create_json_fix_prompt_template(), llm, _repair_inputs(output.content, error, schema), json_mode=True)).content
+    except Exception as e:
+      fixed = structured_output.failed_generation(e) or ""
+    with span("json_parse", schema=model.__name__, repair_call=True):
+      data, _ = structured_output.parse_structured(fixed, model)
+  return output, data
+
+
+def stream_chain(prompt_template, llm, inputs):
+  """
+  Versão em streaming de invoke_chain: gera o texto bruto do modelo em pedaços.
+  Em um acerto do cache, gera a resposta inteira de uma vez; senão, grava a resposta
+  completa no cache ao final do stream.
+  """
+  stage = current_stage()
+  key, cached = _cache_lookup(prompt_template, llm, inputs)
+  if cached is not None:
+    record_llm_call(cached, llm_model_name(llm), stage, cached=True)
+    yield cached.content
+    return
+  output = None
+  scheduler = get_llm_scheduler()
+  tokens = estimate_tokens(inputs)
+  with span("llm", nest=False, model=llm_model_name(llm), stream=True) as s:
+    for attempt in itertools.count():
+      ticket = scheduler.acquire(tokens)
+      _scheduled(s, ticket)
+      started = time.perf_counter()
+      try:
+        for chunk in (prompt_template | llm).stream(inputs):
+          output = chunk if output is None else output + chunk
+          if chunk.content:
+            yield chunk.content
+      except Exception as e:
+        # Só repete se nada foi entregue ainda; depois do primeiro pedaço o erro sobe
+        delay = scheduler.release(ticket, error=e, attempt=attempt if output is None else scheduler.max_retries)
+        if delay is None:
+          raise
+        time.sleep(delay)
+        continue
+      finally:
+        # Fim normal ou gerador fechado no meio do stream (release é idempotente)
+        scheduler.release(ticket, used_tokens=_total_tokens(output) if output is not None else None,
+                          cancelled=output is None)
+      break
+    if output is not None:
+      s.attrs.update(record_llm_call(output, llm_model_name(llm), stage, (time.perf_counter() - started) * 1000))
+  if output is not None:
+    _cache_store(key, llm, output)
+
+
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+
+def _background_loop():
+  """
+  Event loop de fundo, único no processo, em que rodam as corrotinas de run_async.
+
+  Um loop por operação (asyncio.run) criaria a cada "Reformular todos" ou matriz
+  um cliente HTTP assíncrono novo (ver LLMClientRegistry.for_running_loop), sem
+  reaproveitar conexões e sem fechá-lo; com um loop longo, o cliente é um só.
+  """
+  global _async_loop
+  with _async_loop_lock:
+    if _async_loop is None:
+      loop = asyncio.new_event_loop()
+      threading.Thread(target=loop.run_forever, name="async-loop", daemon=True).start()
+      _async_loop = loop
+    return _async_loop
+
+
+def run_async(coro):
+  """Executa uma corrotina a partir de código síncrono (ex.: script do Streamlit ou a CLI)."""
+  loop = _background_loop()
+  try:
+    running = asyncio.get_running_loop()
+  except RuntimeError:
+    running = None
+  if running is loop:
+    # Chamada de dentro do próprio loop de fundo: esperar nele travaria o loop
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      return executor.submit(asyncio.run, coro).result()
+
+  from concurrent.futures import Future
+  future = Future()
+  # A tarefa herda o contexto de quem chamou (sessão das métricas, escopo de uso, faixa do agendador)
+  context = contextvars.copy_context()
+
+  def start():
+    task = context.run(loop.create_task, coro)
+
+    def done(task):
+      if task.cancelled():
+        future.cancel()
+      elif task.exception() is not None:
+        future.set_exception(task.exception())
+      else:
+        future.set_result(task.result())
+
+    task.add_done_callback(done)
+
+  loop.call_soon_threadsafe(start)
+  return future.result()
 
 
 def format_res(res, return_thinking=False):
@@ -54,29 +365,117 @@ def format_res(res, return_thinking=False):
   return res
 
 
-def parse_doc(file_path):
+class ThinkStripper:
+  """
+  Remove o raciocínio (<think>...</think>) de um stream de texto, pedaço a pedaço,
+  com o mesmo resultado de format_res: nada do raciocínio é exibido e o texto
+  visível começa sem espaços iniciais. Um </think> sem <think> de abertura só é
+  percebido depois de exibido; aplicar format_res ao texto final cobre esse caso.
+  Um <think> que nunca se fecha é exibido inteiro no flush, como format_res faz.
+  """
+
+  OPEN_TAG = "<think>"
+  CLOSE_TAG = "</think>"
+
+  def __init__(self):
+    self._buffer = ""
+    self._state = "start"  # start -> thinking -> answer
+    self._started = False
+    self._scanned = 0  # posição do buffer já procurada por </think>
+
+  def _emit(self, text):
+    if not self._started:
+      text = text.lstrip()
+      self._started = bool(text)
+    return text
+
+  def feed(self, chunk):
+    """Recebe um pedaço do stream e retorna a parte que já pode ser exibida"""
+    if self._state == "answer":
+      return self._emit(chunk)
+
+    self._buffer += chunk
+    if self._state == "start":
+      head = self._buffer.lstrip()
+      if head.startswith(self.OPEN_TAG):
+        self._state = "thinking"
+        self._buffer = head[len(self.OPEN_TAG):]
+      elif self.OPEN_TAG.startswith(head):
+        # Ainda pode ser o início de <think>: espera o próximo pedaço
+        return ""
+      else:
+        self._state = "answer"
+        text, self._buffer = self._buffer, ""
+        return self._emit(text)
+
+    # O raciocínio fica retido (para o caso de o </think> nunca chegar); a busca
+    # recomeça pouco antes do fim anterior, para reconhecer a tag dividida entre pedaços
+    end = self._buffer.find(self.CLOSE_TAG, self._scanned)
+    if end == -1:
+      self._scanned = max(0, len(self._buffer) - len(self.CLOSE_TAG) + 1)
+      return ""
+    self._state = "answer"
+    text, self._buffer = self._buffer[end + len(self.CLOSE_TAG):], ""
+    return self._emit(text)
+
+  def flush(self):
+    """
+    Texto retido no fim do stream: resposta curta que parecia o início de <think>
+    ou, sem </think>, o raciocínio inteiro (format_res também o devolveria).
+    """
+    text, self._buffer = self._buffer, ""
+    if self._state == "thinking":
+      return self._emit(self.OPEN_TAG + text).rstrip()
+    return self._emit(text) if self._state == "start" else ""
+
+
+@lru_cache(maxsize=None)
+def _engine_version(engine):
+  """Versão instalada do motor de extração (faz parte da chave do cache de parse)"""
+  from importlib.metadata import version
+  try:
+    # Metadados do pacote: não importa o motor só para montar a chave do cache
+    return version("PyMuPDF" if engine == "pymupdf" else "docling")
+  except Exception:
+    return "unknown"
+
+
+@timed("parse_doc")
+def parse_doc(file_path, use_cache=True, max_pages=None):
   """
   Extrai texto de um arquivo PDF usando PyMuPDF (padrão) ou docling como alternativa.
   
+  O resultado fica em cache pelo SHA-256 do arquivo + motor + versão do motor,
+  então o mesmo PDF nunca é extraído duas vezes (nem entre sessões).
+  Com PyMuPDF, documentos grandes têm as páginas divididas entre processos.
+  
   Args:
     file_path: Caminho para o arquivo PDF
+    use_cache: Se False, ignora o cache de texto extraído
+    max_pages: Lê no máximo essa quantidade de páginas com PyMuPDF
+      (None = pdf_pages.PDF_MAX_PAGES; 0 = sem limite)
     
   Returns:
     str: Conteúdo do PDF em formato texto
   """
+  cache = get_parse_cache() if use_cache else None
+  sha256 = file_sha256(file_path) if cache is not None else None
+
   # Usa PyMuPDF por padrão (mais simples e confiável)
   if PYMUPDF_AVAILABLE:
+    import pdf_pages
+    max_pages = pdf_pages.PDF_MAX_PAGES if max_pages is None else max_pages
+    options = f"max_pages={max_pages}" if max_pages else ""
+    if cache is not None:
+      cached = cache.get(sha256, "pymupdf", _engine_version("pymupdf"), options)
+      if cached is not None:
+        return cached
     try:
-      doc = fitz.open(file_path)
-      content = ""
-      for page_num in range(len(doc)):
-        page = doc[page_num]
-        text = page.get_text()
-        if text:
-          content += f"\n--- Página {page_num + 1} ---\n"
-          content += text
-      doc.close()
-      return content.strip()
+      with span("pdf_extract", engine="pymupdf"):
+        content = _parse_with_pymupdf(file_path, max_pages=max_pages)
+      if cache is not None:
+        cache.put(sha256, "pymupdf", _engine_version("pymupdf"), content, options)
+      return content
     except Exception as e:
       st.error(f"Erro ao processar PDF com PyMuPDF: {e}")
       # Tenta docling como fallback se PyMuPDF falhar
@@ -87,13 +486,19 @@ def parse_doc(file_path):
   
   # Fallback para docling (se PyMuPDF não estiver disponível ou falhar)
   if DOCLING_AVAILABLE:
+    if cache is not None:
+      cached = cache.get(sha256, "docling", _engine_version("docling"))
+      if cached is not None:
+        return cached
     try:
       # Configura variável de ambiente para evitar problemas de cache
       os.environ.setdefault('HF_HOME', os.path.join(os.getcwd(), '.hf_cache'))
       
-      converter = DocumentConverter()
-      result = converter.convert(file_path)
-      content = result.document.export_to_markdown()
+      # Conversores já inicializados em processos separados (sem recarregar os modelos)
+      with span("pdf_extract", engine="docling"):
+        content = get_docling_pool().convert(file_path)
+      if cache is not None:
+        cache.put(sha256, "docling", _engine_version("docling"), content)
       return content
     except (OSError, PermissionError) as e:
       st.error(f"Erro de permissão com docling: {e}")
@@ -107,20 +512,28 @@ def parse_doc(file_path):
   raise ImportError("Nenhuma biblioteca de PDF disponível. Instale PyMuPDF: pip install PyMuPDF")
 
 
+def _parse_with_pymupdf(file_path, max_pages=None):
+  import pdf_pages
+  return pdf_pages.extract_text(file_path, max_pages=max_pages)
+
+
 def parse_res_llm(response_text: str, required_fields: list) -> dict:
     try:
         # Remove a parte do raciocínio (<think>...</think>)
         if "</think>" in response_text:
             response_text = response_text.split("</think>")[-1].strip()
 
-        # Localiza o JSON e faz o parsing
-        start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}') + 1
-        if start_idx == -1 or end_idx == 0:
+        # Localiza o objeto JSON (balanceando as chaves) e, se malformado, tenta o reparo local
+        json_str = structured_output.extract_json(response_text)
+        if json_str is None:
             raise json.JSONDecodeError("Nenhum JSON encontrado na resposta", response_text, 0)
 
-        json_str = response_text[start_idx:end_idx]
-        info_cv = json.loads(json_str)
+        try:
+            info_cv = json.loads(json_str)
+        except json.JSONDecodeError:
+            info_cv = json.loads(structured_output.repair_json(json_str))
+        if not isinstance(info_cv, dict):
+            raise json.JSONDecodeError("A resposta não é um objeto JSON", response_text, 0)
 
         for field in required_fields:
             if field not in info_cv:
@@ -133,32 +546,27 @@ def parse_res_llm(response_text: str, required_fields: list) -> dict:
         return
 
 
+@timed("save_json_cv")
 def save_json_cv(new_data, path_json, key_name="name"):
-    # Carrega o JSON existente, se houver
-    if os.path.exists(path_json):
-        with open(path_json, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = []
-
-    if isinstance(data, dict):
-        data = [data]
-
-    # Verifica se já existe um currículo com o mesmo nome
-    candidates = [entry.get(key_name) for entry in data]
-    if new_data.get(key_name) in candidates:
+    """
+    Registra o candidato no banco SQLite associado a path_json (curriculos.json -> curriculos.db).
+    O JSON legado é migrado automaticamente na primeira chamada.
+    
+    Returns:
+        int: id do candidato, ou None se já registrado
+    """
+    store = get_candidate_store(path_json)
+    candidate_id = store.insert(new_data, key_name=key_name)
+    if candidate_id is None:
         st.warning(f"Currículo '{new_data.get(key_name)}' já registrado. Ignorando.")
-        return
-
-    # Adiciona e salva
-    data.append(new_data)
-    with open(path_json, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    else:
+        index_candidate(path_json, candidate_id, new_data)
+    return candidate_id
 
 
+@timed("load_json_cv")
 def load_json_cv(path_json):
-    with open(path_json, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return [record for _, record in get_candidate_store(path_json).iter_all()]
 
 
 def generate_cv_content_from_json(cv_data):
@@ -260,54 +668,627 @@ def save_job_to_csv(data, filename):
 
 
 def load_job(csv_path):
+  import pandas as pd
   try:
     df = pd.read_csv(csv_path, sep=';', encoding='utf-8')
     job = df.iloc[-1]
-    prompt_text = f"""
-    **Vaga para {job['title']}**
+    return render_job_details(job)
+
+  except FileNotFoundError:
+    return "Erro: Arquivo de vagas não encontrado"
+
+
+# ============================================
+# COMPILAÇÃO DA VAGA - Resumo estruturado dos requisitos
+# ============================================
+
+# Os prompts usam o resumo de requisitos da vaga (compilado uma única vez e
+# persistido em jobs.digest) no lugar do texto completo. JOB_DIGEST_ENABLED=0 volta ao texto completo.
+JOB_DIGEST_ENABLED = os.getenv("JOB_DIGEST_ENABLED", "1") != "0"
+
+JOB_DIGEST_SCHEMA = """
+{
+  "seniority": "Nível da vaga (ex.: Júnior, Pleno, Sênior, Especialista)",
+  "summary": "Missão do cargo em 1-2 frases",
+  "must_have": [{"requirement": "Requisito obrigatório", "weight": 5}],
+  "nice_to_have": [{"requirement": "Requisito desejável", "weight": 2}],
+  "responsibilities": ["Principais responsabilidades, uma frase curta cada"],
+  "soft_skills": ["Competências comportamentais pedidas"],
+  "keywords": ["Tecnologias, ferramentas e termos-chave da vaga"]
+}
+"""
+
+
+def create_job_digest_prompt_template():
+    """Cria o template de prompt que compila a vaga em um resumo de requisitos"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template("""
+Você é um especialista em Recrutamento e Seleção.
+Sua tarefa é condensar a descrição da vaga abaixo em um resumo estruturado de requisitos, que será usado
+no lugar da descrição completa para avaliar candidatos.
+Separe requisitos obrigatórios (must_have) de desejáveis (nice_to_have) e atribua a cada um um peso
+inteiro de 1 (pouco relevante) a 5 (decisivo para a vaga). Seja conciso: frases curtas, sem repetir itens,
+sem inventar requisitos que não estejam na vaga.
+Responda apenas com o JSON no formato abaixo, sem explicações.
+Schema desejado:
+{schema}
+
+---
+
+Vaga:
+'{job}'
+""")
 
-    **Descrição da Vaga:**
-    {job['description']}
 
-    **Detalhes Completos:**
-    {job['details']}
+@timed("compile_job_digest")
+def compile_job_digest(llm, job_details):
     """
+    Extrai o resumo de requisitos (pesos, obrigatórios e desejáveis) do texto da vaga.
 
-    return prompt_text.strip()
+    Returns:
+        dict: Resumo no formato JOB_DIGEST_SCHEMA, ou None se a resposta for inválida
+    """
+    _, digest = invoke_structured(create_job_digest_prompt_template(), llm, {
+        "schema": compact_schema(JOB_DIGEST_SCHEMA),
+        "job": compact_job_text(job_details)
+    }, structured_output.JobDigest, JOB_DIGEST_SCHEMA)
+    return digest
 
-  except FileNotFoundError:
-    return "Erro: Arquivo de vagas não encontrado"
 
-def process_cv(schema, job_details, prompt_template, prompt_score, llm, file_path):
+def ensure_job_digest(llm, path_json, job_id, force=False):
+    """
+    Compila e persiste o resumo de requisitos da vaga, se ainda não existir (ou se force).
 
-  if file_path:
-    if not os.path.exists(file_path):
-      raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+    Returns:
+        dict: Resumo da vaga, ou None se a compilação falhar (os prompts usam o texto completo)
+    """
+    registry = get_job_registry(path_json)
+    digest = None if force else registry.get_digest(job_id)
+    # Resumos sem obrigatórios (gravados antes da validação) são recompilados
+    if digest is not None and digest.get("must_have"):
+        return digest
+    job_details = registry.job_details(job_id)
+    if not job_details:
+        return None
+    try:
+        digest = compile_job_digest(llm, job_details)
+    except Exception as e:
+        print(f"Erro ao compilar os requisitos da vaga {job_id}: {e}")  # Log para debug
+        return None
+    if digest is not None:
+        registry.set_digest(job_id, digest)
+    return digest
+
+
+def _digest_items(items):
+    lines = []
+    for item in items or []:
+        if isinstance(item, dict):
+            weight = item.get("weight")
+            prefix = f"[peso {weight}] " if weight not in (None, "") else ""
+            lines.append(f"- {prefix}{item.get('requirement', '')}")
+        else:
+            lines.append(f"- {item}")
+    return "\n".join(lines)
+
+
+def render_job_digest(digest, title=""):
+    """Texto do resumo de requisitos usado nos prompts no lugar da descrição completa"""
+    parts = [f"**Vaga para {title}**" + (f" ({digest['seniority']})" if digest.get("seniority") else "")]
+    if digest.get("summary"):
+        parts.append(f"**Missão:** {digest['summary']}")
+    parts.append("**Requisitos obrigatórios (peso de 1 a 5):**\n" + _digest_items(digest.get("must_have")))
+    if digest.get("nice_to_have"):
+        parts.append("**Desejáveis:**\n" + _digest_items(digest["nice_to_have"]))
+    if digest.get("responsibilities"):
+        parts.append("**Responsabilidades:**\n" + _digest_items(digest["responsibilities"]))
+    if digest.get("soft_skills"):
+        parts.append("**Competências comportamentais:** " + ", ".join(map(str, digest["soft_skills"])))
+    if digest.get("keywords"):
+        parts.append("**Palavras-chave:** " + ", ".join(map(str, digest["keywords"])))
+    return "\n\n".join(parts)
+
+
+def job_prompt_text(path_json, job_id, job_details):
+    """
+    Texto da vaga para os prompts: o resumo de requisitos persistido, se houver,
+    ou job_details. A pré-triagem local continua usando o texto completo.
+    """
+    if not JOB_DIGEST_ENABLED or not job_id:
+        return job_details
+    registry = get_job_registry(path_json)
+    digest = registry.get_digest(job_id)
+    if not digest:
+        return job_details
+    job = registry.get(job_id) or {}
+    return render_job_digest(digest, job.get("title", ""))
+
+
+# ============================================
+# AGENTE DE TRIAGEM - Extrai dados e pontua o currículo
+# ============================================
+
+CV_SCHEMA = """
+{
+  "name": "Nome completo do candidato",
+  "position": "Posição do candidato",
+  "summary": "Resumo objetivo sobre o perfil profissional do candidato",
+  "hard_skills": ["competência 1", "competência 2", "..."],
+  "soft_skills": ["competência 1", "competência 2", "..."],
+  "academic_info": [{
+    "title": "Título do curso",
+    "institution": "Instituição",
+    "year": "Ano"
+  },{...}],
+  "training_courses": [{
+    "title": "Título do curso",
+    "institution": "Instituição"
+  }, "..."],
+  "experiences": [{"position": "Posição", "company": "Empresa", "start_date": "Data de início", "end_date": "Data de fim", "description": "Descrição da experiência"}, {...}],
+  "certifications": ["certificação 1", "certificação 2", "..."],
+  "interview_questions": ["Pelo menos 3 perguntas úteis para entrevista com base no currículo, para esclarecer algum ponto ou explorar melhor"],
+  "strengths": ["Pontos fortes e aspectos que indicam alinhamento com o perfil ou vaga desejada"],
+  "areas_for_development": ["Pontos que indicam possíveis lacunas, fragilidades ou necessidades de desenvolvimento"],
+  "important_considerations": ["Observações específicas que merecem verificação ou cuidado adicional"],
+  "final_recommendations": "Resumo avaliativo final com sugestões de próximos passos (ex: seguir com entrevista, indicar para outra vaga)",
+  "score": 0.0
+}
+"""
+
+CV_FIELDS = [
+    "name",
+    "position",
+    "summary",
+    "hard_skills",
+    "soft_skills",
+    "academic_info",
+    "training_courses",
+    "experiences",
+    "certifications",
+    "interview_questions",
+    "strengths",
+    "areas_for_development",
+    "important_considerations",
+    "final_recommendations",
+    "score"
+]
+
+PROMPT_SCORE = """
+Com base na vaga específica, calcule a pontuação final (de 0.0 a 10.0).
+O retorno para esse campo deve conter apenas a pontuação final (x.x) sem mais nenhum texto ou anotação.
+Seja justo e rigoroso ao atribuir as notas. A nota 10.0 só deve ser atribuída para candidaturas que superem todas as expectativas da vaga.
+
+Critérios de avaliação:
+1. Experiência (Peso: 35% do total): Análise de posições anteriores, tempo de atuação e similaridade com as responsabilidades da vaga.
+2. Habilidades Técnicas (Peso: 20% do total): Verifique o alinhamento das habilidades técnicas com os requisitos mencionados na vaga.
+3. Soft Skills (Peso: 5% do total): Verifique o alinhamento das soft skills com os requisitos mencionados na vaga.
+4. Educação (Peso: 15% do total): Avalie a relevância da graduação/certificações para o cargo, incluindo instituições e anos de estudo.
+5. Pontos Fortes (Peso: 15% do total): Avalie a relevância dos pontos fortes (ou alinhamentos) para a vaga.
+6. Pontos Fracos (Desconto de até 10%): Avalie a gravidade dos pontos fracos (ou desalinhamentos) para a vaga.
+7. Cursos (Peso: 5% do total): Avalie a relevância dos cursos para a vaga.
+"""
+
+def create_triage_prompt_template():
+    """Cria o template de prompt para o agente de triagem"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template("""
+Você é um especialista em Recursos Humanos com vasta experiência em análise de currículos.
+Sua tarefa é analisar o conteúdo a seguir e extrair os dados conforme o formato abaixo, para cada um dos campos.
+Responda apenas com o JSON estruturado e utilize somente essas chaves. Cuide para que os nomes das chaves sejam exatamente esses.
+Não adicione explicações ou anotações fora do JSON.
+Schema desejado:
+{schema}
+
+---
+Para o cálculo do campo score:
+{prompt_score}
+
+---
+
+Currículo a ser analisado:
+'{cv}'
+
+---
+
+Vaga que o candidato está se candidatando:
+'{job}'
+
+""")
+
+
+def _triage_inputs(schema, content, job_details, prompt_score):
+  """Variáveis do prompt de triagem, com o currículo, a vaga e o schema compactados"""
+  return {
+    "schema": compact_schema(schema),
+    "cv": compact_cv_text(content, "triage"),
+    "job": compact_job_text(job_details),
+    "prompt_score": prompt_score
+  }
+
+
+@timed("process_cv")
+def process_cv(schema, job_details, prompt_template, prompt_score, llm, file_path, content=None):
 
-  content = parse_doc(file_path)
+  # Se o conteúdo já foi extraído (ex.: pipeline em lote), evita um novo parse do PDF
+  if content is None:
+    if file_path:
+      if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
 
-  chain = prompt_template | llm
-  output = chain.invoke({"schema": schema, "cv": content, "job": job_details, "prompt_score": prompt_score})
+    content = parse_doc(file_path)
 
-  res = format_res(output.content)
+  output, data = invoke_structured(prompt_template, llm, _triage_inputs(schema, content, job_details, prompt_score), structured_output.CVRecord, schema)
 
+  # JSON já validado (e reparado, se preciso); sem ele (nem após a chamada de reparo),
+  # res fica vazio e parse_res_llm retorna None, em vez de aceitar a resposta incompleta
+  res = json.dumps(data, ensure_ascii=False) if data is not None else ""
+
+  return output, res
+
+
+@timed("process_cv")
+async def aprocess_cv(schema, job_details, prompt_template, prompt_score, llm, file_path, content=None):
+  """Versão assíncrona de process_cv (usa ainvoke e o semáforo compartilhado)."""
+  if content is None:
+    if file_path:
+      if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+
+    # O parse é CPU/IO bloqueante: roda fora do event loop
+    content = await asyncio.to_thread(parse_doc, file_path)
+
+  output, data = await ainvoke_structured(prompt_template, llm, _triage_inputs(schema, content, job_details, prompt_score), structured_output.CVRecord, schema)
+
+  res = json.dumps(data, ensure_ascii=False) if data is not None else ""
+
+  return output, res
+
+
+def _cascade_result(route, fast, large, fast_ms, large_ms):
+  """Escolhe a resposta final da cascata, registra a rota e devolve (output, res)"""
+  output, data = large if large is not None else fast
+  get_cascade_stats().record(route, fast_ms, large_ms)
+  output.response_metadata["cascade"] = {"route": route, "fast_ms": round(fast_ms, 1), "large_ms": round(large_ms, 1)}
+  res = json.dumps(data, ensure_ascii=False) if data is not None else ""
   return output, res
 
 
-def display_json_table(path_json):
-  with open(path_json, "r", encoding="utf-8") as f:
-    data = json.load(f)
+@timed("process_cv")
+def process_cv_cascade(schema, job_details, prompt_template, prompt_score, fast_llm, llm, file_path, content=None, band=None):
+  """
+  Triagem em cascata: o modelo rápido (fast_llm) avalia primeiro e o modelo
+  grande (llm) só é chamado se a resposta for inválida ou se a nota cair na
+  faixa de incerteza (band, padrão CASCADE_BAND_LOW/HIGH).
+
+  Returns:
+    tuple: (saída do modelo usado, JSON do registro) como em process_cv; a rota
+    ("fast", "band" ou "invalid") fica em output.response_metadata["cascade"]
+  """
+  if content is None:
+    if file_path and not os.path.exists(file_path):
+      raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+    content = parse_doc(file_path)
+  inputs = _triage_inputs(schema, content, job_details, prompt_score)
+
+  with span("cascade", nest=False, fast_model=llm_model_name(fast_llm)) as s:
+    started = time.perf_counter()
+    # Sem a chamada de reparo no modelo rápido: um JSON ruim vai direto para o modelo grande
+    fast = invoke_structured(prompt_template, fast_llm, inputs, structured_output.CVRecord, schema, repair_call=False)
+    fast_ms = (time.perf_counter() - started) * 1000
+    route = escalation_reason(fast[1], band) or ROUTE_FAST
+    large, large_ms = None, 0.0
+    if route != ROUTE_FAST:
+      started = time.perf_counter()
+      large = invoke_structured(prompt_template, llm, inputs, structured_output.CVRecord, schema)
+      large_ms = (time.perf_counter() - started) * 1000
+    s["route"] = route
+  return _cascade_result(route, fast, large, fast_ms, large_ms)
+
+
+@timed("process_cv")
+async def aprocess_cv_cascade(schema, job_details, prompt_template, prompt_score, fast_llm, llm, file_path, content=None, band=None):
+  """Versão assíncrona de process_cv_cascade."""
+  if content is None:
+    if file_path and not os.path.exists(file_path):
+      raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+    content = await asyncio.to_thread(parse_doc, file_path)
+  inputs = _triage_inputs(schema, content, job_details, prompt_score)
+
+  with span("cascade", nest=False, fast_model=llm_model_name(fast_llm)) as s:
+    started = time.perf_counter()
+    fast = await ainvoke_structured(prompt_template, fast_llm, inputs, structured_output.CVRecord, schema, repair_call=False)
+    fast_ms = (time.perf_counter() - started) * 1000
+    route = escalation_reason(fast[1], band) or ROUTE_FAST
+    large, large_ms = None, 0.0
+    if route != ROUTE_FAST:
+      started = time.perf_counter()
+      large = await ainvoke_structured(prompt_template, llm, inputs, structured_output.CVRecord, schema)
+      large_ms = (time.perf_counter() - started) * 1000
+    s["route"] = route
+  return _cascade_result(route, fast, large, fast_ms, large_ms)
+
+
+async def abatch_process_cvs(schema, job_details, prompt_template, prompt_score, llm, contents, return_exceptions=True):
+  """
+  Executa a triagem de vários currículos já extraídos em paralelo.
+
+  Args:
+    contents: Lista com o texto de cada currículo
+    return_exceptions: Se True, falhas individuais voltam como exceções na lista
+
+  Returns:
+    list: Tuplas (output, res) na mesma ordem de contents
+  """
+  tasks = [
+    aprocess_cv(schema, job_details, prompt_template, prompt_score, llm, None, content=content)
+    for content in contents
+  ]
+  return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+
+# ============================================
+# AGENTE DE COMPATIBILIDADE - Pontua um candidato já extraído para outra vaga
+# ============================================
+
+# Campos do registro que descrevem o candidato (independentes da vaga)
+CV_PROFILE_FIELDS = [
+    "name",
+    "position",
+    "summary",
+    "hard_skills",
+    "soft_skills",
+    "academic_info",
+    "training_courses",
+    "experiences",
+    "certifications"
+]
+
+MATCH_SCHEMA = """
+{
+  "interview_questions": ["Pelo menos 3 perguntas úteis para entrevista com base no perfil e na vaga"],
+  "strengths": ["Pontos fortes e aspectos que indicam alinhamento com a vaga"],
+  "areas_for_development": ["Pontos que indicam possíveis lacunas em relação à vaga"],
+  "important_considerations": ["Observações específicas que merecem verificação ou cuidado adicional"],
+  "final_recommendations": "Resumo avaliativo final com sugestões de próximos passos",
+  "score": 0.0
+}
+"""
+
+MATCH_FIELDS = [
+    "interview_questions",
+    "strengths",
+    "areas_for_development",
+    "important_considerations",
+    "final_recommendations",
+    "score"
+]
+
+
+def create_match_prompt_template():
+    """Cria o template de prompt para pontuar um perfil já estruturado contra uma vaga"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template("""
+Você é um especialista em Recursos Humanos com vasta experiência em análise de currículos.
+Sua tarefa é avaliar o perfil estruturado do candidato abaixo em relação à vaga e preencher o formato a seguir.
+Responda apenas com o JSON estruturado e utilize somente essas chaves.
+Não adicione explicações ou anotações fora do JSON.
+Schema desejado:
+{schema}
+
+---
+Para o cálculo do campo score:
+{prompt_score}
+
+---
+
+Perfil do candidato (JSON):
+'{candidate}'
+
+---
+
+Vaga:
+'{job}'
+
+""")
+
+
+def candidate_profile(record):
+    """Subconjunto do registro usado para pontuar o candidato em outras vagas"""
+    return {field: record[field] for field in CV_PROFILE_FIELDS if field in record}
+
+
+def _match_inputs(record, job_details):
+    return {
+        "schema": compact_schema(MATCH_SCHEMA),
+        "prompt_score": PROMPT_SCORE,
+        "candidate": json.dumps(candidate_profile(record), ensure_ascii=False),
+        "job": compact_job_text(job_details)
+    }
+
+
+@timed("score_candidate_for_job")
+def score_candidate_for_job(llm, record, job_details):
+    """
+    Pontua um candidato já extraído para uma vaga, sem reprocessar o PDF.
+    
+    Args:
+        llm: Modelo de linguagem
+        record: Registro estruturado do candidato (ver CV_SCHEMA)
+        job_details: Texto da vaga
+    
+    Returns:
+        dict: Avaliação no formato MATCH_SCHEMA, ou None se a resposta for inválida
+    """
+    _, match = invoke_structured(create_match_prompt_template(), llm, _match_inputs(record, job_details), structured_output.MatchResult, MATCH_SCHEMA)
+    return match
 
-  df = pd.DataFrame(data)
+
+@timed("score_candidate_for_job")
+async def ascore_candidate_for_job(llm, record, job_details):
+    """Versão assíncrona de score_candidate_for_job."""
+    _, match = await ainvoke_structured(create_match_prompt_template(), llm, _match_inputs(record, job_details), structured_output.MatchResult, MATCH_SCHEMA)
+    return match
+
+
+def candidate_profile_text(record):
+    """Texto plano do perfil estruturado (usado na pré-triagem local quando não há o PDF)"""
+    def flatten(value):
+        if isinstance(value, dict):
+            return " ".join(flatten(v) for v in value.values())
+        if isinstance(value, list):
+            return " ".join(flatten(v) for v in value)
+        return "" if value is None else str(value)
+    return flatten(candidate_profile(record))
+
+
+async def afill_match_matrix(llm, path_json, job_id, job_details, top_k=None, min_prescreen=None, rescreen=False):
+    """
+    Preenche a coluna da vaga na matriz candidato x vaga, pontuando apenas os
+    candidatos que ainda não têm avaliação para ela.
+    
+    Com top_k/min_prescreen, os pendentes são ranqueados antes pela pré-triagem
+    local (TF-IDF) e só os selecionados vão para o LLM; os descartados ficam
+    registrados como tal e deixam de contar como pendentes (rescreen=True os
+    inclui de novo na pré-triagem).
+    
+    Returns:
+        dict: {"scored": pontuados, "failed": com erro, "skipped": descartados pela pré-triagem}
+    """
+    store = get_candidate_store(path_json)
+    pending = store.candidates_without_match(job_id, include_skipped=rescreen)
+    prescreen_scores = [None] * len(pending)
+    skipped = 0
+    if pending and (top_k or min_prescreen is not None):
+        scores = rank_candidates(job_details, [candidate_profile_text(record) for _, record in pending])
+        selected = select_top(scores, top_k=top_k, threshold=min_prescreen)
+        skipped = len(pending) - len(selected)
+        selected_set = set(selected)
+        await asyncio.to_thread(store.mark_prescreen_skipped, job_id, {
+            candidate_id: float(scores[i]) for i, (candidate_id, _) in enumerate(pending) if i not in selected_set
+        })
+        pending = [pending[i] for i in selected]
+        prescreen_scores = [float(scores[i]) for i in selected]
+
+    if pending and JOB_DIGEST_ENABLED:
+        # Compilação única da vaga, reaproveitada por todos os candidatos pendentes
+        await asyncio.to_thread(ensure_job_digest, llm, path_json, job_id)
+    prompt_job_details = job_prompt_text(path_json, job_id, job_details)
+    # Repontuação em lote: cede a vez às chamadas interativas (uploads) que chegarem no meio
+    with llm_lane(LANE_BATCH):
+        results = await asyncio.gather(*[
+            run_for_candidate(candidate_id, ascore_candidate_for_job(llm, record, prompt_job_details))
+            for candidate_id, record in pending
+        ], return_exceptions=True)
+
+    scored = 0
+    for (candidate_id, _), match, prescreen_score in zip(pending, results, prescreen_scores):
+        if isinstance(match, Exception) or match is None:
+            continue
+        await asyncio.to_thread(store.upsert_match, candidate_id, job_id, match, prescreen_score)
+        scored += 1
+    return {"scored": scored, "failed": len(pending) - scored, "skipped": skipped}
+
+
+@timed("record_triage_match")
+def record_triage_match(path_json, job_id, structured_data, key_name="name", prescreen_score=None):
+    """Guarda a avaliação da triagem como célula (candidato, vaga) da matriz"""
+    store = get_candidate_store(path_json)
+    candidate_id = store.id_for(structured_data.get(key_name)) if structured_data.get(key_name) else None
+    if candidate_id is None:
+        return None
+    store.upsert_match(candidate_id, job_id, {field: structured_data.get(field) for field in MATCH_FIELDS},
+                       prescreen_score=prescreen_score)
+    return candidate_id
+
+
+def prescreen_agreement(path_json, job_id):
+    """
+    Concordância (Spearman) entre a pré-triagem local e o score do LLM para a vaga.
+    
+    Returns:
+        tuple: (correlação ou None, quantidade de pares comparados)
+    """
+    pairs = get_candidate_store(path_json).score_pairs(job_id)
+    if not pairs:
+        return None, 0
+    prescreen_scores, llm_scores = zip(*pairs)
+    return rank_agreement(prescreen_scores, llm_scores), len(pairs)
+
+
+@timed("match_matrix_table")
+def match_matrix_table(path_json):
+    """DataFrame candidato x vaga com os scores preenchidos (células vazias = ainda não pontuado)"""
+    import pandas as pd
+    store = get_candidate_store(path_json)
+    titles = dict(get_job_registry(path_json).list_jobs())
+    rows = store.match_matrix()
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows, columns=["candidate_id", "name", "job_id", "score"])
+    df["job"] = df["job_id"].map(lambda job_id: f"{titles.get(job_id, job_id)} ({job_id[:6]})")
+    return df.pivot_table(index="name", columns="job", values="score", aggfunc="max")
+
+
+@timed("display_json_table")
+def display_json_table(path_json, page=0, page_size=None, order_by="created", candidate_ids=None):
+  """
+  Monta um DataFrame com uma página de candidatos (índice = id do candidato).
+  Sem page_size, retorna todos. candidate_ids restringe a página ao resultado de search_candidates.
+  """
+  import pandas as pd
+  store = get_candidate_store(path_json)
+  if page_size:
+    rows = store.list_page(offset=page * page_size, limit=page_size, order_by=order_by, candidate_ids=candidate_ids)
+  elif candidate_ids is not None:
+    wanted = set(candidate_ids)
+    rows = [(candidate_id, record) for candidate_id, record in store.iter_all(order_by=order_by) if candidate_id in wanted]
+  else:
+    rows = list(store.iter_all(order_by=order_by))
+
+  df = pd.DataFrame([record for _, record in rows], index=[candidate_id for candidate_id, _ in rows])
   return df
 
 
+@timed("search_candidates")
+def search_candidates(path_json, query):
+  """
+  Filtra candidatos por competências (hard_skills, soft_skills, certifications) via índice invertido.
+
+  Args:
+    query: Consulta booleana, ex.: "laravel AND scraping AND n8n" ou "(python OR java) AND NOT php"
+
+  Returns:
+    list: Ids dos candidatos (todos se a consulta estiver vazia)
+  """
+  return get_skill_index(path_json).search(query)
+
+
+def has_candidates(path_json):
+  """True se já existe algum candidato registrado (o JSON legado é migrado ao abrir o banco)"""
+  return get_candidate_store(path_json).count() > 0
+
+
 # ============================================
 # AGENTE ANALISADOR - Analisa currículo e vaga
 # ============================================
 
+ANALYSIS_SCHEMA = """
+{
+  "analysis_summary": "Resumo executivo da análise (2-3 parágrafos)",
+  "alignment_score": 0.0,
+  "strengths": ["Lista de pontos fortes e alinhamentos com a vaga"],
+  "weaknesses": ["Lista de pontos fracos e desalinhamentos com a vaga"],
+  "missing_skills": ["Habilidades mencionadas na vaga que não estão no currículo"],
+  "underutilized_skills": ["Habilidades do candidato que poderiam ser melhor destacadas"],
+  "recommendations": ["Recomendações específicas para melhorar o currículo"],
+  "key_improvements": ["Melhorias prioritárias que devem ser feitas no currículo"]
+}
+"""
+
+
 def create_analysis_prompt_template():
     """Cria o template de prompt para o agente analisador"""
+    from langchain_core.prompts import ChatPromptTemplate
     return ChatPromptTemplate.from_template("""
     Você é um especialista em Recursos Humanos com vasta experiência em análise de currículos.
     Sua tarefa é analisar profundamente o currículo e a vaga, gerando uma análise detalhada e estruturada.
@@ -320,28 +1301,7 @@ def create_analysis_prompt_template():
     5. Retorne APENAS um JSON válido com a estrutura abaixo
 
     SCHEMA DE RESPOSTA (JSON):
-    {{
-    "analysis_summary": "Resumo executivo da análise (2-3 parágrafos)",
-    "alignment_score": 0.0,
-    "strengths": [
-        "Lista de pontos fortes e alinhamentos com a vaga"
-    ],
-    "weaknesses": [
-        "Lista de pontos fracos e desalinhamentos com a vaga"
-    ],
-    "missing_skills": [
-        "Habilidades mencionadas na vaga que não estão no currículo"
-    ],
-    "underutilized_skills": [
-        "Habilidades do candidato que poderiam ser melhor destacadas"
-    ],
-    "recommendations": [
-        "Recomendações específicas para melhorar o currículo"
-    ],
-    "key_improvements": [
-        "Melhorias prioritárias que devem ser feitas no currículo"
-    ]
-    }}
+    {schema}
 
     CURRÍCULO:
     '{cv}'
@@ -353,6 +1313,7 @@ def create_analysis_prompt_template():
     """)
 
 
+@timed("analyze_cv_and_job")
 def analyze_cv_and_job(llm, cv_content, job_details):
     """
     Agente Analisador: Analisa o currículo e a vaga, gerando análise detalhada
@@ -366,28 +1327,199 @@ def analyze_cv_and_job(llm, cv_content, job_details):
         dict: Análise estruturada em JSON
     """
     prompt_template = create_analysis_prompt_template()
-    chain = prompt_template | llm
     
-    output = chain.invoke({
-        "cv": cv_content,
-        "job": job_details
-    })
+    _, analysis = invoke_structured(prompt_template, llm, _analysis_inputs(cv_content, job_details), structured_output.CVAnalysis, ANALYSIS_SCHEMA)
     
-    res = format_res(output.content)
-    
-    # Parse do JSON
+    return _checked_analysis(analysis)
+
+
+@timed("analyze_cv_and_job")
+async def aanalyze_cv_and_job(llm, cv_content, job_details):
+    """Versão assíncrona de analyze_cv_and_job."""
+    prompt_template = create_analysis_prompt_template()
+
+    _, analysis = await ainvoke_structured(prompt_template, llm, _analysis_inputs(cv_content, job_details), structured_output.CVAnalysis, ANALYSIS_SCHEMA)
+
+    return _checked_analysis(analysis)
+
+
+def _analysis_inputs(cv_content, job_details):
+    return {
+        "schema": compact_schema(ANALYSIS_SCHEMA),
+        "cv": compact_cv_text(cv_content, "analysis"),
+        "job": compact_job_text(job_details)
+    }
+
+
+def _checked_analysis(analysis):
+    """Análise validada, ou None (com aviso) se nem o reparo produziu um JSON válido"""
+    if analysis is None:
+        st.error("Erro ao processar análise: resposta do modelo sem JSON válido")
+    return analysis
+
+
+# ============================================
+# MODO COMBINADO - Triagem + análise detalhada em uma única chamada
+# ============================================
+
+# Triagem e análise repetem o currículo, a vaga e boa parte da saída (pontos
+# fortes, fracos e nota). No modo combinado um único schema produz as duas coisas:
+# os campos do CV_SCHEMA viram o registro e a análise reaproveita strengths,
+# areas_for_development e score, acrescentando só os campos exclusivos abaixo.
+# Valor inicial do seletor de modo no app (COMBINED_TRIAGE=1 liga o modo combinado)
+COMBINED_TRIAGE_DEFAULT = os.getenv("COMBINED_TRIAGE", "0") == "1"
+
+ANALYSIS_ONLY_FIELDS = [
+    "analysis_summary",
+    "missing_skills",
+    "underutilized_skills",
+    "recommendations",
+    "key_improvements"
+]
+
+COMBINED_SCHEMA = CV_SCHEMA.rstrip().rstrip("}").rstrip() + """,
+  "analysis_summary": "Resumo executivo da análise do currículo frente à vaga (2-3 parágrafos)",
+  "missing_skills": ["Habilidades mencionadas na vaga que não estão no currículo"],
+  "underutilized_skills": ["Habilidades do candidato que poderiam ser melhor destacadas"],
+  "recommendations": ["Recomendações específicas para melhorar o currículo"],
+  "key_improvements": ["Melhorias prioritárias que devem ser feitas no currículo"]
+}
+"""
+
+
+def create_combined_prompt_template():
+    """Cria o template de prompt do modo combinado (triagem + análise detalhada)"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template("""
+Você é um especialista em Recursos Humanos com vasta experiência em análise de currículos.
+Sua tarefa é, em uma única resposta, extrair os dados do currículo e analisá-lo em profundidade frente à vaga,
+preenchendo cada um dos campos do formato abaixo.
+Em strengths e areas_for_development, compare com os requisitos da vaga: eles são os pontos fortes/alinhamentos
+e os pontos fracos/desalinhamentos da análise detalhada.
+Responda apenas com o JSON estruturado e utilize somente essas chaves. Cuide para que os nomes das chaves sejam exatamente esses.
+Não adicione explicações ou anotações fora do JSON.
+Schema desejado:
+{schema}
+
+---
+Para o cálculo do campo score:
+{prompt_score}
+
+---
+
+Currículo a ser analisado:
+'{cv}'
+
+---
+
+Vaga que o candidato está se candidatando:
+'{job}'
+
+""")
+
+
+def usage_caption(output):
+    """Tokens consumidos pela chamada (para comparar os modos), ou "" se não informados"""
+    usage = getattr(output, "usage_metadata", None)
+    if usage:
+        return f" | {usage.get('input_tokens', 0)} tokens de entrada, {usage.get('output_tokens', 0)} de saída"
+    if getattr(output, "response_metadata", {}).get("cache_hit"):
+        return " | resposta do cache"
+    return ""
+
+
+USAGE_COLUMNS = {
+    "stage": "Etapa",
+    "model": "Modelo",
+    "job": "Vaga",
+    "candidate": "Candidato",
+    "calls": "Chamadas",
+    "cached": "Do cache",
+    "prompt_tokens": "Entrada",
+    "completion_tokens": "Saída",
+    "reasoning_tokens": "Raciocínio",
+    "total_tokens": "Total",
+    "avg_latency_ms": "Latência média (ms)",
+    "cost_usd": "Custo (US$)",
+}
+
+
+def usage_table(rows, job_titles=None):
+    """Linhas de usage_summary com as colunas em português (títulos no lugar dos ids das vagas)"""
+    table = []
+    for row in rows:
+        row = dict(row)
+        if job_titles is not None and "job" in row:
+            row["job"] = job_titles.get(row["job"], row["job"])
+        if row.get("avg_latency_ms") is not None:
+            row["avg_latency_ms"] = round(row["avg_latency_ms"], 1)
+        if row.get("cost_usd") is not None:
+            row["cost_usd"] = round(row["cost_usd"], 4)
+        table.append({USAGE_COLUMNS.get(key, key): value for key, value in row.items()})
+    return table
+
+
+def split_combined_result(data):
+    """
+    Separa a resposta do modo combinado no registro do candidato e na análise detalhada.
+
+    Returns:
+        tuple: (registro no formato CV_SCHEMA, análise no formato de analyze_cv_and_job),
+        ou (None, None) se a resposta for inválida
+    """
+    if data is None:
+        return None, None
+    record = {key: value for key, value in data.items() if key not in ANALYSIS_ONLY_FIELDS}
     try:
-        start_idx = res.find('{')
-        end_idx = res.rfind('}') + 1
-        if start_idx == -1 or end_idx == 0:
-            raise json.JSONDecodeError("Nenhum JSON encontrado", res, 0)
-        
-        json_str = res[start_idx:end_idx]
-        analysis = json.loads(json_str)
-        return analysis
-    except json.JSONDecodeError as e:
-        st.error(f"Erro ao processar análise: {e}")
-        return None
+        alignment_score = float(data.get("score") or 0.0)
+    except (TypeError, ValueError):
+        alignment_score = 0.0
+    analysis = {
+        "analysis_summary": data.get("analysis_summary", ""),
+        "alignment_score": alignment_score,
+        "strengths": data.get("strengths", []),
+        "weaknesses": data.get("areas_for_development", []),
+        "missing_skills": data.get("missing_skills", []),
+        "underutilized_skills": data.get("underutilized_skills", []),
+        "recommendations": data.get("recommendations", []),
+        "key_improvements": data.get("key_improvements", [])
+    }
+    return record, analysis
+
+
+@timed("process_cv_with_analysis")
+def process_cv_with_analysis(llm, job_details, file_path, content=None):
+    """
+    Modo combinado: triagem e análise detalhada do currículo em uma única chamada ao LLM.
+
+    Args:
+        llm: Modelo de linguagem
+        job_details: Detalhes da vaga (texto)
+        file_path: Caminho do PDF (ignorado se content for informado)
+        content: Texto já extraído do currículo (opcional)
+
+    Returns:
+        tuple: (saída do modelo, registro estruturado, análise detalhada)
+    """
+    if content is None:
+        content = parse_doc(file_path)
+    output, data = invoke_structured(create_combined_prompt_template(), llm,
+                                     _triage_inputs(COMBINED_SCHEMA, content, job_details, PROMPT_SCORE),
+                                     structured_output.CombinedResult, COMBINED_SCHEMA)
+    record, analysis = split_combined_result(data)
+    return output, record, analysis
+
+
+@timed("process_cv_with_analysis")
+async def aprocess_cv_with_analysis(llm, job_details, file_path, content=None):
+    """Versão assíncrona de process_cv_with_analysis."""
+    if content is None:
+        content = await asyncio.to_thread(parse_doc, file_path)
+    output, data = await ainvoke_structured(create_combined_prompt_template(), llm,
+                                            _triage_inputs(COMBINED_SCHEMA, content, job_details, PROMPT_SCORE),
+                                            structured_output.CombinedResult, COMBINED_SCHEMA)
+    record, analysis = split_combined_result(data)
+    return output, record, analysis
 
 
 # ============================================
@@ -396,6 +1528,7 @@ def analyze_cv_and_job(llm, cv_content, job_details):
 
 def create_rewrite_prompt_template():
     """Cria o template de prompt para o agente reformulador"""
+    from langchain_core.prompts import ChatPromptTemplate
     return ChatPromptTemplate.from_template("""
     Atue como um Especialista em Recrutamento e Seleção com 15 anos de experiência em recolocação profissional. Sua tarefa é reescrever o  e Otimização de Currículos para ATS. Você é expert em adequar perfis seniores (Arquitetos, Tech Leads, Engenheiros de Dados, Especialistas em IA Generativa) para vagas competitivas.
     Você irá reescrever pontos estratégicos do currículo abaixo usando o TEMPLATE fornecido como base estrutural, para maximizar a aderência (match) com a descrição da vaga fornecida, baseadas na *análise* e no currículo original.. Pode inventar dados, alterar a semântica e a ênfase para espelhar a linguagem da empresa.
@@ -467,6 +1600,7 @@ def create_rewrite_prompt_template():
     """)
 
 
+@timed("rewrite_cv")
 def rewrite_cv(llm, original_cv_content, analysis, job_details, cv_template=None, rewrite_options=None, idioma="Português Brasileiro"):
     """
     Agente Reformulador: Reformula o currículo baseado na análise usando um template
@@ -482,6 +1616,102 @@ def rewrite_cv(llm, original_cv_content, analysis, job_details, cv_template=None
     Returns:
         str: Currículo reformulado em markdown
     """
+    inputs = _build_rewrite_inputs(original_cv_content, analysis, job_details, cv_template, rewrite_options, idioma)
+    
+    try:
+        prompt_template = create_rewrite_prompt_template()
+        
+        output = invoke_chain(prompt_template, llm, inputs)
+        
+        return _validate_rewritten_cv(output.content)
+    except Exception as e:
+        # Não usa st.error aqui pois pode não estar no contexto do Streamlit
+        error_msg = f"Erro ao reformular currículo: {str(e)}"
+        print(error_msg)  # Log para debug
+        raise Exception(error_msg) from e
+
+
+@timed("rewrite_cv")
+def stream_rewrite_cv(llm, original_cv_content, analysis, job_details, cv_template=None, rewrite_options=None, idioma="Português Brasileiro"):
+    """
+    Versão em streaming de rewrite_cv (mesmos argumentos), para uso com st.write_stream.
+    
+    Gera o currículo reformulado em pedaços, já sem o raciocínio (<think>). Ao fim do
+    stream, a resposta completa passa pela mesma validação de rewrite_cv, de modo que
+    o texto exibido só é aceito se rewrite_cv também o aceitaria.
+    
+    Yields:
+        str: Pedaços do currículo reformulado em markdown
+    """
+    inputs = _build_rewrite_inputs(original_cv_content, analysis, job_details, cv_template, rewrite_options, idioma)
+    
+    try:
+        prompt_template = create_rewrite_prompt_template()
+        stripper = ThinkStripper()
+        visible_chunks = []
+        
+        for chunk in stream_chain(prompt_template, llm, inputs):
+            visible = stripper.feed(chunk)
+            if visible:
+                visible_chunks.append(visible)
+                yield visible
+        
+        tail = stripper.flush()
+        if tail:
+            visible_chunks.append(tail)
+            yield tail
+        
+        # Valida o texto exibido (o mesmo que o app guarda), não a resposta bruta
+        _validate_rewritten_cv("".join(visible_chunks))
+    except Exception as e:
+        error_msg = f"Erro ao reformular currículo: {str(e)}"
+        print(error_msg)  # Log para debug
+        raise Exception(error_msg) from e
+
+
+@timed("rewrite_cv")
+async def arewrite_cv(llm, original_cv_content, analysis, job_details, cv_template=None, rewrite_options=None, idioma="Português Brasileiro"):
+    """Versão assíncrona de rewrite_cv (mesmos argumentos e retorno)."""
+    inputs = _build_rewrite_inputs(original_cv_content, analysis, job_details, cv_template, rewrite_options, idioma)
+    
+    try:
+        prompt_template = create_rewrite_prompt_template()
+        
+        output = await ainvoke_chain(prompt_template, llm, inputs)
+        
+        return _validate_rewritten_cv(output.content)
+    except Exception as e:
+        error_msg = f"Erro ao reformular currículo: {str(e)}"
+        print(error_msg)  # Log para debug
+        raise Exception(error_msg) from e
+
+
+async def arewrite_many(llm, requests, job_details, cv_template, rewrite_options=None, idioma="Português Brasileiro"):
+    """
+    Reformula vários currículos em paralelo, limitado pelo semáforo compartilhado.
+    
+    Args:
+        llm: Modelo de linguagem
+        requests: Dicionário {nome: (conteúdo_original, análise)}
+        job_details: Detalhes da vaga
+        cv_template: Template de CV
+        rewrite_options: Opções de reformulação (opcional)
+        idioma: Idioma do currículo (opcional)
+    
+    Returns:
+        dict: {nome: currículo reformulado ou Exception}
+    """
+    names = list(requests.keys())
+    results = await asyncio.gather(*[
+        run_for_candidate(name, arewrite_cv(llm, requests[name][0], requests[name][1], job_details,
+                                            cv_template=cv_template, rewrite_options=rewrite_options, idioma=idioma))
+        for name in names
+    ], return_exceptions=True)
+    return dict(zip(names, results))
+
+
+def _build_rewrite_inputs(original_cv_content, analysis, job_details, cv_template, rewrite_options, idioma):
+    """Valida os dados e monta as variáveis do prompt do agente reformulador"""
     # Validação de entrada
     if not original_cv_content:
         raise ValueError("Conteúdo do currículo original não pode estar vazio")
@@ -547,46 +1777,40 @@ def rewrite_cv(llm, original_cv_content, analysis, job_details, cv_template=None
     {chr(10).join(['- ' + str(k) for k in analysis.get('key_improvements', [])])}
     """
     
-    try:
-        prompt_template = create_rewrite_prompt_template()
-        chain = prompt_template | llm
-        
-        style_map = {
-            "professional": "profissional e objetiva",
-            "modern": "moderna e dinâmica",
-            "concise": "concisa e direta"
-        }
-        style_text = style_map.get(rewrite_options.get("style", "professional"), "profissional e objetiva")
-        
-        output = chain.invoke({
-            "cv_template": cv_template,
-            "original_cv": original_cv_content,
-            "analysis": analysis_text,
-            "job": job_details,
-            "style": style_text,
-            "focus_instruction": focus_instruction,
-            "highlight_instruction": highlight_instruction,
-            "strengths_instruction": strengths_instruction,
-            "idioma": idioma
-        })
-        
-        rewritten_cv = format_res(output.content)
-        
-        # Validação de saída
-        if not rewritten_cv:
-            raise ValueError("Resposta do modelo está vazia")
-        
-        rewritten_cv = rewritten_cv.strip()
-        
-        if len(rewritten_cv) < 50:
-            raise ValueError(f"Currículo reformulado está muito curto ({len(rewritten_cv)} caracteres). Mínimo esperado: 50 caracteres")
-        
-        return rewritten_cv
-    except Exception as e:
-        # Não usa st.error aqui pois pode não estar no contexto do Streamlit
-        error_msg = f"Erro ao reformular currículo: {str(e)}"
-        print(error_msg)  # Log para debug
-        raise Exception(error_msg) from e
+    style_map = {
+        "professional": "profissional e objetiva",
+        "modern": "moderna e dinâmica",
+        "concise": "concisa e direta"
+    }
+    style_text = style_map.get(rewrite_options.get("style", "professional"), "profissional e objetiva")
+    
+    return {
+        "cv_template": cv_template,
+        "original_cv": compact_cv_text(original_cv_content, "rewrite"),
+        "analysis": analysis_text,
+        "job": compact_job_text(job_details),
+        "style": style_text,
+        "focus_instruction": focus_instruction,
+        "highlight_instruction": highlight_instruction,
+        "strengths_instruction": strengths_instruction,
+        "idioma": idioma
+    }
+
+
+def _validate_rewritten_cv(content):
+    """Remove o raciocínio e valida o currículo reformulado retornado pelo modelo"""
+    rewritten_cv = format_res(content)
+    
+    # Validação de saída
+    if not rewritten_cv:
+        raise ValueError("Resposta do modelo está vazia")
+    
+    rewritten_cv = rewritten_cv.strip()
+    
+    if len(rewritten_cv) < 50:
+        raise ValueError(f"Currículo reformulado está muito curto ({len(rewritten_cv)} caracteres). Mínimo esperado: 50 caracteres")
+    
+    return rewritten_cv
 
 
 def save_rewritten_cv(content, filename):
@@ -615,6 +1839,7 @@ def convert_markdown_to_text(markdown_text):
     return text
 
 
+@timed("generate_pdf_from_cv")
 def generate_pdf_from_cv(cv_content, filename=None, primary_color="#2563eb"):
     """
     Gera um PDF profissional a partir do conteúdo do currículo em markdown.
@@ -645,70 +1870,28 @@ def generate_pdf_from_cv(cv_content, filename=None, primary_color="#2563eb"):
         from reportlab.lib.enums import TA_LEFT
         from reportlab.lib import colors
         
-        # Mapeamento de seções para ícones
-        SECTION_ICONS = {
-            "Resumo Profissional": "",
-            "Resumo": "",
-            "Experiências": "",
-            "Experiência": "",
-            "Formação Acadêmica": "",
-            "Formação": "",
-            "Certificações": "",
-            "Certificação": "",
-            "Cursos": "",
-            "Cursos e Treinamentos": "",
-            "Projetos e Consultorias Relevantes": "",
-            "Projetos": "",
-            "Hard Skills": "",
-            "Habilidades Técnicas": "",
-            "Soft Skills": "",
-            "Habilidades Comportamentais": ""
-        }
-        
-        def get_section_icon(section_name):
-            """Retorna o ícone para uma seção"""
-            for key, icon in SECTION_ICONS.items():
-                if key.lower() in section_name.lower():
-                    return icon
-            return "📋"  # Ícone padrão
-        
         def hex_to_color(hex_color):
             """Converte cor hex para objeto colors do reportlab"""
             hex_color = hex_color.lstrip('#')
             return colors.HexColor(f"#{hex_color}")
         
         def escape_xml(text):
-            """Escapa caracteres especiais para XML, preservando tags HTML"""
-            # Protege tags HTML existentes
-            text = text.replace('<b>', '___BOLD_START___')
-            text = text.replace('</b>', '___BOLD_END___')
-            text = text.replace('<i>', '___ITALIC_START___')
-            text = text.replace('</i>', '___ITALIC_END___')
-            text = text.replace('<br/>', '___BR___')
-            
-            # Escapa caracteres especiais
-            text = text.replace('&', '&amp;')
-            text = text.replace('<', '&lt;')
-            text = text.replace('>', '&gt;')
-            
-            # Restaura tags HTML
-            text = text.replace('___BOLD_START___', '<b>')
-            text = text.replace('___BOLD_END___', '</b>')
-            text = text.replace('___ITALIC_START___', '<i>')
-            text = text.replace('___ITALIC_END___', '</i>')
-            text = text.replace('___BR___', '<br/>')
-            
-            return text
+            """Escapa caracteres especiais para XML"""
+            return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
         
-        def process_markdown(text):
-            """Processa markdown básico para HTML"""
-            # Processa negrito **texto**
-            text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-            # Processa itálico *texto* (mas não se já está em negrito)
-            text = re.sub(r'(?<!<b>)\*([^*<]+?)\*(?!</b>)', r'<i>\1</i>', text)
-            # Processa links [text](url) -> text
-            text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-            return text
+        def runs_to_markup(runs):
+            """Converte os trechos da IR em marcação do reportlab (<b>, <i>)"""
+            parts = []
+            for run in runs:
+                text = escape_xml(run.text)
+                if run.bold:
+                    text = f"<b>{text}</b>"
+                if run.italic:
+                    text = f"<i>{text}</i>"
+                parts.append(text)
+            return "".join(parts)
+        
+        cv_document = get_cv_document(cv_content)
         
         # Cria buffer em memória
         buffer = BytesIO()
@@ -822,111 +2005,19 @@ def generate_pdf_from_cv(cv_content, filename=None, primary_color="#2563eb"):
             leading=15
         )
         
-        # Processa o conteúdo
-        lines = cv_content.split('\n')
-        
         story = []
-        professional_name = None
-        professional_position = None
-        contact_info = []
-        current_section = None
-        section_content = []
-        
-        # Primeira passagem: extrai nome, posição e contato (até encontrar primeira seção)
-        header_end_index = len(lines)
-        found_first_section = False
-        
-        for i, line in enumerate(lines):
-            line_stripped = line.strip()
-            
-            if not line_stripped:
-                continue
-            
-            # Detecta nome no formato **_[NAME]_** ou **__[NAME]__** ou **[NAME]**
-            if not professional_name and line_stripped.startswith('**'):
-                # Remove markdown: **_texto_** ou **__texto__** ou **texto**
-                name_candidate = line_stripped
-                # Remove ** do início e fim
-                name_candidate = re.sub(r'^\*\*', '', name_candidate)
-                name_candidate = re.sub(r'\*\*$', '', name_candidate)
-                # Remove _ do início e fim (pode ter múltiplos)
-                name_candidate = re.sub(r'^_+', '', name_candidate)
-                name_candidate = re.sub(r'_+$', '', name_candidate)
-                name_candidate = name_candidate.strip()
-                
-                # Verifica se não é uma seção conhecida
-                is_section = name_candidate in SECTION_ICONS.keys() or any(key.lower() in name_candidate.lower() for key in SECTION_ICONS.keys())
-                
-                if not is_section and name_candidate and not any(icon in name_candidate for icon in ['✉', '✆', '[in]', 'http']):
-                    professional_name = name_candidate
-                    continue
-            
-            # Detecta posição no formato **__[POSITION]__** (linha após o nome)
-            if professional_name and not professional_position and line_stripped.startswith('**'):
-                position_candidate = line_stripped
-                # Remove markdown: **__texto__** ou **texto**
-                position_candidate = re.sub(r'^\*\*', '', position_candidate)
-                position_candidate = re.sub(r'\*\*$', '', position_candidate)
-                # Remove _ do início e fim (pode ter múltiplos)
-                position_candidate = re.sub(r'^_+', '', position_candidate)
-                position_candidate = re.sub(r'_+$', '', position_candidate)
-                position_candidate = position_candidate.strip()
-                
-                # Verifica se não é uma seção conhecida
-                is_section = position_candidate in SECTION_ICONS.keys() or any(key.lower() in position_candidate.lower() for key in SECTION_ICONS.keys())
-                
-                if not is_section and position_candidate and not any(icon in position_candidate for icon in ['✉', '✆', '[in]', 'http']):
-                    professional_position = position_candidate
-                    continue
-            
-            # Detecta primeira seção para marcar fim do cabeçalho
-            if not found_first_section and line_stripped.startswith('**') and line_stripped.endswith('**') and not line_stripped.startswith('- **'):
-                section_title = line_stripped.replace('**', '').strip()
-                # Remove underscores se houver
-                section_title = re.sub(r'^_+', '', section_title)
-                section_title = re.sub(r'_+$', '', section_title)
-                section_title = section_title.strip()
-                # Verifica se é uma seção conhecida
-                is_section = section_title in SECTION_ICONS.keys() or any(key.lower() in section_title.lower() for key in SECTION_ICONS.keys())
-                
-                if is_section:
-                    header_end_index = i
-                    found_first_section = True
-                    continue
-            
-            # Detecta informações de contato (apenas antes da primeira seção)
-            if i < header_end_index and not found_first_section:
-                # Ignora linhas que são apenas separadores (****)
-                if line_stripped.replace('*', '').strip() == '':
-                    continue
-                    
-                if '✉' in line_stripped or '@' in line_stripped:
-                    # Remove ✉ se presente e limpa
-                    contact_line = line_stripped.replace('✉', '').strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
-                elif '✆' in line_stripped or re.search(r'\(\d{2}\)', line_stripped):
-                    # Remove ✆ se presente e limpa
-                    contact_line = line_stripped.replace('✆', '').strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
-                elif '[in]' in line_stripped.lower() or 'linkedin' in line_stripped.lower() or 'http' in line_stripped.lower():
-                    # Limpa o formato [in] se presente
-                    contact_line = re.sub(r'\[in\]\s*', '', line_stripped, flags=re.IGNORECASE).strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
+        header = cv_document.header
         
         # Adiciona cabeçalho colorido
-        if professional_name or professional_position or contact_info:
+        if header:
             header_data = []
             
             # Nome (nível 1)
-            if professional_name:
-                name_text = escape_xml(professional_name)
-                header_data.append([Paragraph(name_text, name_style)])
+            if header.name:
+                header_data.append([Paragraph(escape_xml(header.name), name_style)])
             
             # Posição (nível 2, menor que o nome)
-            if professional_position:
+            if header.position:
                 # Estilo para posição (menor que o nome)
                 position_style = ParagraphStyle(
                     'PositionStyle',
@@ -939,176 +2030,54 @@ def generate_pdf_from_cv(cv_content, filename=None, primary_color="#2563eb"):
                     fontName=base_font,
                     leading=24
                 )
-                position_text = escape_xml(professional_position)
-                header_data.append([Paragraph(position_text, position_style)])
+                header_data.append([Paragraph(escape_xml(header.position), position_style)])
             
             # Dados de contato
-            if contact_info:
-                contact_items = []
-                for ci in contact_info:
-                    # Processa markdown primeiro, depois escapa XML
-                    processed = process_markdown(ci)
-                    escaped = escape_xml(processed)
-                    contact_items.append(escaped)
-                contact_text = '<br/>'.join(contact_items)
+            if header.contacts:
+                contact_text = '<br/>'.join(runs_to_markup(contact) for contact in header.contacts)
                 header_data.append([Paragraph(contact_text, contact_style)])
             
-            if header_data:
-                header_table = Table(header_data, colWidths=[doc.width])
-                header_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, -1), hex_to_color(primary_color)),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 12),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 12),
-                    ('TOPPADDING', (0, 0), (-1, -1), 16),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 16),
-                ]))
-                story.append(header_table)
-                story.append(Spacer(1, 20))
+            header_table = Table(header_data, colWidths=[doc.width])
+            header_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, -1), hex_to_color(primary_color)),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 12),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 12),
+                ('TOPPADDING', (0, 0), (-1, -1), 16),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 16),
+            ]))
+            story.append(header_table)
+            story.append(Spacer(1, 20))
         
-        # Segunda passagem: processa conteúdo (pula cabeçalho)
-        i = header_end_index
-        current_subtitle_group = []  # Agrupa nível 3 com seu conteúdo
+        def block_flowables(block):
+            """Parágrafo (e espaçamento) de um bloco do corpo"""
+            if block.kind == SEPARATOR:
+                return [Spacer(1, 4)]
+            markup = runs_to_markup(block.runs)
+            if not markup.strip():
+                return []
+            if block.kind in (NOTE, ITALIC_ITEM):
+                return [Paragraph(markup, italic_style), Spacer(1, 2)]
+            if block.kind == BULLET:
+                return [Paragraph(f"• {markup}", normal_style), Spacer(1, 2)]  # Espaçamento reduzido
+            return [Paragraph(markup, normal_style), Spacer(1, 2)]
         
-        while i < len(lines):
-            line = lines[i].strip()
+        for section in cv_document.sections:
+            # Helvetica não tem os emojis: só seções desconhecidas levam o marcador padrão
+            icon = "" if section.kind else DEFAULT_SECTION_ICON
+            story.append(Paragraph(escape_xml(f"{icon} {section.title}"), section_style))
+            story.append(Spacer(1, 8))
             
-            if not line:
-                i += 1
-                continue
-            
-            # Detecta seção principal (nível 2) - **Nome da Seção**
-            if line.startswith('**') and line.endswith('**') and not line.startswith('- **'):
-                section_title = line.replace('**', '').strip()
-                icon = get_section_icon(section_title)
-                
-                # Adiciona grupo de nível 3 anterior se houver (com KeepTogether)
-                if current_subtitle_group:
-                    story.append(KeepTogether(current_subtitle_group))
-                    current_subtitle_group = []
-                
-                # Adiciona conteúdo da seção anterior diretamente (sem KeepTogether - pode ser órfão)
-                if current_section and section_content:
-                    story.extend(section_content)
-                    section_content = []
-                
-                # Cria parágrafo simples para seção (sem background)
-                section_text = f"{icon} {section_title}"
-                section_para = Paragraph(escape_xml(section_text), section_style)
-                story.append(section_para)
-                story.append(Spacer(1, 8))
-                current_section = section_title
-                i += 1
-                continue
-            
-            # Detecta subtítulo de seção (nível 3) - - **[POSITION]**
-            if line.startswith('- **') and line.endswith('**'):
-                # Se havia um grupo anterior de nível 3, adiciona com KeepTogether
-                if current_subtitle_group:
-                    story.append(KeepTogether(current_subtitle_group))
-                    current_subtitle_group = []
-                
-                exp_title = line.replace('- **', '').replace('**', '').strip()
-                # Processa markdown primeiro, depois escapa XML
-                exp_processed = process_markdown(exp_title)
-                exp_text = escape_xml(exp_processed)
-                # Inicia novo grupo de nível 3
-                current_subtitle_group.append(Paragraph(exp_text, subtitle_style))
-                current_subtitle_group.append(Spacer(1, 4))
-                i += 1
-                continue
-            
-            # Detecta subtítulo de subtítulo (nível 4) - empresa em itálico
-            if line.startswith('_') and line.endswith('_'):
-                company_text = line.replace('_', '').strip()
-                if company_text:
-                    # Processa markdown primeiro, depois escapa XML
-                    company_processed = process_markdown(company_text)
-                    company_escaped = escape_xml(company_processed)
-                    company_para = Paragraph(company_escaped, italic_style)
-                    # Adiciona ao grupo de nível 3 se existir, senão à seção
-                    if current_subtitle_group:
-                        current_subtitle_group.append(company_para)
-                        current_subtitle_group.append(Spacer(1, 2))
-                    else:
-                        section_content.append(company_para)
-                        section_content.append(Spacer(1, 2))
-                i += 1
-                continue
-            
-            # Detecta itens de lista com itálico (nível 4) - - *texto*
-            if line.startswith('- *') and line.endswith('*'):
-                italic_text = line.replace('- *', '').replace('*', '').strip()
-                if italic_text:
-                    # Processa markdown primeiro, depois escapa XML
-                    italic_processed = process_markdown(italic_text)
-                    italic_escaped = escape_xml(italic_processed)
-                    italic_para = Paragraph(italic_escaped, italic_style)
-                    # Adiciona ao grupo de nível 3 se existir, senão à seção
-                    if current_subtitle_group:
-                        current_subtitle_group.append(italic_para)
-                        current_subtitle_group.append(Spacer(1, 2))
-                    else:
-                        section_content.append(italic_para)
-                        section_content.append(Spacer(1, 2))
-                i += 1
-                continue
-            
-            # Detecta itens de lista simples (nível 4)
-            if line.startswith('- '):
-                list_item = line.replace('- ', '', 1).strip()
-                # Processa markdown primeiro
-                list_item = process_markdown(list_item)
-                # Remove formatação markdown restante que não foi processada
-                list_item = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', list_item)
-                list_item = re.sub(r'\*(.+?)\*', r'<i>\1</i>', list_item)
-                # Depois escapa XML
-                list_item_escaped = escape_xml(list_item)
-                bullet_text = f"• {list_item_escaped}"
-                bullet_para = Paragraph(bullet_text, normal_style)
-                # Adiciona ao grupo de nível 3 se existir, senão à seção
-                if current_subtitle_group:
-                    current_subtitle_group.append(bullet_para)
-                    current_subtitle_group.append(Spacer(1, 2))  # Espaçamento reduzido
-                else:
-                    section_content.append(bullet_para)
-                    section_content.append(Spacer(1, 2))  # Espaçamento reduzido
-                i += 1
-                continue
-            
-            # Detecta separadores
-            if line.startswith('---'):
-                if current_subtitle_group:
-                    current_subtitle_group.append(Spacer(1, 4))
+            for item in section.items:
+                if isinstance(item, SubtitleGroup):
+                    # Mantém o subtítulo (nível 3) junto do seu conteúdo
+                    group = [Paragraph(runs_to_markup(item.title), subtitle_style), Spacer(1, 4)]
+                    for block in item.blocks:
+                        group.extend(block_flowables(block))
+                    story.append(KeepTogether(group))
                 else:
-                    section_content.append(Spacer(1, 4))
-                i += 1
-                continue
-            
-            # Texto normal
-            if line and not line.startswith('**') and not line.startswith('-'):
-                # Processa markdown primeiro, depois escapa XML
-                text_processed = process_markdown(line)
-                text_escaped = escape_xml(text_processed)
-                if text_escaped.strip():
-                    text_para = Paragraph(text_escaped, normal_style)
-                    # Adiciona ao grupo de nível 3 se existir, senão à seção
-                    if current_subtitle_group:
-                        current_subtitle_group.append(text_para)
-                        current_subtitle_group.append(Spacer(1, 2))
-                    else:
-                        section_content.append(text_para)
-                        section_content.append(Spacer(1, 2))
-            
-            i += 1
-        
-        # Adiciona último grupo de nível 3 se houver
-        if current_subtitle_group:
-            story.append(KeepTogether(current_subtitle_group))
-        
-        # Adiciona última seção (sem KeepTogether - pode ser órfã)
-        if current_section and section_content:
-            story.extend(section_content)
+                    # Conteúdo solto da seção (sem KeepTogether - pode ser órfão)
+                    story.extend(block_flowables(item))
         
         # Gera PDF
         doc.build(story)
@@ -1131,6 +2100,7 @@ def generate_pdf_from_cv(cv_content, filename=None, primary_color="#2563eb"):
         return None
 
 
+@timed("generate_docx_from_cv")
 def generate_docx_from_cv(cv_content, filename=None, primary_color="#2563eb"):
     """
     Gera um arquivo DOCX (Word) profissional a partir do conteúdo do currículo em markdown.
@@ -1158,49 +2128,30 @@ def generate_docx_from_cv(cv_content, filename=None, primary_color="#2563eb"):
         from docx.enum.text import WD_ALIGN_PARAGRAPH
         from docx.oxml.ns import qn
         from docx.oxml import OxmlElement
-        import re
-        
-        # Mapeamento de seções para ícones (mesmo do PDF)
-        SECTION_ICONS = {
-            "Resumo Profissional": "👤",
-            "Resumo": "👤",
-            "Experiências": "💼",
-            "Experiência": "💼",
-            "Formação Acadêmica": "🎓",
-            "Formação": "🎓",
-            "Certificações": "🏆",
-            "Certificação": "🏆",
-            "Cursos": "📚",
-            "Cursos e Treinamentos": "📚",
-            "Projetos e Consultorias Relevantes": "🚀",
-            "Projetos": "🚀",
-            "Hard Skills": "⚙️",
-            "Habilidades Técnicas": "⚙️",
-            "Soft Skills": "🤝",
-            "Habilidades Comportamentais": "🤝"
-        }
-        
-        def get_section_icon(section_name):
-            """Retorna o ícone para uma seção"""
-            for key, icon in SECTION_ICONS.items():
-                if key.lower() in section_name.lower():
-                    return icon
-            return "📋"  # Ícone padrão
         
         def hex_to_rgb(hex_color):
             """Converte cor hex para RGB"""
             hex_color = hex_color.lstrip('#')
             return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
         
-        def process_markdown(text):
-            """Processa markdown básico"""
-            # Processa negrito **texto**
-            text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
-            # Processa itálico *texto*
-            text = re.sub(r'(?<!<b>)\*([^*<]+?)\*(?!</b>)', r'\1', text)
-            # Processa links [text](url) -> text
-            text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-            return text
+        def add_text(text, size, color, bold=None, italic=None, style=None, space_before=None, space_after=Pt(2)):
+            """Adiciona um parágrafo com um único trecho formatado"""
+            p = doc.add_paragraph(style=style) if style else doc.add_paragraph()
+            p.alignment = WD_ALIGN_PARAGRAPH.LEFT
+            run = p.add_run(text)
+            run.font.name = 'Calibri'
+            run.font.size = Pt(size)
+            if bold:
+                run.font.bold = True
+            if italic:
+                run.font.italic = True
+            run.font.color.rgb = RGBColor(*color)
+            if space_before is not None:
+                p.space_before = space_before
+            p.space_after = space_after
+            return p
+        
+        cv_document = get_cv_document(cv_content)
         
         # Cria documento Word
         doc = Document()
@@ -1211,239 +2162,42 @@ def generate_docx_from_cv(cv_content, filename=None, primary_color="#2563eb"):
         font.name = 'Calibri'
         font.size = Pt(11)
         
-        # Processa o conteúdo
-        lines = cv_content.split('\n')
-        
-        professional_name = None
-        professional_position = None
-        contact_info = []
-        header_end_index = len(lines)
-        found_first_section = False
-        
-        # Primeira passagem: extrai nome, posição e contato
-        for i, line in enumerate(lines):
-            line_stripped = line.strip()
-            
-            if not line_stripped:
-                continue
-            
-            # Detecta nome
-            if not professional_name and line_stripped.startswith('**'):
-                name_candidate = line_stripped
-                name_candidate = re.sub(r'^\*\*', '', name_candidate)
-                name_candidate = re.sub(r'\*\*$', '', name_candidate)
-                name_candidate = re.sub(r'^_+', '', name_candidate)
-                name_candidate = re.sub(r'_+$', '', name_candidate)
-                name_candidate = name_candidate.strip()
-                
-                is_section = name_candidate in SECTION_ICONS.keys() or any(key.lower() in name_candidate.lower() for key in SECTION_ICONS.keys())
-                
-                if not is_section and name_candidate and not any(icon in name_candidate for icon in ['✉', '✆', '[in]', 'http']):
-                    professional_name = name_candidate
-                    continue
-            
-            # Detecta posição
-            if professional_name and not professional_position and line_stripped.startswith('**'):
-                position_candidate = line_stripped
-                position_candidate = re.sub(r'^\*\*', '', position_candidate)
-                position_candidate = re.sub(r'\*\*$', '', position_candidate)
-                position_candidate = re.sub(r'^_+', '', position_candidate)
-                position_candidate = re.sub(r'_+$', '', position_candidate)
-                position_candidate = position_candidate.strip()
-                
-                is_section = position_candidate in SECTION_ICONS.keys() or any(key.lower() in position_candidate.lower() for key in SECTION_ICONS.keys())
-                
-                if not is_section and position_candidate and not any(icon in position_candidate for icon in ['✉', '✆', '[in]', 'http']):
-                    professional_position = position_candidate
-                    continue
-            
-            # Detecta primeira seção
-            if not found_first_section and line_stripped.startswith('**') and line_stripped.endswith('**') and not line_stripped.startswith('- **'):
-                section_title = line_stripped.replace('**', '').strip()
-                section_title = re.sub(r'^_+', '', section_title)
-                section_title = re.sub(r'_+$', '', section_title)
-                section_title = section_title.strip()
-                is_section = section_title in SECTION_ICONS.keys() or any(key.lower() in section_title.lower() for key in SECTION_ICONS.keys())
-                
-                if is_section:
-                    header_end_index = i
-                    found_first_section = True
-                    continue
-            
-            # Detecta contato
-            if i < header_end_index and not found_first_section:
-                if line_stripped.replace('*', '').strip() == '':
-                    continue
-                    
-                if '✉' in line_stripped or '@' in line_stripped:
-                    contact_line = line_stripped.replace('✉', '').strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
-                elif '✆' in line_stripped or re.search(r'\(\d{2}\)', line_stripped):
-                    contact_line = line_stripped.replace('✆', '').strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
-                elif '[in]' in line_stripped.lower() or 'linkedin' in line_stripped.lower() or 'http' in line_stripped.lower():
-                    contact_line = re.sub(r'\[in\]\s*', '', line_stripped, flags=re.IGNORECASE).strip()
-                    if contact_line:
-                        contact_info.append(contact_line)
-        
-        # Adiciona cabeçalho colorido
-        if professional_name or professional_position or contact_info:
-            # Nome
-            if professional_name:
-                p = doc.add_paragraph()
-                p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                run = p.add_run(professional_name)
-                run.font.name = 'Calibri'
-                run.font.size = Pt(24)
-                run.font.bold = True
-                run.font.color.rgb = RGBColor(26, 26, 26)
-                p.space_after = Pt(6)
-            
-            # Posição
-            if professional_position:
-                p = doc.add_paragraph()
-                p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                run = p.add_run(professional_position)
-                run.font.name = 'Calibri'
-                run.font.size = Pt(16)
-                run.font.color.rgb = RGBColor(*hex_to_rgb('#4a5568'))
-                p.space_after = Pt(8)
-            
-            # Contato
-            if contact_info:
-                for ci in contact_info:
-                    p = doc.add_paragraph()
-                    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    run = p.add_run(process_markdown(ci))
-                    run.font.name = 'Calibri'
-                    run.font.size = Pt(10)
-                    run.font.color.rgb = RGBColor(255, 255, 255)
-                    p.space_after = Pt(4)
+        # Adiciona cabeçalho
+        header = cv_document.header
+        if header:
+            if header.name:
+                add_text(header.name, 24, (26, 26, 26), bold=True, space_after=Pt(6))
+            if header.position:
+                add_text(header.position, 16, hex_to_rgb('#4a5568'), space_after=Pt(8))
+            for contact in header.contacts:
+                add_text("".join(run.text for run in contact), 10, (255, 255, 255), space_after=Pt(4))
             
             # Adiciona espaçamento após cabeçalho
             doc.add_paragraph().space_after = Pt(20)
         
-        # Segunda passagem: processa conteúdo
-        i = header_end_index
-        current_section = None
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            if not line:
-                i += 1
-                continue
-            
-            # Detecta seção principal (nível 2)
-            if line.startswith('**') and line.endswith('**') and not line.startswith('- **'):
-                section_title = line.replace('**', '').strip()
-                section_title = re.sub(r'^_+', '', section_title)
-                section_title = re.sub(r'_+$', '', section_title)
-                section_title = section_title.strip()
-                icon = get_section_icon(section_title)
-                
-                p = doc.add_paragraph()
-                p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                run = p.add_run(f"{icon} {section_title}")
-                run.font.name = 'Calibri'
-                run.font.size = Pt(14)
-                run.font.bold = True
-                rgb = hex_to_rgb(primary_color)
-                run.font.color.rgb = RGBColor(*rgb)
-                p.space_before = Pt(16)
-                p.space_after = Pt(8)
-                
-                current_section = section_title
-                i += 1
-                continue
-            
-            # Detecta subtítulo de seção (nível 3)
-            if line.startswith('- **') and line.endswith('**'):
-                exp_title = line.replace('- **', '').replace('**', '').strip()
-                exp_title = process_markdown(exp_title)
-                
-                p = doc.add_paragraph()
-                p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                run = p.add_run(exp_title)
-                run.font.name = 'Calibri'
-                run.font.size = Pt(13)
-                run.font.bold = True
-                run.font.color.rgb = RGBColor(44, 62, 80)
-                p.space_before = Pt(12)
-                p.space_after = Pt(4)
-                i += 1
-                continue
-            
-            # Detecta empresa em itálico (nível 4)
-            if line.startswith('_') and line.endswith('_'):
-                company_text = line.replace('_', '').strip()
-                if company_text:
-                    company_text = process_markdown(company_text)
-                    p = doc.add_paragraph()
-                    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    run = p.add_run(company_text)
-                    run.font.name = 'Calibri'
-                    run.font.size = Pt(11)
-                    run.font.italic = True
-                    run.font.color.rgb = RGBColor(85, 85, 85)
-                    p.space_after = Pt(2)
-                i += 1
-                continue
-            
-            # Detecta itens de lista com itálico
-            if line.startswith('- *') and line.endswith('*'):
-                italic_text = line.replace('- *', '').replace('*', '').strip()
-                if italic_text:
-                    italic_text = process_markdown(italic_text)
-                    p = doc.add_paragraph(style='List Bullet')
-                    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    run = p.add_run(italic_text)
-                    run.font.name = 'Calibri'
-                    run.font.size = Pt(11)
-                    run.font.italic = True
-                    run.font.color.rgb = RGBColor(85, 85, 85)
-                    p.space_after = Pt(2)
-                i += 1
-                continue
-            
-            # Detecta itens de lista simples
-            if line.startswith('- '):
-                list_item = line.replace('- ', '', 1).strip()
-                list_item = process_markdown(list_item)
-                list_item = re.sub(r'\*\*(.+?)\*\*', r'\1', list_item)
-                list_item = re.sub(r'\*(.+?)\*', r'\1', list_item)
-                
-                p = doc.add_paragraph(style='List Bullet')
-                p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                run = p.add_run(list_item)
-                run.font.name = 'Calibri'
-                run.font.size = Pt(11)
-                run.font.color.rgb = RGBColor(51, 51, 51)
-                p.space_after = Pt(2)
-                i += 1
-                continue
-            
-            # Detecta separadores
-            if line.startswith('---'):
+        def add_block(block):
+            if block.kind == SEPARATOR:
                 doc.add_paragraph().space_after = Pt(8)
-                i += 1
-                continue
-            
-            # Texto normal
-            if line and not line.startswith('**') and not line.startswith('-'):
-                text_processed = process_markdown(line)
-                if text_processed.strip():
-                    p = doc.add_paragraph()
-                    p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    run = p.add_run(text_processed)
-                    run.font.name = 'Calibri'
-                    run.font.size = Pt(11)
-                    run.font.color.rgb = RGBColor(51, 51, 51)
-                    p.space_after = Pt(2)
+            elif block.kind == NOTE:
+                add_text(block.text, 11, (85, 85, 85), italic=True)
+            elif block.kind == ITALIC_ITEM:
+                add_text(block.text, 11, (85, 85, 85), italic=True, style='List Bullet')
+            elif block.kind == BULLET:
+                add_text(block.text, 11, (51, 51, 51), style='List Bullet')
+            elif block.text.strip():
+                add_text(block.text, 11, (51, 51, 51))
+        
+        for section in cv_document.sections:
+            add_text(f"{section.icon} {section.title}", 14, hex_to_rgb(primary_color), bold=True,
+                     space_before=Pt(16), space_after=Pt(8))
             
-            i += 1
+            for item in section.items:
+                if isinstance(item, SubtitleGroup):
+                    add_text(item.title_text, 13, (44, 62, 80), bold=True, space_before=Pt(12), space_after=Pt(4))
+                    for block in item.blocks:
+                        add_block(block)
+                else:
+                    add_block(item)
         
         # Salva em buffer
         buffer = BytesIO()
@@ -1461,4 +2215,58 @@ def generate_docx_from_cv(cv_content, filename=None, primary_color="#2563eb"):
         st.error(f"Erro ao gerar DOCX: {e}")
         import traceback
         st.error(traceback.format_exc())
-        return None
\ No newline at end of file
+        return None
+
+
+# ============================================
+# EXPORTAÇÃO SOB DEMANDA (PDF / DOCX)
+# ============================================
+
+CV_EXPORT_MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+CV_EXPORT_CACHE_MAX_ENTRIES = int(os.getenv("CV_EXPORT_CACHE_MAX_ENTRIES", "32"))
+_cv_export_cache = OrderedDict()
+_cv_export_cache_lock = threading.Lock()
+
+
+def export_cv(cv_content, fmt, primary_color="#2563eb"):
+    """
+    Gera o currículo em PDF ou DOCX, com cache (LRU) por (SHA-256 do conteúdo, formato, cor).
+    
+    Args:
+        cv_content: Currículo reformulado em markdown
+        fmt: "pdf" ou "docx"
+        primary_color: Cor predominante em hex
+    
+    Returns:
+        bytes: Conteúdo do arquivo
+    """
+    key = (hashlib.sha256(cv_content.encode("utf-8")).hexdigest(), fmt, primary_color)
+    with _cv_export_cache_lock:
+        data = _cv_export_cache.get(key)
+        if data is not None:
+            _cv_export_cache.move_to_end(key)
+            return data
+    
+    generator = generate_pdf_from_cv if fmt == "pdf" else generate_docx_from_cv
+    data = generator(cv_content, primary_color=primary_color)
+    if data is None:
+        raise RuntimeError(f"Não foi possível gerar o arquivo {fmt.upper()}")
+    
+    with _cv_export_cache_lock:
+        _cv_export_cache[key] = data
+        _cv_export_cache.move_to_end(key)
+        while len(_cv_export_cache) > CV_EXPORT_CACHE_MAX_ENTRIES:
+            _cv_export_cache.popitem(last=False)
+    return data
+
+
+def lazy_export_cv(cv_content, fmt, primary_color="#2563eb"):
+    """
+    Callable para o parâmetro data de st.download_button: o arquivo só é gerado
+    quando o download é solicitado (e não a cada rerun do script).
+    """
+    # Os spans da geração contam para a sessão que pediu o arquivo
+    return partial(run_in_session, current_session(), export_cv, cv_content, fmt, primary_color)